@@ -1,5 +1,10 @@
 import re
 import os
+import struct
+from collections import defaultdict
+
+# À incrémenter quand la ROM produite change (clé du cache de build_cache.py)
+ASSEMBLER_VERSION = 3
 
 ALU_OPS = {
     '+': 'ADD',
@@ -29,246 +34,806 @@ ALU_CODES = {
     'ROM2' : '01111',
 }
 
-def to_bin(n, bits):
-    return format(n & ((1 << bits) - 1), f'0{bits}b')
+ALU_VALUES = {name: int(code, 2) for name, code in ALU_CODES.items()}
 
-def to_binary_16bit_signed(value):
+def to_16bit_unsigned(value):
     if not (0 <= value < 2**16):
         raise ValueError(f"Immediate {value} out of range for 16-bit unsigned")
-    return to_bin(value, 16)
+    return value
 
-def parse_line(line, directory_path):
-    line = line.strip()
-    if not line or line.startswith("//"):
-        return None
-    
-    if line=="stop":
-        return [('MOV', 'r0', '#0000000000000000'),('STORE', 'r0', 'r0', '#0000000000000000')]
-    
-    if line.startswith("call "):
-        name = line[5:]
-        return [('MOV','r15',"next_line2"),('JUMP','r0','r0',name)]
-    
-    if line=="return":
-        return [('JUMP','r0','r0','r15')]
-    
-    if line=="wait":
-        return[('MOV','r0',"#0000000000000001"),('STORE', 'r0', 'r0', '#0000000000000001')]
-    
-    if line.startswith("rsc "):
-        n = line[4:]
-        if len(n)==16:
-            return [('RSC','0'*16+n)]
-        if len(n)==32:
-            return [('RSC',n)]
+def reg_num(reg):
+    if not reg.startswith('r'):
+        raise ValueError(f"Invalid register {reg}")
+    return int(reg[1:])
+
+def pack_instruction(code, dest, src, const=None, src2=0):
+    # Avec constante : constante en 31..16 ; sinon second registre en 17..14
+    word = ALU_VALUES[code] << 1 | (dest & 0xF) << 10 | (src & 0xF) << 6
+    if const is None:
+        return word | (src2 & 0xF) << 14
+    return word | (const & 0xFFFF) << 16 | 1
+
+# === Décodage ===
+#
+# Mot de 32 bits (pack_instruction) : constante en 31..16, registre B en
+# 17..14, destination en 13..10, registre A en 9..6, code sur 5 bits en
+# 5..1, constante utilisée si le bit 0 vaut 1. Les bits du code pilotent
+# directement cpu.net :
+#   bit 4 : pas d'écriture de registre     bits 3..2 : 10 saut, 11 mémoire
+#   bits 2..0 : opération de l'ALU         bit 1 (mémoire) : ROM, bit 0 : moitié haute
+
+NO_WRITE = 0b10000
+JUMP_MASK, JUMP = 0b01100, 0b01000
+MEMORY = 0b01100
+FROM_ROM = 0b00010
+
+def decode(word):
+    """(code, destination, registre A, registre B ou -1 si constante, constante)"""
+    code = (word >> 1) & 0x1F
+    r2 = -1 if word & 1 else (word >> 14) & 0xF
+    return code, (word >> 10) & 0xF, (word >> 6) & 0xF, r2, (word >> 16) & 0xFFFF
+
+# === Assembleur en une passe ===
+#
+# Chaque ligne est découpée une seule fois (TOKEN_RE), puis traitée par la
+# méthode de STATEMENTS associée à son premier mot, ou comme affectation
+# "dest = ..." selon la forme de la partie droite. Les mots de 32 bits sont
+# écrits directement dans la ROM ; les références à un label ($nom) sont
+# complétées à la fin, quand tous les labels sont connus (si un label est
+# défini deux fois, le dernier l'emporte).
+
+TOKEN_RE = re.compile(r"\$?\w+|\S")
+
+# Mots fixes des pseudo-instructions
+STOP = [pack_instruction('MOV2', 0, 0, 0), pack_instruction('STORE', 0, 0, 0)]
+WAIT = [pack_instruction('MOV2', 0, 0, 1), pack_instruction('STORE', 0, 0, 1)]
+RETURN = pack_instruction('JUMP', 0, 0, src2=15)
+
+class Assembler:
+    def __init__(self, directory_path):
+        self.directory_path = directory_path
+        self.words = []
+        self.labels = {}
+        self.fixups = []  # (index du mot, label, ligne source)
+        self.anchors = []  # (index du mot, adresse) : adresses next_line, déjà écrites
+        self.data = []  # (début, fin) des mots de données (rsc, include)
+        self.imports = []  # fichiers liés au programme (import)
+        self.lines = []  # ligne source de chaque mot ((fichier, ligne) après l'édition de liens)
+        self.line_number = 0
+        self.optimization_report = {}
+
+    def assemble_line(self, line):
+        comment = line.find("//")
+        line = (line if comment < 0 else line[:comment]).strip()
+        if not line:
+            return
+        tokens = TOKEN_RE.findall(line)
+        statement = self.STATEMENTS.get(tokens[0].lower())
+        if statement is not None and (len(tokens) < 2 or tokens[1] != '='):
+            statement(self, tokens, line)
+        elif len(tokens) > 2 and tokens[1] == '=':
+            self._assignment(tokens, line)
         else:
-            return [('RSC','0'*16 + to_binary_16bit_signed(int(n)))]
-    
-    if line.startswith("include "):
-        file = directory_path+"/"+line[8:]
+            raise ValueError(f"Syntax error: {line}")
+
+    def finish(self, optimize=False):
+        if optimize:
+            # Mêmes erreurs que sans optimisation, avant de déplacer le code
+            self.patch_labels(list(self.words))
+            self.optimization_report = PeepholeOptimizer(self).run()
+        return self.patch_labels(self.words)
+
+    def patch_labels(self, words):
+        # Complète les références aux labels
+        for index, name, line_number in self.fixups:
+            try:
+                if not name in self.labels:
+                    raise ValueError(f"Label '{name}' doesn't exist")
+                words[index] |= to_16bit_unsigned(self.labels[name]) << 16
+            except ValueError as e:
+                raise ValueError(f"Binary Compilation : [Line {line_number}] {e}")
+        return words
+
+    # --- Opérandes ---
+
+    def _emit(self, code, dest, src, operand):
+        # operand : registre, $label ou constante décimale
+        if operand.startswith('r'):
+            self.words.append(pack_instruction(code, dest, src, src2=reg_num(operand)))
+        elif operand.startswith('$'):
+            self.fixups.append((len(self.words), operand[1:], self.line_number))
+            self.words.append(pack_instruction(code, dest, src, 0))
+        else:
+            self.words.append(pack_instruction(code, dest, src, to_16bit_unsigned(int(operand))))
+
+    @staticmethod
+    def _expect(tokens, count, line):
+        if len(tokens) != count:
+            raise ValueError(f"Syntax error: {line}")
+
+    # --- Instructions : premier mot ---
+
+    def _stop(self, tokens, line):
+        self._expect(tokens, 1, line)
+        self.words += STOP
+
+    def _wait(self, tokens, line):
+        self._expect(tokens, 1, line)
+        self.words += WAIT
+
+    def _return(self, tokens, line):
+        self._expect(tokens, 1, line)
+        self.words.append(RETURN)
+
+    def _call(self, tokens, line):
+        # r15 = adresse de retour (après le saut), puis saut
+        self._expect(tokens, 2, line)
+        self.anchors.append((len(self.words), len(self.words) + 2))
+        self.words.append(pack_instruction('MOV2', 15, 0, to_16bit_unsigned(len(self.words) + 2)))
+        self._emit('JUMP', 0, 0, tokens[1])
+
+    def _jump(self, tokens, line):
+        self._expect(tokens, 2, line)
+        self._emit(tokens[0].upper(), 0, 0, tokens[1])
+
+    def _comp(self, tokens, line):
+        self._expect(tokens, 3, line)
+        self._emit('COMP', 0, reg_num(tokens[1]), tokens[2])
+
+    def _store(self, tokens, line):
+        # ram[adresse] = registre
+        if len(tokens) != 6 or tokens[1] != '[' or tokens[3] != ']' or tokens[4] != '=':
+            raise ValueError(f"Syntax error: {line}")
+        self._emit('STORE', 0, reg_num(tokens[5]), tokens[2])
+
+    def _label(self, tokens, line):
+        self._expect(tokens, 2, line)
+        self.labels[tokens[1]] = len(self.words)
+
+    def _rsc(self, tokens, line):
+        self._expect(tokens, 2, line)
+        value = tokens[1]
+        self.data.append((len(self.words), len(self.words) + 1))
+        if len(value) in (16, 32):
+            self.words.append(int(value, 2))
+        else:
+            self.words.append(to_16bit_unsigned(int(value)))
+
+    def _include(self, tokens, line):
+        file = self.directory_path + "/" + line[8:]
         with open(file) as f:
             contenu = f.read()
         bits = ''.join(c for c in contenu if c in '01')
-
-        # Complète à droite pour que la longueur soit un multiple de 32
         if len(bits) % 32 != 0:
             raise ValueError(f"Les ressources doivent etre par paquets de 32, dans l'include {file}")
+        self.data.append((len(self.words), len(self.words) + len(bits) // 32))
+        self.words += [int(bits[i:i+32], 2) for i in range(0, len(bits), 32)]
 
-        # Découpe en tranches de 32 bits
-        resultats = [("RSC", bits[i:i+32]) for i in range(0, len(bits), 32)]
-        return resultats
-        
-    
-    m_label = re.match(r'label\s+(\w+)', line, re.IGNORECASE)
-    if m_label:
-        name = m_label.groups()
-        return [('LABEL',name)]
-    
-    m_load = re.match(r'(\w+)\s*=\s*ram\[(.+)\]', line, re.IGNORECASE)
-    if m_load:
-        dst, arg = m_load.groups()
-        arg = arg.strip()
-        if arg.upper().startswith("R"):
-            return [('LOAD', dst, 'r0', arg)]
-        else:
-            try:
-                const_val = int(arg)
-                const_bin = '#' + to_binary_16bit_signed(const_val)
-                return [('LOAD', dst, 'r0', const_bin)]
-            except ValueError:
-                raise ValueError(f"Invalid memory argument: {arg}")
-            
-    m_rom1 = re.match(r'(\w+)\s*=\s*rom1\[(.+)\]', line, re.IGNORECASE)
-    if m_rom1:
-        dst, arg = m_rom1.groups()
-        arg = arg.strip()
-        if arg.upper().startswith("R"):
-            return [('ROM1', dst, 'r0', arg)]
-        else:
-            try:
-                const_val = int(arg)
-                const_bin = '#' + to_binary_16bit_signed(const_val)
-                return [('ROM1', dst, 'r0', const_bin)]
-            except ValueError:
-                raise ValueError(f"Invalid memory argument: {arg}")
-            
-    m_rom2 = re.match(r'(\w+)\s*=\s*rom2\[(.+)\]', line, re.IGNORECASE)
-    if m_rom2:
-        dst, arg = m_rom2.groups()
-        arg = arg.strip()
-        if arg.upper().startswith("R"):
-            return [('ROM2', dst, 'r0', arg)]
-        else:
-            try:
-                const_val = int(arg)
-                const_bin = '#' + to_binary_16bit_signed(const_val)
-                return [('ROM2', dst, 'r0', const_bin)]
-            except ValueError:
-                raise ValueError(f"Invalid memory argument: {arg}")
-
-    m_binary = re.match(r'(\w+)\s*=\s*(\w+)\s*([\+\-\*&\|\^])\s*(\w+)', line)
-    if m_binary:
-        dest, lhs, op, rhs = m_binary.groups()
-        op = ALU_OPS.get(op)
-        if not op:
-            raise ValueError(f"Unknown operator {op}")
-        if rhs.startswith('r'):
-            return [(op, dest, lhs, rhs)]  # no constant
-        else:
-            const_val = int(rhs)
-            const_bin = to_binary_16bit_signed(const_val)
-            return [(op, dest, lhs, '#' + const_bin)]  # constant case
-
-    m_mov = re.match(r'(\w+)\s*=\s*(\$?\w+)', line)
-    if m_mov:
-        dest, src = m_mov.groups()
-        if src.startswith('r') or src.startswith('n') or src.startswith('$'):
-            return [('MOV', dest, src)]
-        else:
-            if len(src)==16:
-                const_bin = "#"+src
+    def _import(self, tokens, line):
+        # Objet lié au programme par link_program ; aucun mot ici
+        self.imports.append(line[7:].strip())
+
+    STATEMENTS = {"stop": _stop, "wait": _wait, "return": _return, "call": _call,
+                  "jump": _jump, "jumpe": _jump, "jumpz": _jump, "comp": _comp, "ram": _store,
+                  "label": _label, "rsc": _rsc, "include": _include, "import": _import}
+
+    # --- Affectations : dest = ... ---
+
+    LOADS = {"ram": 'LOAD', "rom1": 'ROM1', "rom2": 'ROM2'}
+
+    def _assignment(self, tokens, line):
+        dest = reg_num(tokens[0])
+        rhs = tokens[2:]
+        if len(rhs) == 4 and rhs[1] == '[' and rhs[3] == ']' and rhs[0].lower() in self.LOADS:
+            self._emit(self.LOADS[rhs[0].lower()], dest, 0, rhs[2])
+        elif len(rhs) == 3 and rhs[1] in ALU_OPS:
+            self._emit(ALU_OPS[rhs[1]], dest, reg_num(rhs[0]), rhs[2])
+        elif len(rhs) == 1:
+            src = rhs[0]
+            if src.startswith("next_line"):
+                self.anchors.append((len(self.words), len(self.words) + int(src[9:])))
+                self.words.append(pack_instruction('MOV2', dest, 0, to_16bit_unsigned(len(self.words) + int(src[9:]))))
+            elif len(src) == 16 and not src.startswith(('r', '$')):
+                self.words.append(pack_instruction('MOV2', dest, 0, int(src, 2)))  # constante en binaire
             else:
-                const_val = int(src)
-                const_bin = to_binary_16bit_signed(const_val)
-            return [('MOV', dest, '#' + const_bin)]
-        
-    m_comp = re.match(r'comp\s+(\w+)\s+(\w+)', line, re.IGNORECASE)
-    if m_comp:
-        dest, src = m_comp.groups()
-        if src.startswith('r'):
-            return [('COMP', 'r0', dest, src)]
-        else:
-            const_val = int(src)
-            const_bin = to_binary_16bit_signed(const_val)
-            return [('COMP', 'r0', dest, '#' + const_bin)]
-        
-    m_jump = re.match(r'(jump|jumpe|jumpz)\s+(\$?\w+)', line, re.IGNORECASE)
-    if m_jump:
-        opcode, label = m_jump.groups()
-        if label.startswith('r') or label.startswith('$'):
-            return [(opcode.upper(), 'r0', 'r0', label)]
-        else:
-            const_val = int(label)
-            const_bin = to_binary_16bit_signed(const_val)
-            return [(opcode.upper(), 'r0', 'r0', '#' + const_bin)]
-        
-
-    # Écriture mémoire : RAM[argument] = R1
-    m_store = re.match(r'ram\[(.+)\]\s*=\s*(\w+)', line, re.IGNORECASE)
-    if m_store:
-        arg, src = m_store.groups()
-        arg = arg.strip()
-        if arg.upper().startswith("R"):
-            return [('STORE', 'r0', src, arg)]
-        else:
-            try:
-                const_val = int(arg)
-                const_bin = '#' + to_binary_16bit_signed(const_val)
-                return [('STORE', 'r0', src, const_bin)]
-            except ValueError:
-                raise ValueError(f"Invalid memory argument: {arg}")
-
-
-    raise ValueError(f"Syntax error: {line}")
-
-def collect_labels(instructions):
-    labels = {}
-    address = 0
-    for instr in instructions:
-        if instr[0] == 'LABEL':
-            label_name = instr[1][0]
-            labels[label_name] = address
+                self._emit('MOV2', dest, 0, src)
         else:
-            address += 1
-    return labels
+            raise ValueError(f"Syntax error: {line}")
 
+# === Optimisation à la lucarne ===
+#
+# Passe optionnelle (assemble(..., optimize=True)) sur les mots assemblés,
+# avant que finish() ne complète les labels : repliage et propagation des
+# constantes dans les blocs de base, suppression des MOV redondants et des
+# écritures de registre jamais relues (vivacité sur tout le programme),
+# sauts vers des sauts raccourcis, code inaccessible retiré. Le code est
+# ensuite recompacté : labels, références $label et adresses next_line sont
+# recalculés.
+#
+# Les drapeaux EQ et OVERFLOW viennent du résultat de l'instruction exécutée
+# juste avant, quelle qu'elle soit : une instruction suivie d'un saut
+# conditionnel n'est jamais supprimée, et n'est réécrite que si son résultat
+# et ses drapeaux restent identiques. Un programme qui dépend de ses adresses
+# (saut ou lecture de ROM à une adresse constante, saut conditionnel placé
+# sur un label) est laissé tel quel, de même que si le recompactage change
+# les drapeaux d'une instruction qui calcule sur une adresse relogée
+# ("jumpz $L" suivi de "jumpe $L" : JUMPE lit le résultat de JUMPZ, la
+# constante L).
 
-def reg_num(reg):
-    if not reg.startswith('r'):
-        raise ValueError(f"Invalid register {reg}")
-    return int(reg[1:])
+ALL_REGISTERS = 0xFFFF
+COMMUTATIVE = {0, 2, 4, 5, 6}  # ADD, MUL, AND, OR, XOR
 
-def encode_instruction(instr,labels,i):
-    if instr[0] == 'LABEL':
-        return ""
-    elif instr[0]=='RSC':
-        return instr[1]
-    elif instr[0] == 'MOV':
-        if instr[2].startswith("next_line"):
-            const = to_binary_16bit_signed(i+int(instr[2][9:]))
-            return const + '00' + to_bin(reg_num(instr[1]), 4) + to_bin(0, 4) + ALU_CODES['MOV2'] + '1'
-        elif instr[2].startswith('#'):
-            const = instr[2][1:]
-            return const + '00' + to_bin(reg_num(instr[1]), 4) + to_bin(0, 4) + ALU_CODES['MOV2'] + '1'
-        elif instr[2].startswith('$'):
-            if not instr[2][1:] in labels:
-                raise ValueError("Label '" + instr[2][1:] + "' doesn't exist")
-            const = to_binary_16bit_signed(labels[instr[2][1:]])
-            return const + '00' + to_bin(reg_num(instr[1]), 4) + to_bin(0, 4) + ALU_CODES['MOV2'] + '1'
-        else:
-            return '0' * 14 + to_bin(reg_num(instr[2]), 4) + to_bin(reg_num(instr[1]), 4) + to_bin(0, 4) + ALU_CODES['MOV2'] + '0'
-
-    elif len(instr) == 4 and instr[3].startswith('#'):
-        # format with constant
-        const = instr[3][1:]
-        return const + '00' + to_bin(reg_num(instr[1]), 4) + to_bin(reg_num(instr[2]), 4) + ALU_CODES[instr[0]] + '1'
-    elif len(instr)==4 and instr[3].startswith('$'):
-        if not instr[3][1:] in labels:
-            raise ValueError("Label '" + instr[3][1:] + "' doesn't exist")
-        const = to_binary_16bit_signed(labels[instr[3][1:]])
-        return const + '00' + to_bin(reg_num(instr[1]), 4) + to_bin(reg_num(instr[2]), 4) + ALU_CODES[instr[0]] + '1'
-    elif len(instr) == 4:
-        # no constant
-        return '0' * 14 + to_bin(reg_num(instr[3]), 4) + to_bin(reg_num(instr[1]), 4) + to_bin(reg_num(instr[2]), 4) + ALU_CODES[instr[0]] + '0'
-    else:
-        raise ValueError(f"Invalid instruction format: {instr}")
+def is_jump(code):
+    return code & JUMP_MASK == JUMP
 
-def assemble(program,directory_path):
-    binary_output = []
-    instructions = []
+def is_conditional_jump(code):
+    return is_jump(code) and code & 1 == 1
+
+def is_rom_read(code):
+    return code & MEMORY == MEMORY and code & FROM_ROM and not code & NO_WRITE
+
+def alu(op, a, b):
+    return (a + b, a - b, a * b, b, a & b, a | b, a ^ b, a)[op] & 0xFFFF
+
+def pack_word(code, dest, src, src2, const):
+    # Comme pack_instruction, avec le code numérique ; src2 < 0 : constante
+    word = code << 1 | dest << 10 | src << 6
+    return word | (const & 0xFFFF) << 16 | 1 if src2 < 0 else word | src2 << 14
+
+class PeepholeOptimizer:
+    def __init__(self, assembler):
+        self.assembler = assembler
+        self.words = list(assembler.words)  # recopiés dans l'assembleur seulement à la fin
+        self.labels = assembler.labels
+        self.refs = {index: (name, line) for index, name, line in assembler.fixups}
+        self.anchors = dict(assembler.anchors)
+        self.data = assembler.data
+        self.lines = assembler.lines
+
+    def run(self):
+        counters = ("folded", "redundant", "dead", "jumps", "unreachable")
+        report = {"before": len(self.words), **{name: 0 for name in counters}}
+        reason = self.absolute_addresses()
+        if reason is not None:
+            report["after"] = len(self.words)
+            report["skipped"] = reason
+            return report
+        original_targets, original_labels = self.targets, dict(self.labels)
+        self.origins = list(range(len(self.words)))  # mot d'origine de chaque mot
+        while True:
+            changes = sum(report[name] for name in counters)
+            for phase in (self.thread_jumps, self.remove_unreachable, self.propagate_constants,
+                          self.remove_dead_writes):
+                deleted = phase(report)
+                if deleted:
+                    self.relocate(deleted)
+            if sum(report[name] for name in counters) == changes:
+                break
+        reason = self.changed_flags(original_targets)
+        if reason is not None:
+            # Rien n'a encore été recopié dans l'assembleur, sauf les labels modifiés sur place
+            self.labels.clear()
+            self.labels.update(original_labels)
+            report.update({name: 0 for name in counters}, after=report["before"], skipped=reason)
+            return report
+        assembler = self.assembler
+        assembler.words = self.words
+        assembler.fixups = sorted((index, name, line) for index, (name, line) in self.refs.items())
+        assembler.anchors = sorted(self.anchors.items())
+        assembler.data = self.data
+        assembler.lines = self.lines
+        report["after"] = len(self.words)
+        return report
+
+    # --- Analyse ---
+
+    def analyze(self):
+        n = self.n = len(self.words)
+        self.is_data = [False] * n
+        for start, end in self.data:
+            self.is_data[start:end] = [True] * (end - start)
+        self.decoded = [None if self.is_data[i] else decode(word) for i, word in enumerate(self.words)]
+        # Adresse portée par la constante d'un mot : label ou next_line, relogée
+        self.targets = [None] * n
+        for index, (name, _) in self.refs.items():
+            self.targets[index] = self.labels[name]
+        for index, address in self.anchors.items():
+            self.targets[index] = address
+
+    def instruction(self, i):
+        # None hors du programme ou sur une donnée
+        return self.decoded[i] if 0 <= i < self.n else None
+
+    def pinned(self, i):
+        # Le résultat de i donne les drapeaux lus par un saut conditionnel
+        following = self.instruction(i + 1)
+        return following is not None and is_conditional_jump(following[0])
+
+    def absolute_addresses(self):
+        self.analyze()
+        entries = set(self.labels.values()) | set(self.anchors.values())
+        for i in range(self.n):
+            instruction = self.instruction(i)
+            if instruction is None:
+                continue
+            code, _, _, src2, _ = instruction
+            fixed = src2 < 0 and self.targets[i] is None
+            if is_jump(code) and fixed:
+                return f"saut vers une adresse constante (mot {i})"
+            if is_rom_read(code) and fixed:
+                return f"lecture de ROM à une adresse constante (mot {i})"
+            if is_conditional_jump(code) and i in entries:
+                return f"saut conditionnel sur un label (mot {i})"
+        return None
+
+    def changed_flags(self, original_targets):
+        # Drapeaux lus après une instruction dont la constante est une adresse
+        # relogée : ils doivent rester ceux du programme d'origine
+        self.analyze()
+        for i in range(self.n):
+            instruction = self.instruction(i)
+            if instruction is None or self.targets[i] is None or not self.pinned(i):
+                continue
+            code = instruction[0]
+            old, new = original_targets[self.origins[i]], self.targets[i]
+            if old == new or is_jump(code) and not code & 1:
+                continue  # un saut inconditionnel n'est jamais suivi
+            op = code & 7
+            if code & MEMORY != MEMORY and (op == 7 or op == 3 and (old == 0) == (new == 0)):
+                continue  # résultat A, ou la constante seule (OVERFLOW à 0)
+            return f"drapeaux d'une adresse relogée lus par un saut conditionnel (mot {self.origins[i]})"
+        return None
+
+    def successors(self, i):
+        # Adresses suivantes possibles ; None si inconnues (saut sur registre)
+        code, _, _, src2, _ = self.decoded[i]
+        if not is_jump(code):
+            return [i + 1]
+        if src2 >= 0:
+            return None
+        return [i + 1, self.targets[i]] if code & 1 else [self.targets[i]]
+
+    def leaders(self):
+        leaders = {0} | set(self.labels.values()) | {t for t in self.targets if t is not None}
+        for i in range(self.n):
+            instruction = self.instruction(i)
+            if instruction is not None and is_jump(instruction[0]):
+                leaders.add(i + 1)
+        return leaders
+
+    def reads(self, i):
+        # Registres dont dépendent les effets de i (et ses drapeaux s'ils sont lus)
+        code, _, src, src2, _ = self.decoded[i]
+        b = 1 << src2 if src2 >= 0 else 0
+        op = code & 7
+        result = b if op == 3 else 1 << src if op == 7 else 1 << src | b
+        if code & MEMORY == MEMORY:
+            return b | (1 << src if code & NO_WRITE else 0)
+        if is_jump(code):
+            return b | (result if self.pinned(i) else 0)
+        if code & NO_WRITE and not self.pinned(i):
+            return 0
+        return result
+
+    def live_after(self):
+        # Registres vivants après chaque instruction ; tous après un saut sur
+        # registre, à la fin du programme et avant une donnée
+        n = self.n
+        reads = [0 if self.decoded[i] is None else self.reads(i) for i in range(n)]
+        live_in = [0 if self.decoded[i] is not None else ALL_REGISTERS for i in range(n)]
+        live_out = [ALL_REGISTERS] * n
+        changed = True
+        while changed:
+            changed = False
+            for i in range(n - 1, -1, -1):
+                instruction = self.decoded[i]
+                if instruction is None:
+                    continue
+                successors = self.successors(i)
+                if successors is None:
+                    out = ALL_REGISTERS
+                else:
+                    out = 0
+                    for s in successors:
+                        out |= live_in[s] if 0 <= s < n else ALL_REGISTERS
+                written = 0 if instruction[0] & NO_WRITE else 1 << instruction[1]
+                value = reads[i] | (out & ~written)
+                live_out[i] = out
+                if value != live_in[i]:
+                    live_in[i] = value
+                    changed = True
+        return live_out
+
+    # --- Transformations : chacune renvoie les indices des mots à supprimer ---
+
+    def thread_jumps(self, report):
+        self.analyze()
+        deleted = set()
+        for i in range(self.n):
+            instruction = self.instruction(i)
+            if instruction is None or not is_jump(instruction[0]) or self.targets[i] is None:
+                continue
+            code, dest, src, _, _ = instruction
+            last, target, seen = None, self.targets[i], {i}
+            while target not in seen:
+                hop = self.instruction(target)
+                if hop is None or not is_jump(hop[0]) or hop[0] & 1:
+                    break
+                seen.add(target)
+                last = target
+                if self.targets[target] is None:
+                    break  # saut sur registre (return)
+                target = self.targets[target]
+            if last is None:
+                # Saut vers l'instruction suivante
+                if self.targets[i] == i + 1 and not self.pinned(i):
+                    deleted.add(i)
+                    report["jumps"] += 1
+                continue
+            if target in seen and self.targets[last] is not None:
+                continue  # boucle de sauts
+            hop = self.decoded[last]
+            # À l'arrivée, les drapeaux viennent de i au lieu du dernier saut de la chaîne
+            if (hop[0], hop[2]) != (code, src):
+                arrival = self.instruction(target) if self.targets[last] is not None else None
+                if arrival is None or is_conditional_jump(arrival[0]):
+                    continue
+            # Le résultat d'un saut conditionnel non pris change avec sa cible
+            if code & 1 and self.pinned(i):
+                continue
+            if self.targets[last] is None:
+                self.words[i] = pack_word(code, dest, src, hop[3], 0)
+                del self.refs[i]
+            else:
+                self.refs[i] = (self.refs[last][0], self.refs[i][1])
+            report["jumps"] += 1
+        return deleted
+
+    def remove_unreachable(self, report):
+        self.analyze()
+        pending = [0] + list(self.labels.values()) + [t for t in self.targets if t is not None]
+        reached = set()
+        while pending:
+            i = pending.pop()
+            if i in reached or self.instruction(i) is None:
+                continue
+            reached.add(i)
+            pending += self.successors(i) or []
+        deleted = {i for i in range(self.n) if not self.is_data[i] and i not in reached}
+        report["unreachable"] += len(deleted)
+        return deleted
+
+    def propagate_constants(self, report):
+        # Valeurs connues des registres, remises à zéro à chaque début de bloc
+        self.analyze()
+        leaders = self.leaders()
+        deleted = set()
+        known = {}
+        for i in range(self.n):
+            instruction = self.instruction(i)
+            if instruction is None or i in leaders:
+                known = {}
+            if instruction is None:
+                continue
+            code, dest, src, src2, const = instruction
+            writes = not code & NO_WRITE
+            if self.targets[i] is not None or is_jump(code) or is_rom_read(code):
+                # Une adresse relogée n'est pas une constante
+                if writes:
+                    known.pop(dest, None)
+                continue
+            op = code & 7
+            a = known.get(src)
+            b = const if src2 < 0 else known.get(src2)
+            folded = False
+            if src2 >= 0 and b is None and a is not None and op in COMMUTATIVE and code & MEMORY != MEMORY:
+                # A connu : les opérandes sont échangés pour mettre la constante en B
+                src, src2, a, b = src2, -1, None, a
+                folded = True
+            elif src2 >= 0 and b is not None and (op != 7 or code & MEMORY == MEMORY):
+                src2 = -1
+                folded = True
+            if folded:
+                self.words[i] = pack_word(code, dest, src, src2, b)
+            if code & MEMORY == MEMORY or not writes:
+                if writes:
+                    known.pop(dest, None)
+                report["folded"] += folded
+                continue
+
+            pinned = self.pinned(i)
+            value = b if op == 3 else a if op == 7 else None if a is None or b is None else alu(op, a, b)
+            if value is None and op == 7 and src == dest and not pinned:
+                deleted.add(i)  # MOV r r
+                report["redundant"] += 1
+                continue
+            if value is None:
+                known.pop(dest, None)
+                report["folded"] += folded
+                continue
+            if known.get(dest) == value and not pinned:
+                deleted.add(i)
+                report["redundant"] += 1
+                continue
+            # MOV2 remet OVERFLOW à 0 : un ADD/SUB lu par JUMPZ garde son bit 15
+            if not (op == 3 and src2 < 0) and (not pinned or op >= 2 or value < 0x8000):
+                self.words[i] = pack_word(ALU_VALUES['MOV2'], dest, 0, -1, value)
+                folded = True
+            report["folded"] += folded
+            known[dest] = value
+        return deleted
+
+    def remove_dead_writes(self, report):
+        self.analyze()
+        live = self.live_after()
+        deleted = set()
+        for i in range(self.n):
+            instruction = self.instruction(i)
+            if instruction is None or self.pinned(i):
+                continue
+            code, dest = instruction[:2]
+            if is_jump(code) or code & MEMORY == MEMORY and code & NO_WRITE:
+                continue
+            # Sans écriture (COMP) : ne sert qu'aux drapeaux, que personne ne lit
+            if code & NO_WRITE or not live[i] >> dest & 1:
+                deleted.add(i)
+        report["dead"] += len(deleted)
+        return deleted
+
+    def relocate(self, deleted):
+        # Un mot supprimé prend l'adresse du mot conservé suivant
+        n = len(self.words)
+        addresses = []
+        kept = 0
+        for i in range(n):
+            addresses.append(kept)
+            if i not in deleted:
+                kept += 1
+
+        def moved(address):
+            return addresses[address] if address < n else address - n + kept
+
+        self.words = [word for i, word in enumerate(self.words) if i not in deleted]
+        self.lines = [line for i, line in enumerate(self.lines) if i not in deleted]
+        self.origins = [origin for i, origin in enumerate(self.origins) if i not in deleted]
+        for name, address in self.labels.items():
+            self.labels[name] = moved(address)
+        self.refs = {moved(i): ref for i, ref in self.refs.items() if i not in deleted}
+        self.anchors = {moved(i): moved(address) for i, address in self.anchors.items() if i not in deleted}
+        for i, address in self.anchors.items():
+            self.words[i] = self.words[i] & 0xFFFF | address << 16
+        self.data = [(moved(start), moved(end)) for start, end in self.data]
+
+# === Objets relogeables et édition de liens ===
+#
+# Un fichier .asb s'assemble seul en objet : ses mots à partir de l'adresse
+# 0, ses labels (symboles), les mots qui citent un $label (relocations, même
+# vers un label d'un autre fichier) et ses adresses next_line. La ligne
+# "import fichier.asb" (ou .obj, déjà assemblé) ajoute un autre objet au
+# programme ; link() met le programme principal en 0 et les objets importés
+# à la suite, puis complète les références comme finish(). Un label ne peut
+# être défini que dans un seul objet. Le stop final n'appartient à aucun
+# objet : link(terminate=True) l'ajoute après le programme principal, pour
+# qu'une bibliothèque ne se termine pas par un stop inaccessible.
+#
+# .obj : en-tête (magic, version, nombre de mots, de symboles, de
+# relocations, d'adresses next_line, de zones de données, d'imports), puis
+# les mots (uint32), puis les tables ; chaînes en UTF-8 précédées de leur
+# longueur (uint16). Tout est en little-endian. La version 2 ajoute après
+# les mots la ligne source de chacun (uint32), pour la carte des adresses.
+
+OBJECT_MAGIC = b"ODZO"
+OBJECT_VERSION = 2
+OBJECT_HEADER = struct.Struct("<4sHHIIIIII")
+
+class ObjectFile:
+    def __init__(self, name, words, symbols, relocations, anchors, data, imports, lines=None):
+        self.name = name  # fichier source ; chemin relatif au programme principal une fois lié
+        self.words = words
+        self.lines = lines if lines is not None else [0] * len(words)  # ligne source de chaque mot (0 : inconnue)
+        self.symbols = symbols  # label -> adresse dans l'objet
+        self.relocations = relocations  # (index du mot, label, ligne source)
+        self.anchors = anchors  # (index du mot, adresse dans l'objet) : next_line
+        self.data = data  # (début, fin) des mots de données
+        self.imports = imports  # chemins relatifs au dossier du fichier source
+
+def assemble_object(program, directory_path, name="programme"):
+    assembler = Assembler(directory_path)
     for i, line in enumerate(program.splitlines()):
+        assembler.line_number = i + 1
         try:
-            instr = parse_line(line,directory_path)
-            if instr:
-                instructions+=instr
+            assembler.assemble_line(line)
         except ValueError as e:
             raise ValueError(f"IR compilation : [Line {i+1}] {e}")
-    labels = collect_labels(instructions)
-    instructions = [i for i in instructions if i[0] != 'LABEL']
-    for i,instr in enumerate(instructions):
-        try:
-            encoded = encode_instruction(instr,labels,i)
-            if encoded != "":
-                binary_output.append(encoded)
-        except ValueError as e:
-            raise ValueError(f"Binary Compilation : [Line {i+1}] {e}")
-    return binary_output
+        assembler.lines += [i + 1] * (len(assembler.words) - len(assembler.lines))
+    return ObjectFile(name, assembler.words, assembler.labels, assembler.fixups,
+                      assembler.anchors, assembler.data, assembler.imports, assembler.lines)
 
-def compile_assembler_to_rom(filepath):
+def compile_object(filepath):
     with open(filepath, 'r') as f:
         source = f.read()
-    directory_path = os.path.dirname(filepath)
-    source += "\nstop\n"
-    binary_lines = assemble(source,directory_path)
-    return binary_lines
+    return assemble_object(source, os.path.dirname(filepath), os.path.basename(filepath))
+
+def load_object_file(filepath):
+    # .obj déjà assemblé, sinon source .asb
+    if filepath.endswith(".obj"):
+        with open(filepath, 'rb') as f:
+            return object_from_bytes(f.read(), os.path.basename(filepath))
+    return compile_object(filepath)
+
+def link(objects, optimize=False, report=None, source_map=None, terminate=False):
+    # source_map : liste complétée par (fichier, ligne, label englobant) de chaque mot
+    # terminate : stop après le programme principal (objects[0]), pas après les bibliothèques
+    linked = Assembler(None)
+    owners = {}
+    for obj in objects:
+        base = len(linked.words)
+        for name, address in obj.symbols.items():
+            if name in owners:
+                raise ValueError(f"Link : label '{name}' defined in {owners[name]} and {obj.name}")
+            owners[name] = obj.name
+            linked.labels[name] = base + address
+        linked.words += obj.words
+        linked.lines += [(obj.name, line) for line in obj.lines]
+        linked.fixups += [(base + index, name, line) for index, name, line in obj.relocations]
+        for index, address in obj.anchors:
+            linked.anchors.append((base + index, base + address))
+            word = linked.words[base + index]
+            linked.words[base + index] = word & 0xFFFF | to_16bit_unsigned(base + address) << 16
+        linked.data += [(base + start, base + end) for start, end in obj.data]
+        if terminate and obj is objects[0]:
+            linked.words += STOP
+            linked.lines += [(obj.name, 0)] * len(STOP)
+    if len(objects) > 1:
+        # Avec un seul objet, finish() donne le message habituel
+        for obj in objects:
+            for index, name, line in obj.relocations:
+                if name not in linked.labels:
+                    raise ValueError(f"Link : {obj.name} [Line {line}] Label '{name}' doesn't exist")
+    words = linked.finish(optimize)
+    if report is not None:
+        report.update(linked.optimization_report)
+    if source_map is not None:
+        source_map += enclosing_labels(linked.lines, linked.labels, owners)
+    return words
+
+def enclosing_labels(lines, labels, owners):
+    # Label englobant de chaque mot : le dernier défini avant lui dans son fichier
+    starts = defaultdict(list)
+    for name, address in labels.items():
+        starts[address].append(name)
+    current = {}
+    entries = []
+    for address, (file, line) in enumerate(lines):
+        for name in starts.get(address, ()):
+            current[owners.get(name)] = name
+        entries.append((file, line, current.get(file)))
+    return entries
+
+def link_program(main, directory_path, load_object=load_object_file, optimize=False, report=None,
+                 source_map=None, terminate=False):
+    # main et, récursivement, les objets qu'il importe (chacun une seule fois)
+    objects = [main]
+    pending = [(main, directory_path)]
+    seen = set()
+    while pending:
+        obj, directory = pending.pop(0)
+        for name in obj.imports:
+            path = os.path.join(directory, name)
+            if os.path.realpath(path) in seen:
+                continue
+            seen.add(os.path.realpath(path))
+            imported = load_object(path)
+            # Nommé par son chemin depuis le programme principal : deux fichiers de même
+            # nom dans des dossiers différents restent distincts (carte, erreurs de liens)
+            imported.name = os.path.relpath(path, directory_path or ".")
+            objects.append(imported)
+            pending.append((imported, os.path.dirname(path)))
+    return link(objects, optimize, report, source_map, terminate)
+
+def assemble(program,directory_path,optimize=False,report=None,source_map=None):
+    # report : dictionnaire complété par le bilan de l'optimisation
+    return link_program(assemble_object(program, directory_path), directory_path,
+                        optimize=optimize, report=report, source_map=source_map)
+
+def compile_assembler(filepath, optimize=False, report=None, source_map=None):
+    # Mots de 32 bits du programme, terminé par stop, et des objets qu'il importe
+    main = compile_object(filepath)
+    return link_program(main, os.path.dirname(filepath), optimize=optimize, report=report,
+                        source_map=source_map, terminate=True)
+
+def compile_assembler_to_rom(filepath):
+    # Export texte : une ligne de 32 caractères '0'/'1' par mot
+    return rom_to_text(compile_assembler(filepath))
+
+# === Formats de ROM ===
+#
+# .bin : mots de 32 bits little-endian à la suite, sans en-tête ; le
+# simulateur le projette en mémoire (mmap) et Python le lit avec
+# numpy.memmap. .rom : l'ancien format texte, gardé comme export.
+
+def rom_to_bytes(words):
+    return struct.pack(f"<{len(words)}I", *words)
+
+def rom_from_bytes(data):
+    return list(struct.unpack(f"<{len(data) // 4}I", data))
+
+def rom_to_text(words):
+    return [format(word, '032b') for word in words]
+
+def write_rom(path, words):
+    # Format choisi par l'extension : .bin binaire, sinon texte
+    if path.endswith(".bin"):
+        with open(path, 'wb') as f:
+            f.write(rom_to_bytes(words))
+    else:
+        with open(path, 'w') as f:
+            f.writelines(line + '\n' for line in rom_to_text(words))
+
+# .map : carte des adresses de la ROM, une ligne par mot :
+# "adresse ligne label fichier" (label "-" avant le premier label du fichier)
+
+def source_map_to_text(entries):
+    out = ["# adresse ligne label fichier"]
+    out += [f"{address} {line} {label or '-'} {file}" for address, (file, line, label) in enumerate(entries)]
+    return "\n".join(out) + "\n"
+
+def source_map_from_text(text):
+    entries = []
+    for row in text.splitlines():
+        if not row or row.startswith("#"):
+            continue
+        address, line, label, file = row.split(" ", 3)
+        if int(address) != len(entries):
+            raise ValueError(f"Carte des adresses invalide : adresse {address} inattendue")
+        entries.append((file, int(line), None if label == "-" else label))
+    return entries
+
+def _pack_string(text):
+    data = text.encode()
+    return struct.pack("<H", len(data)) + data
+
+def object_to_bytes(obj):
+    out = [OBJECT_HEADER.pack(OBJECT_MAGIC, OBJECT_VERSION, 0, len(obj.words), len(obj.symbols),
+                              len(obj.relocations), len(obj.anchors), len(obj.data), len(obj.imports)),
+           rom_to_bytes(obj.words), struct.pack(f"<{len(obj.lines)}I", *obj.lines)]
+    for name, address in obj.symbols.items():
+        out += [struct.pack("<I", address), _pack_string(name)]
+    for index, name, line in obj.relocations:
+        out += [struct.pack("<II", index, line), _pack_string(name)]
+    out += [struct.pack("<II", *pair) for pair in obj.anchors + obj.data]
+    out += [_pack_string(name) for name in obj.imports]
+    return b"".join(out)
+
+def object_from_bytes(data, name="objet"):
+    magic, version, _, words, symbols, relocations, anchors, zones, imports = OBJECT_HEADER.unpack_from(data, 0)
+    if magic != OBJECT_MAGIC:
+        raise ValueError(f"{name} : fichier objet invalide (mauvais magic)")
+    if version not in (1, OBJECT_VERSION):
+        raise ValueError(f"{name} : version de fichier objet non supportée : {version}")
+    offset = OBJECT_HEADER.size
+
+    def read(fmt):
+        nonlocal offset
+        values = struct.unpack_from(fmt, data, offset)
+        offset += struct.calcsize(fmt)
+        return values
+
+    def read_string():
+        (length,) = read("<H")
+        return read(f"{length}s")[0].decode()
+
+    obj = ObjectFile(name, list(read(f"<{words}I")), {}, [], [], [], [])
+    if version >= 2:
+        obj.lines = list(read(f"<{words}I"))
+    for _ in range(symbols):
+        (address,) = read("<I")
+        obj.symbols[read_string()] = address
+    for _ in range(relocations):
+        index, line = read("<II")
+        obj.relocations.append((index, read_string(), line))
+    obj.anchors = [read("<II") for _ in range(anchors)]
+    obj.data = [read("<II") for _ in range(zones)]
+    obj.imports = [read_string() for _ in range(imports)]
+    return obj
 
@@ -0,0 +1,68 @@
+"""Gain de l'optimisation à la lucarne (assemble(..., optimize=True)) sur
+roms/*.asb : mots de ROM et cycles exécutés (chaque cycle est une
+évaluation complète de cpu.net), mesurés avec l'émulateur du jeu
+d'instructions. Les touches sont rejouées de la même façon pour les deux
+versions, qui doivent faire exactement les mêmes écritures RAM.
+
+    python benchmarks/assembler_peephole.py [--frames 300] [--cycles 2000000] [roms/snake.asb ...]
+"""
+import argparse
+import glob
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from assembler_compiler import compile_assembler  # noqa: E402
+from isa_emulator import IsaEmulator  # noqa: E402
+
+# Touches de simulator.c : haut, bas, gauche, droite, espace
+KEYS = (10, 11, 12, 13, 14)
+
+
+def run(words: list, frames: int, cycles: int) -> tuple:
+    # Espace à partir de la 3e image, puis une flèche différente toutes les 20 images
+    emulator = IsaEmulator(words)
+    stores = []
+    frame = 0
+    while emulator.running() and emulator.cycles < cycles and frame < frames:
+        stores += emulator.step()
+        if emulator.ram[1]:
+            emulator.end_frame()
+            frame += 1
+            emulator.ram[14] = int(frame >= 3)
+            for i, key in enumerate(KEYS[:4]):
+                emulator.ram[key] = int(frame % 80 // 20 == i and frame % 20 < 2)
+    return emulator.cycles, frame, stores
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("programs", nargs="*", help="fichiers .asb (défaut : roms/*.asb)")
+    parser.add_argument("--frames", type=int, default=300, help="images simulées au plus")
+    parser.add_argument("--cycles", type=int, default=2000000, help="cycles simulés au plus")
+    args = parser.parse_args()
+
+    failures = 0
+    for path in args.programs or sorted(glob.glob(os.path.join(ROOT, "roms", "*.asb"))):
+        report = {}
+        plain = compile_assembler(path)
+        optimized = compile_assembler(path, optimize=True, report=report)
+        before, frames, expected = run(plain, args.frames, args.cycles)
+        after, _, actual = run(optimized, args.frames, args.cycles)
+        name = os.path.basename(path)
+        if "skipped" in report:
+            print(f"{name}: non optimisé ({report['skipped']})")
+            continue
+        details = ", ".join(f"{key} {report[key]}" for key in ("folded", "redundant", "dead", "jumps", "unreachable"))
+        status = "écritures identiques" if expected == actual else "ÉCRITURES DIFFÉRENTES"
+        failures += expected != actual
+        print(f"{name}: {len(plain)} -> {len(optimized)} mots ({details})")
+        print(f"  {before} -> {after} cycles en {frames} images "
+              f"({before - after} évaluations de la netlist en moins, {(before - after) / max(before, 1):.1%}), {status}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
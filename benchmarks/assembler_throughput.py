@@ -0,0 +1,82 @@
+"""Débit de l'assembleur : snake.asb, puis un programme généré d'environ
+100 000 lignes (instructions courantes, labels en avant et en arrière,
+commentaires, lignes vides). Mesure aussi l'édition de liens seule, depuis
+l'objet déjà assemblé (ce que fait build.py quand la source n'a pas changé).
+
+    python benchmarks/assembler_throughput.py [--lines 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from assembler_compiler import assemble, assemble_object, link, object_from_bytes, object_to_bytes  # noqa: E402
+
+
+def generated_program(lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    out = []
+    blocks = max(lines // 16, 1)
+    for block in range(blocks):
+        r = [f"r{rng.randrange(1, 15)}" for _ in range(4)]
+        value = rng.randrange(65536)
+        # 16 lignes pour 9 mots : 100 000 lignes tiennent dans les 65 536 mots de la ROM
+        out += [
+            f"label B{block}",
+            f"{r[0]} = {r[1]} + {r[2]}",
+            f"{r[1]} = {r[0]} - {value}",
+            f"{r[2]} = {r[3]} * 3   // commentaire",
+            f"{r[0]} = ram[{r[1]}]",
+            f"ram[{r[2]}] = {r[3]}",
+            f"comp {r[0]} {value}",
+            f"jumpe $B{rng.randrange(blocks)}",
+            f"call $B{(block + 1) % blocks}",
+            "",
+            "// bloc suivant",
+            f"// {r[1]} = rom1[{value}]",
+            f"//{r[0]} = $B{rng.randrange(blocks)}",
+            "",
+            "// ...",
+            "",
+        ]
+    return "\n".join(out[:lines]) + "\nstop\n"
+
+
+def best_of(repeat: int, function, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def link_from_bytes(data: bytes) -> list:
+    return link([object_from_bytes(data)])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, "roms", "snake.asb")) as f:
+        programs = {"snake.asb": f.read() + "\nstop\n", f"généré ({args.lines} lignes)": generated_program(args.lines)}
+    for name, source in programs.items():
+        lines = source.count("\n")
+        words = len(assemble(source, os.path.join(ROOT, "roms")))
+        seconds = best_of(args.repeat, assemble, source, os.path.join(ROOT, "roms"))
+        data = object_to_bytes(assemble_object(source, os.path.join(ROOT, "roms")))
+        linking = best_of(args.repeat, link_from_bytes, data)
+        print(f"{name}: {lines} lignes, {words} mots, {seconds * 1000:.2f} ms ({lines / seconds:,.0f} lignes/s), "
+              f"liaison depuis l'objet {linking * 1000:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
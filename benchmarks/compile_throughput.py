@@ -0,0 +1,132 @@
+"""Débit du compilateur de netlists : expansion des macros, front-end
+(découpage + compile_line) et compilation complète, sur cpu.net et sur un
+multiplieur en tableau généré (par défaut 64 bits, ~32 000 portes), puis
+coût d'une instance de module (alu.net importée N fois).
+
+    python benchmarks/compile_throughput.py [--bits 64] [--repeat 5] [--optimize] [--instances 32]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import netlist_compiler  # noqa: E402
+from netlist_compiler import NetlistCompiler, expand_macros, iter_macro_lines, tokenize  # noqa: E402
+
+
+def array_multiplier(bits: int) -> list:
+    # Même structure que netlists/16-multiplier.net, pour une largeur quelconque
+    last = bits - 1
+    concat = " ".join(f"S_{{i}}_{k}" for k in range(last, -1, -1))
+    source = f"""INPUT A:{bits} B:{bits}
+
+ZERO = CONST {'0' * bits}
+
+FOR i IN 0 TO {last}:
+    PART{{i}} = MUX B[{{i}}] ZERO A
+    IF i == 0:
+        SHIFTED{{i}} = BUF PART{{i}}
+    ELSE:
+        SHIFTED{{i}} = CONCAT PART{{i}} {{i * '0'}}
+    ENDIF
+    S{{i}} = SUB SHIFTED{{i}} 0 {last}
+END
+
+ACC0 = BUF S0
+C0_0 = CONST 0
+
+FOR i IN 0 TO {bits - 2}:
+    FOR j IN 0 TO {last}:
+        A_{{i}}_{{j}} = INDEX ACC{{i}} {{j}}
+        B_{{i}}_{{j}} = INDEX S{{i+1}} {{j}}
+        SX_{{i}}_{{j}} = XOR A_{{i}}_{{j}} B_{{i}}_{{j}}
+        S_{{i}}_{{j}}  = XOR SX_{{i}}_{{j}} C{{i}}_{{j}}
+        CA_{{i}}_{{j}} = AND A_{{i}}_{{j}} B_{{i}}_{{j}}
+        CB_{{i}}_{{j}} = AND SX_{{i}}_{{j}} C{{i}}_{{j}}
+        C{{i}}_{{j+1}} = OR CA_{{i}}_{{j}} CB_{{i}}_{{j}}
+    END
+    ACC{{i+1}} = CONCAT {concat}
+END
+
+RESULT = BUF ACC{last}
+OUTPUT RESULT
+"""
+    return source.splitlines(keepends=True)
+
+
+def best_of(repeat: int, fn) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure(name: str, lines: list, repeat: int, optimize: bool) -> None:
+    expanded = list(iter_macro_lines(lines))
+    compiler = NetlistCompiler()
+    compiler.compile_netlist(lines)
+    gates = len(compiler.ir)
+
+    def front_end():
+        c = NetlistCompiler()
+        for number, line in expanded:
+            c.compile_line(line, number)
+
+    timings = {
+        "macros": best_of(repeat, lambda: expand_macros(lines)),
+        "tokenize": best_of(repeat, lambda: [tokenize(line, number) for number, line in expanded]),
+        "front-end": best_of(repeat, front_end),
+        "compile": best_of(repeat, lambda: NetlistCompiler().compile_netlist(lines)),
+    }
+    if optimize:
+        timings["compile -O"] = best_of(repeat, lambda: NetlistCompiler().compile_netlist(lines, optimize=True))
+
+    print(f"{name}: {len(lines)} lignes source, {len(expanded)} lignes dépliées, {gates} portes")
+    for step, seconds in timings.items():
+        rate = len(expanded) / seconds / 1000
+        print(f"  {step:11} {seconds * 1000:9.1f} ms  {rate:8.1f} klignes/s")
+
+
+def measure_instances(count: int, repeat: int) -> None:
+    # Le module est compilé une fois (à froid), puis chaque instance n'est qu'une relocation
+    netlists = os.path.join(ROOT, "netlists")
+    lines = ["IMPORT alu.net AS ALU\n", "INPUT A:16 B:16 OP:3\n", f"FOR i IN 0 TO {count - 1}:\n",
+             "    INSTANCE U{i} ALU A=A B=B OP=OP RESULT=R{i}\n", "END\n"]
+    with open(os.path.join(netlists, "alu.net")) as f:
+        alu = f.readlines()
+
+    def instances():
+        c = NetlistCompiler()
+        body, c.modules, _ = netlist_compiler.split_modules(lines, netlists)
+        for number, line in iter_macro_lines(body):
+            c.compile_line(line, number)
+
+    netlist_compiler._FRAGMENTS.clear()
+    cold = best_of(1, instances)
+    warm = best_of(repeat, instances)
+    flat = best_of(repeat, lambda: NetlistCompiler().compile_netlist(alu))
+    print(f"{count} instances de alu.net : {cold * 1000:.1f} ms à froid, {warm * 1000:.1f} ms ensuite "
+          f"({warm / count * 1000:.2f} ms par instance, contre {flat * 1000:.1f} ms pour compiler alu.net)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bits", type=int, default=64, help="largeur du multiplieur généré")
+    parser.add_argument("--repeat", type=int, default=5, help="nombre de mesures (on garde la meilleure)")
+    parser.add_argument("--optimize", action="store_true", help="mesurer aussi la compilation optimisée")
+    parser.add_argument("--instances", type=int, default=32, help="nombre d'instances de alu.net")
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, "netlists", "cpu.net")) as f:
+        measure("cpu.net", f.readlines(), args.repeat, args.optimize)
+    measure(f"multiplieur {args.bits} bits", array_multiplier(args.bits), args.repeat, args.optimize)
+    measure_instances(args.instances, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+/* Coût de l'affichage dans la boucle du simulateur, en cycles/s : l'ancien
+   tracé des 16 pixels à chaque STORE en mémoire vidéo (store_ram_plot,
+   recopié ici comme référence) contre le marquage des mots modifiés et le
+   redessin une fois par image (store_ram puis refresh_framebuffer à chaque
+   ram[1]). Les deux tournent avec la fonction de cycle compilée, pour que
+   l'écriture en RAM pèse autant que dans le simulateur le plus rapide.
+   Meilleur temps sur REPEAT exécutions. Vérifie aussi que les deux
+   donnent la même image et la même RAM.
+
+   Utilisé par benchmarks/framebuffer_throughput.py, qui génère et compile tout :
+   framebuffer_throughput <cpu.irb> <cpu_step.so> <cycles> <programme.bin|.rom>...
+*/
+#define SIMULATOR_NO_MAIN
+#include "../simulator.c"
+
+#define REPEAT 3
+
+static Uint32 plotted[SCREEN_WIDTH * SCREEN_HEIGHT];
+static Uint32 refreshed[SCREEN_WIDTH * SCREEN_HEIGHT];
+
+// Comportement d'avant les mots modifiés : tracé immédiat, divisions comprises
+static void store_ram_plot(int a, int value) {
+    ram[a] = value;
+    if (a >= VIDEO_RAM_START && a < VIDEO_RAM_START + VIDEO_RAM_SIZE) {
+        for (int t = 0; t < 16; t++) {
+            int pos = (a - VIDEO_RAM_START + 1) * 16 - t - 1;
+            int x = pos / (SCREEN_HEIGHT * 8) * 8 + pos % 8, y = pos % (SCREEN_HEIGHT * 8) / 8;
+            framebuffer[y * (fb_pitch / 4) + x] = 0xFFFFFF * ((value >> t) & 1);
+        }
+    }
+}
+
+// Exécute au plus `cycles` cycles depuis l'état initial ; renvoie le nombre de cycles faits
+static int run_once(bool deferred, int* signals, int cycles, int* frames, double* seconds) {
+    memset(signals, 0, signal_count * sizeof(int));
+    memset(ram, 0, sizeof(ram));
+    framebuffer = deferred ? refreshed : plotted;
+    memset(framebuffer, 0, SCREEN_WIDTH * SCREEN_HEIGHT * sizeof(Uint32));
+    ram[0] = 1;
+    *frames = 0;
+    clock_t start = clock();
+    int j = 0;
+    while (ram[0] && j < cycles) {
+        compiled_step(signals, ram, rom, deferred ? store_ram : store_ram_plot);
+        if (ram[1]) {
+            if (deferred) {
+                refresh_framebuffer();
+            }
+            ram[1] = 0;
+            (*frames)++;
+        }
+        j++;
+    }
+    refresh_framebuffer();  // dernière image, même sans ram[1]
+    *seconds = (double)(clock() - start) / CLOCKS_PER_SEC;
+    return j;
+}
+
+static int run(bool deferred, int* signals, int cycles, int* frames, double* seconds) {
+    int done = 0;
+    for (int r = 0; r < REPEAT; r++) {
+        double t;
+        done = run_once(deferred, signals, cycles, frames, &t);
+        if (r == 0 || t < *seconds) {
+            *seconds = t;
+        }
+    }
+    return done;
+}
+
+int main(int argc, char** argv) {
+    if (argc < 5) {
+        printf("Usage: %s <fichier.irb> <fichier.so> <cycles> <programme.bin|.rom>...\n", argv[0]);
+        return 1;
+    }
+    int cycles = atoi(argv[3]);
+    if (load_ir_binary(argv[1]) != 0 || load_step(argv[2]) != 0) {
+        return 1;
+    }
+    fb_pitch = SCREEN_WIDTH * 4;
+    init_video();
+
+    int* signals = calloc(signal_count, sizeof(int));
+    int* expected_ram = malloc(sizeof(ram));
+    bool all_same = true;
+    for (int k = 4; k < argc; k++) {
+        if (load_rom(argv[k]) != 0) {
+            return 1;
+        }
+        double plot_time, refresh_time;
+        int frames;
+        int done = run(false, signals, cycles, &frames, &plot_time);
+        memcpy(expected_ram, ram, sizeof(ram));
+        run(true, signals, cycles, &frames, &refresh_time);
+        bool same = memcmp(expected_ram, ram, sizeof(ram)) == 0 && memcmp(plotted, refreshed, sizeof(plotted)) == 0;
+        all_same = all_same && same;
+        printf("%s : %d cycles, %d images\n", argv[k], done, frames);
+        printf("  trace a chaque STORE       : %10.0f cycles/s\n", done / plot_time);
+        printf("  mots modifies, par image   : %10.0f cycles/s (x%.2f), image finale %s\n",
+               done / refresh_time, plot_time / refresh_time, same ? "identique" : "DIFFERENTE");
+    }
+    return all_same ? 0 : 1;
+}
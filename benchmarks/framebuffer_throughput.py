@@ -0,0 +1,51 @@
+"""Débit du simulateur C selon la mise à jour de l'image : tracé à chaque
+STORE en mémoire vidéo contre mots modifiés redessinés une fois par image,
+sur snake.rom et test_screen.rom par défaut. Génère l'IR binaire et le code
+C de la netlist, compile la bibliothèque et benchmarks/framebuffer_throughput.c
+avec cc, puis lance la mesure (Linux, SDL2 installée).
+
+    python benchmarks/framebuffer_throughput.py [--rom roms/snake.rom ...] [--cycles 1000000] [--optimize]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from netlist_compiler import NetlistCompiler  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--netlist", default=os.path.join(ROOT, "netlists", "cpu.net"))
+    parser.add_argument("--rom", action="append",
+                        help="programme à simuler, répétable (défaut : snake.rom et test_screen.rom)")
+    parser.add_argument("--cycles", type=int, default=1000000)
+    parser.add_argument("--optimize", action="store_true", help="optimiser la netlist")
+    parser.add_argument("--cc", default=os.environ.get("CC", "cc"))
+    args = parser.parse_args()
+    roms = args.rom or [os.path.join(ROOT, "roms", name) for name in ("snake.rom", "test_screen.rom")]
+
+    with open(args.netlist) as f:
+        lines = f.readlines()
+    compiler = NetlistCompiler()
+    compiler.compile_netlist(lines, optimize=args.optimize, directory=os.path.dirname(args.netlist))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        irb, step_c, step_so, bench = (os.path.join(tmp, name) for name in
+                                       ("cpu.irb", "cpu_step.c", "cpu_step.so", "framebuffer_throughput"))
+        with open(irb, "wb") as f:
+            f.write(compiler.format_ir_binary())
+        with open(step_c, "w") as f:
+            f.write(compiler.format_c_step())
+        subprocess.run([args.cc, "-O2", "-shared", "-fPIC", step_c, "-o", step_so], check=True)
+        subprocess.run([args.cc, "-O2", "-D", "LINUX", os.path.join(ROOT, "benchmarks", "framebuffer_throughput.c"),
+                        "-o", bench, "-lSDL2"], check=True)
+        return subprocess.run([bench, irb, step_so, str(args.cycles)] + roms).returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
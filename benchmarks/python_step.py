@@ -0,0 +1,98 @@
+"""Débit de la simulation Python sur une ROM (par défaut snake.rom) : boucle
+de dispatch par porte (CycleSimulator) contre fonction de cycle générée
+(CompiledCycleSimulator), avec le coût de génération et de compile() de la
+fonction, à froid puis depuis le cache. Vérifie aussi que les deux font les
+mêmes écritures RAM et donnent les mêmes sorties (OUTPUT), y compris sur une
+netlist combinatoire (8-adder.net) avec des entrées tirées au hasard.
+
+    python benchmarks/python_step.py [--rom roms/snake.rom] [--cycles 20000] [--optimize] [--vectors 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from netlist_compiler import NetlistCompiler  # noqa: E402
+from netlist_simulator import (RAM_SIZE, CompiledCycleSimulator, CycleSimulator,  # noqa: E402
+                               compile_python_step, first_divergence, load_rom)
+
+
+def throughput(sim: CycleSimulator, cycles: int) -> float:
+    start = time.perf_counter()
+    done = 0
+    while sim.running() and done < cycles:
+        sim.step()
+        if sim.ram[1]:
+            sim.end_frame()
+        done += 1
+    return done / (time.perf_counter() - start)
+
+
+def output_divergence(compiler: NetlistCompiler, vectors: int, seed: int = 0) -> Optional[dict]:
+    # Nouvelles entrées à chaque cycle ; renvoie les premières dont les sorties diffèrent
+    rng = random.Random(seed)
+    rom = [0] * RAM_SIZE
+    simulators = (CycleSimulator.from_compiler(compiler, rom), CompiledCycleSimulator.from_compiler(compiler, rom))
+    inputs = [int(i) for i in compiler.inputs]
+    outputs = [int(o) for o in compiler.outputs]
+    for _ in range(vectors):
+        values = {i: rng.getrandbits(compiler.signal_table.sizes[i]) for i in inputs}
+        for sim in simulators:
+            sim.signals[:] = [values.get(i, v) for i, v in enumerate(sim.signals)]
+            sim.step()
+        if any(simulators[0].signals[o] != simulators[1].signals[o] for o in outputs):
+            return values
+    return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--netlist", default=os.path.join(ROOT, "netlists", "cpu.net"))
+    parser.add_argument("--rom", default=os.path.join(ROOT, "roms", "snake.rom"))
+    parser.add_argument("--cycles", type=int, default=20000)
+    parser.add_argument("--optimize", action="store_true", help="optimiser la netlist")
+    parser.add_argument("--outputs-netlist", default=os.path.join(ROOT, "netlists", "8-adder.net"),
+                        help="netlist dont les sorties sont comparées sur des entrées aléatoires")
+    parser.add_argument("--vectors", type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(args.netlist) as f:
+        lines = f.readlines()
+    compiler = NetlistCompiler()
+    compiler.compile_netlist(lines, optimize=args.optimize, directory=os.path.dirname(args.netlist))
+    rom = load_rom(args.rom)
+
+    start = time.perf_counter()
+    compile_python_step(compiler)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    compile_python_step(compiler)
+    warm = time.perf_counter() - start
+    print(f"{len(compiler.ir)} portes, fonction générée en {cold * 1000:.1f} ms (cache : {warm * 1000:.2f} ms)")
+
+    outputs = [(int(o), int(o)) for o in compiler.outputs]
+    divergence = first_divergence(CycleSimulator.from_compiler(compiler, rom),
+                                  CompiledCycleSimulator.from_compiler(compiler, rom), args.cycles, outputs)
+    interpreted = throughput(CycleSimulator.from_compiler(compiler, rom), args.cycles // 10)
+    compiled = throughput(CompiledCycleSimulator.from_compiler(compiler, rom), args.cycles)
+    print(f"  dispatch par porte : {interpreted:10.0f} cycles/s")
+    print(f"  fonction générée   : {compiled:10.0f} cycles/s (x{compiled / interpreted:.1f}), "
+          + ("écritures et sorties identiques" if divergence is None else f"DIVERGENCE au cycle {divergence}"))
+
+    with open(args.outputs_netlist) as f:
+        lines = f.readlines()
+    combinational = NetlistCompiler()
+    combinational.compile_netlist(lines, optimize=args.optimize, directory=os.path.dirname(args.outputs_netlist))
+    wrong = output_divergence(combinational, args.vectors)
+    print(f"{os.path.basename(args.outputs_netlist)} : " + (f"sorties identiques sur {args.vectors} vecteurs"
+          if wrong is None else f"SORTIES DIFFÉRENTES pour les entrées {wrong}"))
+    return 0 if divergence is None and wrong is None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+/* Débit du simulateur en cycles/s sur une ROM, sans fenêtre ni cadence
+   d'affichage : interpréteur (balayage puis événementiel) contre la
+   fonction de cycle compilée (netlist_compiler.py format_c_step). Vérifie
+   aussi que les deux produisent les mêmes signaux et la même RAM.
+
+   Utilisé par benchmarks/step_throughput.py, qui génère et compile tout :
+   step_throughput <cpu.irb> <programme.bin|.rom> <cpu_step.so> [cycles]
+*/
+#define SIMULATOR_NO_MAIN
+#include "../simulator.c"
+
+static Uint32 bench_pixels[SCREEN_WIDTH * SCREEN_HEIGHT];
+
+// Exécute au plus `cycles` cycles depuis l'état initial ; renvoie le nombre de cycles faits
+static int run(int mode, int* signals, int cycles, double* seconds) {
+    memset(signals, 0, signal_count * sizeof(int));
+    memset(ram, 0, sizeof(ram));
+    memset(bench_pixels, 0, sizeof(bench_pixels));
+    ram[0] = 1;
+    if (mode == 1) {
+        memset(dirty, 1, instruction_count);
+    }
+    clock_t start = clock();
+    int j = 0;
+    while (ram[0] && j < cycles) {
+        if (mode == 0) {
+            run_cycle_scan(signals);
+        } else if (mode == 1) {
+            run_cycle_event(signals);
+        } else {
+            compiled_step(signals, ram, rom, store_ram);
+        }
+        ram[1] = 0;  // image demandée : rien à afficher ici
+        j++;
+    }
+    *seconds = (double)(clock() - start) / CLOCKS_PER_SEC;
+    return j;
+}
+
+int main(int argc, char** argv) {
+    if (argc < 4) {
+        printf("Usage: %s <fichier.irb> <programme.bin|.rom> <fichier.so> [cycles]\n", argv[0]);
+        return 1;
+    }
+    int cycles = argc > 4 ? atoi(argv[4]) : 100000;
+    if (load_ir_binary(argv[1]) != 0) {
+        return 1;
+    }
+    if (load_rom(argv[2]) != 0) {
+        return 1;
+    }
+    if (load_step(argv[3]) != 0) {
+        return 1;
+    }
+    build_jump_table();
+    framebuffer = bench_pixels;
+    fb_pitch = SCREEN_WIDTH * 4;
+
+    int* signals = calloc(signal_count, sizeof(int));
+    int* expected = malloc(signal_count * sizeof(int));
+    int* expected_ram = malloc(sizeof(ram));
+    double scan_time, event_time = 0, step_time;
+
+    int done = run(0, signals, cycles, &scan_time);
+    memcpy(expected, signals, signal_count * sizeof(int));
+    memcpy(expected_ram, ram, sizeof(ram));
+    printf("%d cycles, %d portes\n", done, instruction_count);
+    printf("  interpreteur (balayage)     : %10.0f cycles/s\n", done / scan_time);
+
+    if (fanout_start) {
+        init_event_mode();
+        run(1, signals, cycles, &event_time);
+        printf("  interpreteur (evenementiel) : %10.0f cycles/s\n", done / event_time);
+    }
+
+    run(2, signals, cycles, &step_time);
+    bool same = memcmp(expected, signals, signal_count * sizeof(int)) == 0
+                && memcmp(expected_ram, ram, sizeof(ram)) == 0;
+    printf("  fonction compilee           : %10.0f cycles/s (x%.1f), etat final %s\n",
+           done / step_time, scan_time / step_time, same ? "identique" : "DIFFERENT");
+    return same ? 0 : 1;
+}
@@ -0,0 +1,65 @@
+"""Débit du simulateur C sur une ROM (par défaut snake.rom) : interpréteur
+contre fonction de cycle compilée. Génère l'IR binaire et le code C de la
+netlist, compile la bibliothèque et benchmarks/step_throughput.c avec cc,
+puis lance la mesure (Linux, SDL2 installée). Vérifie d'abord que la
+fonction compilée suit CycleSimulator (check_c_step) sur la ROM et sur
+widths_test.net, dont les portes sont plus étroites que leurs opérandes.
+
+    python benchmarks/step_throughput.py [--rom roms/snake.rom] [--cycles 100000] [--optimize] [--check-cycles 2000]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from netlist_compiler import NetlistCompiler  # noqa: E402
+from netlist_simulator import check_c_step  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--netlist", default=os.path.join(ROOT, "netlists", "cpu.net"))
+    parser.add_argument("--rom", default=os.path.join(ROOT, "roms", "snake.rom"))
+    parser.add_argument("--cycles", type=int, default=100000)
+    parser.add_argument("--optimize", action="store_true", help="optimiser la netlist")
+    parser.add_argument("--cc", default=os.environ.get("CC", "cc"))
+    parser.add_argument("--check-cycles", type=int, default=2000,
+                        help="cycles comparés à CycleSimulator avant la mesure")
+    parser.add_argument("--widths-netlist", default=os.path.join(ROOT, "netlists", "widths_test.net"))
+    args = parser.parse_args()
+
+    same = True
+    for path, roms in ((args.netlist, [args.rom]), (args.widths_netlist, [])):
+        with open(path) as f:
+            lines = f.readlines()
+        results = check_c_step(lines, roms, args.check_cycles, optimize=args.optimize, path=path, cc=args.cc)
+        for rom, cycle in results.items():
+            same = same and cycle is None
+            print(f"{os.path.basename(path)}{' sur ' + os.path.basename(rom) if rom else ''} : fonction C "
+                  + ("identique à CycleSimulator" if cycle is None else f"DIVERGENTE au cycle {cycle}"))
+
+    with open(args.netlist) as f:
+        lines = f.readlines()
+    compiler = NetlistCompiler()
+    compiler.compile_netlist(lines, optimize=args.optimize, directory=os.path.dirname(args.netlist))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        irb, step_c, step_so, bench = (os.path.join(tmp, name) for name in
+                                       ("cpu.irb", "cpu_step.c", "cpu_step.so", "step_throughput"))
+        with open(irb, "wb") as f:
+            f.write(compiler.format_ir_binary())
+        with open(step_c, "w") as f:
+            f.write(compiler.format_c_step())
+        subprocess.run([args.cc, "-O2", "-shared", "-fPIC", step_c, "-o", step_so], check=True)
+        subprocess.run([args.cc, "-O2", "-D", "LINUX", os.path.join(ROOT, "benchmarks", "step_throughput.c"),
+                        "-o", bench, "-lSDL2"], check=True)
+        code = subprocess.run([bench, irb, args.rom, step_so, str(args.cycles)]).returncode
+    return code if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Compile les netlists (.net -> .ir) et les programmes (.asb -> .bin) en
+passant par le cache de compilation : seules les sources modifiées (ou
+dont un fichier inclus a changé) sont réellement recompilées.
+
+    python build.py                      # netlists/*.net et roms/*.asb
+    python build.py netlists/cpu.net --optimize --binary
+    python build.py netlists/cpu.net --binary --c-step   # + cpu_step.c pour simulateur --step
+    python build.py roms/snake.asb --text-rom              # + snake.rom, l'ancien format texte
+    python build.py roms/snake.asb --optimize-asm          # optimisation à la lucarne du programme
+    python build.py roms/dessin.asb --objects              # + dessin.obj, à importer sans la source
+    python build.py roms/snake.asb --map                   # + snake.map, adresse -> ligne source
+    python build.py --clear-cache
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from assembler_compiler import object_to_bytes, rom_to_bytes, rom_to_text, source_map_to_text
+from build_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_AGE, DEFAULT_MAX_BYTES, BuildCache, assemble_cached, compile_netlist_cached
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_if_changed(path: str, data: bytes) -> bool:
+    # Un fichier inchangé garde sa date : les outils en aval ne refont rien
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def collect_sources(paths: list) -> list:
+    if not paths:
+        paths = [os.path.join(ROOT, "netlists"), os.path.join(ROOT, "roms")]
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources += sorted(glob.glob(os.path.join(path, "*.net")) + glob.glob(os.path.join(path, "*.asb")))
+        else:
+            sources.append(path)
+    return sources
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compilation des netlists et programmes avec cache")
+    parser.add_argument("paths", nargs="*", help="fichiers .net/.asb ou dossiers (défaut : netlists/ et roms/)")
+    parser.add_argument("--optimize", action="store_true", help="optimiser les netlists")
+    parser.add_argument("--arithmetic", action="store_true", help="reconnaître les additionneurs et multiplieurs")
+    parser.add_argument("--binary", action="store_true", help="écrire aussi l'IR binaire (.irb)")
+    parser.add_argument("--c-step", action="store_true", help="écrire aussi la fonction de cycle C (_step.c)")
+    parser.add_argument("--optimize-asm", action="store_true", help="optimiser les programmes (.asb)")
+    parser.add_argument("--objects", action="store_true", help="écrire aussi l'objet relogeable (.obj)")
+    parser.add_argument("--text-rom", action="store_true", help="écrire aussi la ROM au format texte (.rom)")
+    parser.add_argument("--map", action="store_true", help="écrire aussi la carte des adresses de la ROM (.map)")
+    parser.add_argument("--no-cache", action="store_true", help="tout recompiler sans lire ni écrire le cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="dossier du cache (défaut : $ORDI_BUILD_CACHE ou .build_cache)")
+    parser.add_argument("--max-size", type=float, default=DEFAULT_MAX_BYTES / (1 << 20), help="taille maximale du cache en Mo")
+    parser.add_argument("--max-age", type=float, default=DEFAULT_MAX_AGE / 86400, help="âge maximal d'une entrée en jours")
+    parser.add_argument("--clear-cache", action="store_true", help="vider le cache avant de compiler")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else BuildCache(args.cache_dir, int(args.max_size * (1 << 20)), args.max_age * 86400)
+    if args.clear_cache:
+        BuildCache(args.cache_dir).clear()
+        if not args.paths:
+            print(f"Cache vidé : {args.cache_dir}")
+            return 0
+
+    failures = 0
+    start = time.perf_counter()
+    for source in collect_sources(args.paths):
+        try:
+            if source.endswith(".net"):
+                build = compile_netlist_cached(source, args.optimize, args.arithmetic, cache, args.c_step)
+                outputs = {source[:-4] + ".ir": build.text.encode()}
+                if args.binary:
+                    outputs[source[:-4] + ".irb"] = build.binary
+                if args.c_step:
+                    outputs[source[:-4] + "_step.c"] = build.c_step.encode()
+            elif source.endswith(".asb"):
+                build = assemble_cached(source, cache, args.optimize_asm)
+                outputs = {source[:-4] + ".bin": rom_to_bytes(build.words)}
+                if args.objects:
+                    outputs[source[:-4] + ".obj"] = object_to_bytes(build.obj)
+                if args.text_rom:
+                    outputs[source[:-4] + ".rom"] = "".join(line + "\n" for line in rom_to_text(build.words)).encode()
+                if args.map:
+                    outputs[source[:-4] + ".map"] = source_map_to_text(build.source_map).encode()
+            else:
+                print(f"{source} : ignoré (ni .net ni .asb)")
+                continue
+        except Exception as e:
+            print(f"{source} : erreur : {e}")
+            failures += 1
+            continue
+        written = [os.path.basename(path) for path, data in outputs.items() if write_if_changed(path, data)]
+        status = "cache" if build.cached else "compilé"
+        if source.endswith(".asb") and build.report:
+            report = build.report
+            status += (f", non optimisé ({report['skipped']})" if "skipped" in report
+                       else f", {report['before']} -> {report['after']} mots")
+        print(f"{source} : {status}" + (f", écrit {' '.join(written)}" if written else ", inchangé"))
+
+    elapsed = time.perf_counter() - start
+    if cache is not None:
+        evicted = cache.evict()
+        print(f"{cache.hits} depuis le cache, {cache.misses} compilés, {evicted} entrées évincées, {elapsed:.2f} s")
+    else:
+        print(f"Tout recompilé sans cache en {elapsed:.2f} s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import assembler_compiler
+import netlist_compiler
+from assembler_compiler import (ASSEMBLER_VERSION, ObjectFile, compile_object, link_program, load_object_file,
+                                object_from_bytes, object_to_bytes)
+from netlist_compiler import COMPILER_VERSION, IMPORT_RE, NetlistCompiler
+
+# === Cache de compilation sur disque ===
+#
+# Une entrée par clé : le hash du contenu des sources (fichier principal et
+# fichiers inclus), des options et du compilateur (numéro de version et
+# hash de son code source, pour qu'une modification locale invalide aussi
+# le cache). Sur un succès, rien n'est recompilé. Chaque entrée est un
+# dossier d'artefacts écrit de façon atomique ; les entrées trop vieilles,
+# puis les moins récemment utilisées au-delà de la taille maximale, sont
+# supprimées par evict().
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ORDI_BUILD_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".build_cache"))
+DEFAULT_MAX_BYTES = 256 << 20
+DEFAULT_MAX_AGE = 30 * 24 * 3600  # secondes
+
+_module_digests: Dict[str, str] = {}
+
+
+def module_digest(module) -> str:
+    path = module.__file__
+    if path not in _module_digests:
+        with open(path, 'rb') as f:
+            _module_digests[path] = hashlib.sha256(f.read()).hexdigest()
+    return _module_digests[path]
+
+
+def cache_key(kind: str, compiler: dict, options: dict, sources: List[bytes]) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps({"kind": kind, "compiler": compiler, "options": options}, sort_keys=True).encode())
+    for data in sources:
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class BuildCache:
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str) -> Optional[Dict[str, bytes]]:
+        path = self._entry(key)
+        try:
+            artifacts = {}
+            for name in os.listdir(path):
+                with open(os.path.join(path, name), 'rb') as f:
+                    artifacts[name] = f.read()
+            os.utime(path)  # date de dernier usage, pour l'éviction
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return artifacts
+
+    def put(self, key: str, artifacts: Dict[str, bytes]) -> None:
+        # Best effort : un cache inaccessible ne doit jamais faire échouer la compilation
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+            for name, data in artifacts.items():
+                with open(os.path.join(tmp, name), 'wb') as f:
+                    f.write(data)
+            try:
+                os.rename(tmp, self._entry(key))
+            except OSError:
+                shutil.rmtree(tmp, ignore_errors=True)  # déjà écrite par un autre processus
+        except OSError:
+            pass
+
+    def entries(self) -> List[tuple]:
+        # (date de dernier usage, taille, chemin) de chaque entrée
+        result = []
+        if not os.path.isdir(self.root):
+            return result
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                result.append((os.stat(path).st_mtime, size, path))
+            except OSError:
+                continue
+        return result
+
+    def evict(self) -> int:
+        now = time.time()
+        entries = sorted(self.entries())
+        removed = 0
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if os.path.basename(path).startswith(".tmp-"):
+                # Écriture en cours, ou abandonnée par un processus interrompu
+                if now - mtime > 3600:
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            if now - mtime > self.max_age or total > self.max_bytes:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                removed += 1
+        return removed
+
+    def clear(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+# === Compilations avec cache ===
+
+@dataclass
+class NetlistBuild:
+    text: str
+    binary: bytes
+    report: Dict[str, int] = field(default_factory=dict)
+    c_step: str = ""  # fonction de cycle C (format_c_step), si demandée
+    cached: bool = False
+
+
+@dataclass
+class RomBuild:
+    words: List[int]  # mots de 32 bits (rom_to_bytes / rom_to_text pour les écrire)
+    obj: ObjectFile  # objet relogeable du fichier principal (object_to_bytes pour l'écrire)
+    report: dict = field(default_factory=dict)  # bilan de l'optimisation, si demandée
+    cached: bool = False
+    source_map: list = field(default_factory=list)  # (fichier, ligne, label) de chaque mot
+
+
+def netlist_imports(path: str, source: bytes, seen: Optional[set] = None) -> List[bytes]:
+    # Contenu des fichiers IMPORT, récursivement, comme dans split_modules
+    seen = set() if seen is None else seen
+    contents = []
+    for line in source.decode().splitlines():
+        match = IMPORT_RE.match(line.strip())
+        if match is None:
+            continue
+        imported = os.path.join(os.path.dirname(path), match.group(1))
+        if os.path.realpath(imported) in seen:
+            continue
+        seen.add(os.path.realpath(imported))
+        with open(imported, 'rb') as f:
+            data = f.read()
+        contents += [imported.encode(), data] + netlist_imports(imported, data, seen)
+    return contents
+
+
+def compile_netlist_cached(path: str, optimize: bool = False, arithmetic: bool = False,
+                           cache: Optional[BuildCache] = None, c_step: bool = False) -> NetlistBuild:
+    with open(path, 'rb') as f:
+        source = f.read()
+    key = None
+    if cache is not None:
+        try:
+            sources = [source] + netlist_imports(path, source)
+        except OSError:
+            # Fichier importé manquant : le compilateur produit le message d'erreur
+            cache = None
+    if cache is not None:
+        compiler = {"version": COMPILER_VERSION, "source": module_digest(netlist_compiler)}
+        # path fait partie de la clé : l'IR binaire le cite dans ses provenances
+        options = {"optimize": optimize, "arithmetic": arithmetic, "c_step": c_step, "path": path}
+        key = cache_key("netlist", compiler, options, sources)
+        hit = cache.get(key)
+        if hit is not None and {"ir", "irb", "report"} <= hit.keys() and (not c_step or "c" in hit):
+            return NetlistBuild(hit["ir"].decode(), hit["irb"], json.loads(hit["report"]),
+                                hit["c"].decode() if c_step else "", cached=True)
+
+    compiler = NetlistCompiler()
+    text = compiler.generate_ir_string(source.decode().splitlines(keepends=True), optimize, arithmetic,
+                                       os.path.dirname(path) or ".", path)
+    build = NetlistBuild(text, compiler.format_ir_binary(), dict(compiler.optimization_report),
+                         compiler.format_c_step() if c_step else "")
+    if cache is not None:
+        artifacts = {"ir": text.encode(), "irb": build.binary, "report": json.dumps(build.report).encode()}
+        if c_step:
+            artifacts["c"] = build.c_step.encode()
+        cache.put(key, artifacts)
+    return build
+
+
+def assembler_includes(path: str, source: str) -> List[str]:
+    # Fichiers de ressources lus par les lignes "include", comme Assembler._include
+    directory = os.path.dirname(path)
+    return [directory + "/" + line.strip()[8:] for line in source.splitlines()
+            if line.strip().startswith("include ")]
+
+
+def object_cached(path: str, cache: BuildCache) -> Tuple[ObjectFile, bool]:
+    # Un objet par fichier source : seuls les fichiers modifiés (ou dont une
+    # ressource incluse a changé) sont réassemblés
+    if path.endswith(".obj"):
+        return load_object_file(path), True
+    with open(path, 'rb') as f:
+        source = f.read()
+    sources = [source]
+    try:
+        for include in assembler_includes(path, source.decode()):
+            with open(include, 'rb') as f:
+                sources.append(f.read())
+    except OSError:
+        # Ressource manquante : l'assembleur produit le message d'erreur
+        return compile_object(path), False
+
+    assembler = {"version": ASSEMBLER_VERSION, "source": module_digest(assembler_compiler)}
+    key = cache_key("object", assembler, {}, sources)
+    hit = cache.get(key)
+    if hit is not None and "obj" in hit:
+        return object_from_bytes(hit["obj"], os.path.basename(path)), True
+    obj = compile_object(path)
+    cache.put(key, {"obj": object_to_bytes(obj)})
+    return obj, False
+
+
+def assemble_cached(path: str, cache: Optional[BuildCache] = None, optimize: bool = False) -> RomBuild:
+    # Objets depuis le cache, puis édition de liens (rapide) à chaque fois
+    hits = []
+
+    def load(object_path: str) -> ObjectFile:
+        if cache is None:
+            return load_object_file(object_path)
+        obj, cached = object_cached(object_path, cache)
+        hits.append(cached)
+        return obj
+
+    main = load(path)
+    report = {}
+    source_map = []
+    words = link_program(main, os.path.dirname(path), load, optimize, report, source_map, terminate=True)
+    return RomBuild(words, main, report, cached=bool(hits) and all(hits), source_map=source_map)
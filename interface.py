@@ -1,10 +1,11 @@
 import sys
 from PySide6.QtWidgets import (
     QApplication, QWidget, QPushButton, QTextEdit,
-    QVBoxLayout, QFileDialog, QLabel, QHBoxLayout
+    QVBoxLayout, QFileDialog, QLabel, QHBoxLayout, QCheckBox
 )
-from netlist_compiler import NetlistCompiler
-from assembler_compiler import compile_assembler_to_rom
+from assembler_compiler import write_rom
+from build_cache import BuildCache, assemble_cached, compile_netlist_cached
+from simulator_runner import run_simulator
 
 import subprocess
 
@@ -17,7 +18,9 @@ class NetlistGUI(QWidget):
         self.file_path = "netlists/cpu.ir"
         self.rom_path = None
         self.text = ""
+        self.binary = b""
         self.ir = []
+        self.cache = BuildCache()
 
         self.label = QLabel(self.file_path)
         self.romlabel = QLabel("Aucune rom selectionée")
@@ -25,6 +28,9 @@ class NetlistGUI(QWidget):
         self.btn_compile = QPushButton("Compiler")
         self.btn_export = QPushButton("Exporter l'IR")
         self.btn_execute = QPushButton("Exécuter")
+        self.chk_optimize = QCheckBox("Optimiser la netlist")
+        self.chk_arithmetic = QCheckBox("Reconnaître les additionneurs et multiplieurs (ADD/MUL)")
+        self.chk_turbo = QCheckBox("Mode turbo : sans limite d'images/s (Tab pendant l'exécution)")
         self.text_output = QTextEdit()
         self.text_output.setReadOnly(True)
 
@@ -38,6 +44,9 @@ class NetlistGUI(QWidget):
         layout.addWidget(self.label)
         layout.addWidget(self.romlabel)
         layout.addLayout(button_layout)
+        layout.addWidget(self.chk_optimize)
+        layout.addWidget(self.chk_arithmetic)
+        layout.addWidget(self.chk_turbo)
         layout.addWidget(self.text_output)
         self.setLayout(layout)
 
@@ -55,7 +64,7 @@ class NetlistGUI(QWidget):
         self.btn_assemble.clicked.connect(self.compile_assembler)
 
     def select_file(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Sélectionner un fichier Netlist", "", "Netlist files (*.net *.ir)")
+        path, _ = QFileDialog.getOpenFileName(self, "Sélectionner un fichier Netlist", "", "Netlist files (*.net *.ir *.irb)")
         if path:
             self.file_path = path
             self.label.setText(f"Fichier : {path}")
@@ -68,11 +77,16 @@ class NetlistGUI(QWidget):
             self.text_output.setText("Veuillez sélectionner un fichier .net")
             return
         try:
-            with open(self.file_path, 'r') as f:
-                lines = f.readlines()
-            compiler = NetlistCompiler()
-            self.text = compiler.generate_ir_string(lines)
-            self.text_output.setText(self.text)
+            build = compile_netlist_cached(self.file_path, optimize=self.chk_optimize.isChecked(),
+                                           arithmetic=self.chk_arithmetic.isChecked(), cache=self.cache)
+            self.cache.evict()
+            self.text = build.text
+            self.binary = build.binary
+            report = build.report
+            header = "(depuis le cache de compilation)\n\n" if build.cached else ""
+            if report:
+                header += f"Optimisation : {report['before']} -> {report['after']} portes\n\n"
+            self.text_output.setText(header + self.text)
         except Exception as e:
             self.text_output.setText(f"Erreur lors de la compilation : {e}")
 
@@ -85,7 +99,11 @@ class NetlistGUI(QWidget):
             try:
                 with open(path, 'w') as f:
                     f.write(self.text)
-                self.text_output.setText(f"IR exportée dans : {path}")
+                # L'IR binaire est celle que le simulateur charge le plus vite
+                with open(path + "b", 'wb') as f:
+                    f.write(self.binary)
+                path += "b"
+                self.text_output.setText(f"IR exportée dans : {path[:-1]} et {path}")
                 self.file_path = path
                 self.label.setText(f"Fichier : {path}")
             except Exception as e:
@@ -93,37 +111,34 @@ class NetlistGUI(QWidget):
                 return
 
     def run_simulator(self):
-        if self.file_path == None or self.file_path[-3:]!=".ir":
+        if self.file_path == None or not self.file_path.endswith((".ir", ".irb")):
             self.text_output.setText("Can only execute IR files")
             return
-        if self.rom_path == None or self.rom_path[-4:]!=".rom":
+        if self.rom_path == None or self.rom_path[-4:] not in (".rom", ".bin"):
             self.text_output.setText("Must have a ROM program to execute")
             return
-        executable = "./simulateur.exe"
-        print("coucou")
         try:
-            subprocess.run([executable, self.file_path, self.rom_path], check=True)
+            run_simulator(self.file_path, self.rom_path, turbo=self.chk_turbo.isChecked())
         except subprocess.CalledProcessError as e:
             print(f"Erreur lors de l'exécution du simulateur : {e}")
 
     def choose_rom(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Sélectionner un fichier assembleur", "", "Assembler files (*.asb *.rom)")
+        path, _ = QFileDialog.getOpenFileName(self, "Sélectionner un fichier assembleur", "", "Assembler files (*.asb *.rom *.bin)")
         if not path:
             return
-        if not path.endswith(".asb") and not path.endswith(".rom"):
-            self.text_output.setText("Veuillez sélectionner un fichier .asb ou .rom")
+        if not path.endswith((".asb", ".rom", ".bin")):
+            self.text_output.setText("Veuillez sélectionner un fichier .asb, .rom ou .bin")
             return
         self.rom_path = path
         self.romlabel.setText("ROM sélectionée : "+self.rom_path)
 
     def compile_assembler(self):
         try:
-            binary_lines = compile_assembler_to_rom(self.rom_path)
-            output_path = self.rom_path[:-4] + ".rom"
-            with open(output_path, 'w') as f:
-                for line in binary_lines:
-                    f.write(line + '\n')
-            self.text_output.setText(f"Compilation terminée : {output_path}")
+            build = assemble_cached(self.rom_path, self.cache)
+            # ROM binaire : le simulateur la projette en mémoire sans rien décoder
+            output_path = self.rom_path[:-4] + ".bin"
+            write_rom(output_path, build.words)
+            self.text_output.setText(f"Compilation terminée : {output_path}" + (" (cache)" if build.cached else ""))
             self.rom_path = output_path
             self.romlabel.setText("ROM sélectionée : "+self.rom_path)
         except Exception as e:
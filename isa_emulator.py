@@ -0,0 +1,204 @@
+"""Émulateur du jeu d'instructions (celui d'assembler_compiler.py) : décode
+directement les mots de la ROM au lieu de simuler les portes de cpu.net.
+Même interface que CycleSimulator (step, running, end_frame, ram, rom), et
+un mode de vérification pas à pas contre la netlist.
+
+    python isa_emulator.py roms/snake.rom [--cycles 1000000]
+    python isa_emulator.py roms/snake.rom --check netlists/cpu.net [--check-cycles 20000]
+"""
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from assembler_compiler import ALU_CODES, FROM_ROM, JUMP, JUMP_MASK, MEMORY, NO_WRITE, decode
+from netlist_compiler import NetlistCompiler
+from netlist_simulator import RAM_SIZE, CompiledCycleSimulator, load_rom
+
+MASK = 0xFFFF
+
+# === Décodage ===
+
+CODE_NAMES = {int(code, 2): name for name, code in ALU_CODES.items()}
+
+
+def disassemble(word: int) -> str:
+    code, dest, r1, r2, const = decode(word)
+    b = f"#{const}" if r2 < 0 else f"r{r2}"
+    return f"{CODE_NAMES.get(code, f'?{code:05b}')} r{dest} r{r1} {b}"
+
+
+# === Émulation ===
+
+class IsaEmulator:
+    def __init__(self, rom: List[int]):
+        self.rom = rom
+        self.decoded: List[Optional[tuple]] = [None] * len(rom)
+        self.regs = [0] * 16
+        self.pc = 0
+        self.eq = 0        # EQ_FLAG_REG : résultat du cycle précédent nul
+        self.overflow = 0  # OVERFLOW_REG : bit 15 de la dernière addition/soustraction
+        self.ram = [0] * RAM_SIZE
+        self.ram[0] = 1
+        self.cycles = 0
+
+    def step(self) -> List[Tuple[int, int]]:
+        """Exécute une instruction et renvoie les écritures RAM (adresse, valeur)."""
+        pc = self.pc
+        instruction = self.decoded[pc]
+        if instruction is None:
+            instruction = self.decoded[pc] = decode(self.rom[pc])
+        code, dest, r1, r2, const = instruction
+        regs = self.regs
+        a = regs[r1]
+        b = const if r2 < 0 else regs[r2]
+
+        # L'ALU calcule toujours, même pour un saut ou un accès mémoire
+        op = code & 7
+        if op == 0:
+            result = (a + b) & MASK
+        elif op == 1:
+            result = (a - b) & MASK
+        elif op == 2:
+            result = (a * b) & MASK
+        elif op == 3:
+            result = b
+        elif op == 4:
+            result = a & b
+        elif op == 5:
+            result = a | b
+        elif op == 6:
+            result = a ^ b
+        else:
+            result = a
+
+        stores = []
+        if code & MEMORY == MEMORY:
+            if code & NO_WRITE:
+                self.ram[b] = a
+                stores.append((b, a))
+            elif code & FROM_ROM:
+                word = self.rom[b]
+                result = (word >> 16) & MASK if code & 1 else word & MASK
+            else:
+                result = self.ram[b] & MASK
+
+        # Les conditions de saut lisent les drapeaux du cycle précédent
+        if code & JUMP_MASK == JUMP and (not code & 1 or (self.overflow if code & 2 else self.eq)):
+            self.pc = b
+        else:
+            self.pc = (pc + 1) & MASK
+        if not code & NO_WRITE:
+            regs[dest] = result
+        self.eq = int(result == 0)
+        self.overflow = result >> 15 if op < 2 else 0
+        self.cycles += 1
+        return stores
+
+    def running(self) -> bool:
+        return self.ram[0] != 0
+
+    def end_frame(self) -> None:
+        # Ce que fait simulator.c quand le programme demande une image (ram[1])
+        self.ram[1] = 0
+
+    def state(self) -> dict:
+        state = {"pc": self.pc, "eq": self.eq, "overflow": self.overflow}
+        state.update((f"r{i}", value) for i, value in enumerate(self.regs))
+        return state
+
+
+# === Vérification contre la netlist ===
+
+# Signaux de cpu.net qui portent l'état architectural en fin de cycle
+PROBES = {"pc": "PC_REG", "eq": "EQ_FLAG_REG", "overflow": "OVERFLOW_REG",
+          **{f"r{i}": f"R{i}_TMP" for i in range(16)}}
+
+
+@dataclass
+class Divergence:
+    cycle: int
+    pc: int           # adresse de l'instruction exécutée à ce cycle
+    instruction: str
+    field: str        # "stores", "ram[1]", "running" ou un nom de PROBES
+    netlist: object
+    emulator: object
+
+    def __str__(self) -> str:
+        return (f"cycle {self.cycle}, pc {self.pc} ({self.instruction}) : {self.field} vaut "
+                f"{self.netlist} dans la netlist et {self.emulator} dans l'émulateur")
+
+
+def cross_check(compiler: NetlistCompiler, rom: List[int], max_cycles: int) -> Optional[Divergence]:
+    """Exécute la netlist et l'émulateur côte à côte ; renvoie la première
+    divergence (écritures RAM ou état architectural), None s'il n'y en a pas."""
+    indexes = compiler.signal_table.indexes
+    missing = [name for name in PROBES.values() if name not in indexes]
+    if missing:
+        raise ValueError(f"La netlist ne contient pas les signaux du processeur : {', '.join(missing)}")
+    probes = [(field, indexes[name]) for field, name in PROBES.items()]
+    netlist = CompiledCycleSimulator(compiler, rom)
+    emulator = IsaEmulator(rom)
+
+    for cycle in range(max_cycles):
+        pc = emulator.pc
+        where = (cycle, pc, disassemble(rom[pc]))
+        if netlist.running() != emulator.running():
+            return Divergence(*where, "running", netlist.running(), emulator.running())
+        if not emulator.running():
+            return None
+        expected, actual = netlist.step(), emulator.step()
+        if expected != actual:
+            return Divergence(*where, "stores", expected, actual)
+        state = emulator.state()
+        for field, index in probes:
+            if netlist.signals[index] != state[field]:
+                return Divergence(*where, field, netlist.signals[index], state[field])
+        if netlist.ram[1] != emulator.ram[1]:
+            return Divergence(*where, "ram[1]", netlist.ram[1], emulator.ram[1])
+        if emulator.ram[1]:
+            netlist.end_frame()
+            emulator.end_frame()
+    return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Émulateur du jeu d'instructions")
+    parser.add_argument("rom", help="programme .rom")
+    parser.add_argument("--cycles", type=int, default=1000000, help="nombre maximal d'instructions")
+    parser.add_argument("--check", metavar="NETLIST", help="vérifier pas à pas contre cette netlist (cpu.net)")
+    parser.add_argument("--check-cycles", type=int, default=20000, help="cycles comparés avec --check")
+    parser.add_argument("--optimize", action="store_true", help="optimiser la netlist de --check")
+    args = parser.parse_args()
+    rom = load_rom(args.rom)
+
+    emulator = IsaEmulator(rom)
+    frames = 0
+    start = time.perf_counter()
+    while emulator.running() and emulator.cycles < args.cycles:
+        emulator.step()
+        if emulator.ram[1]:
+            emulator.end_frame()
+            frames += 1
+    elapsed = time.perf_counter() - start
+    status = "arrêté (ram[0] = 0)" if not emulator.running() else "limite atteinte"
+    print(f"{emulator.cycles} cycles, {frames} images, {status}, "
+          f"{elapsed:.2f} s ({emulator.cycles / max(elapsed, 1e-9):.0f} cycles/s)")
+
+    if args.check:
+        with open(args.check) as f:
+            lines = f.readlines()
+        compiler = NetlistCompiler()
+        compiler.compile_netlist(lines, optimize=args.optimize, directory=os.path.dirname(args.check) or ".")
+        divergence = cross_check(compiler, rom, args.check_cycles)
+        if divergence is not None:
+            print(f"Divergence : {divergence}")
+            return 1
+        print(f"Netlist et émulateur identiques sur {args.check_cycles} cycles au plus")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
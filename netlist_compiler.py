@@ -1,10 +1,21 @@
 from dataclasses import dataclass
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator, NamedTuple
+from collections import defaultdict, deque
+from bisect import bisect_left, bisect_right
+from array import array
+from heapq import heappush, heappop
+import hashlib
+import os
 import re
+import struct
 
 RAM_EL_SIZE = 16
 ROM_EL_SIZE = 32
 
+# À incrémenter quand l'IR produite change : fait partie de la clé du cache
+# de compilation (build_cache.py)
+COMPILER_VERSION = 2
+
 # === Structures de base ===
 
 class GateType:
@@ -24,6 +35,36 @@ class GateType:
     LOAD = "LOAD"
     STORE = "STORE"
     ROM = "ROM"
+    # Opérateurs sur mots entiers (SUB désigne déjà l'extraction de bits)
+    ADD = "ADD"
+    SUBTRACT = "SUBTRACT"
+    MUL = "MUL"
+    EQ = "EQ"
+
+# Codes numériques des portes, identiques à l'enum GATE_* de simulator.c
+GATE_CODES = {
+    GateType.AND: 0,
+    GateType.OR: 1,
+    GateType.XOR: 2,
+    GateType.NAND: 3,
+    GateType.NOR: 4,
+    GateType.NXOR: 5,
+    GateType.NOT: 6,
+    GateType.CONST: 7,
+    GateType.MUX: 8,
+    GateType.CONCAT: 9,
+    GateType.INDEX: 10,
+    GateType.SUB: 11,
+    GateType.BUF: 12,
+    GateType.LOAD: 14,
+    GateType.STORE: 15,
+    GateType.ROM: 16,
+    GateType.ADD: 17,
+    GateType.SUBTRACT: 18,
+    GateType.MUL: 19,
+    GateType.EQ: 20,
+}
+GATE_NAMES = {code: name for name, code in GATE_CODES.items()}
 
 @dataclass
 class GateIR:
@@ -36,6 +77,97 @@ class GateIR:
     size: int = 1
     enabled_if : int = -1
     const_value: Optional[int] = None
+    skip: int = -1  # porte où reprendre si la condition est fausse (-1 : porte suivante)
+
+BINARY_GATES = {GateType.AND, GateType.OR, GateType.XOR, GateType.NAND, GateType.NOR, GateType.NXOR}
+WORD_GATES = {GateType.ADD, GateType.SUBTRACT, GateType.MUL, GateType.EQ}
+
+def gate_arity(t: str) -> int:
+    # Nombre d'entrées réellement lues (les champs inutilisés valent 0)
+    if t == GateType.CONST:
+        return 0
+    if t == GateType.MUX:
+        return 3
+    if t in BINARY_GATES or t in WORD_GATES or t == GateType.CONCAT or t == GateType.STORE:
+        return 2
+    return 1
+
+GATE_ARITY = {code: gate_arity(name) for name, code in GATE_CODES.items()}
+
+def gate_inputs(gate: GateIR) -> List[int]:
+    return [gate.input1, gate.input2, gate.input3][:gate_arity(gate.type)]
+
+def rename_gate_inputs(gate: GateIR, mapping: Dict[int, int]) -> None:
+    n = len(gate_inputs(gate))
+    if n > 0:
+        gate.input1 = mapping.get(gate.input1, gate.input1)
+    if n > 1:
+        gate.input2 = mapping.get(gate.input2, gate.input2)
+    if n > 2:
+        gate.input3 = mapping.get(gate.input3, gate.input3)
+
+def eval_const_gate(gate: GateIR, known: Dict[int, int]) -> Optional[int]:
+    # Valeur de la porte si elle se déduit des signaux constants connus
+    t = gate.type
+    mask = (1 << gate.size) - 1
+    if t == GateType.CONST:
+        return gate.const_value & mask
+    if t in (GateType.LOAD, GateType.STORE, GateType.ROM):
+        return None
+    a = known.get(gate.input1)
+    b = known.get(gate.input2)
+    if t == GateType.MUX:
+        if a is None:
+            c = known.get(gate.input3)
+            return b & mask if b is not None and b == c else None
+        v = known.get(gate.input3 if a else gate.input2)
+        return None if v is None else v & mask
+    if t in (GateType.AND, GateType.NAND, GateType.MUL) and ((a is not None and a & mask == 0) or (b is not None and b & mask == 0)):
+        return mask if t == GateType.NAND else 0
+    if t in (GateType.OR, GateType.NOR) and ((a is not None and a & mask == mask) or (b is not None and b & mask == mask)):
+        return mask if t == GateType.OR else 0
+    if a is None:
+        return None
+    if t == GateType.NOT:
+        return ~a & mask
+    if t == GateType.BUF:
+        return a & mask
+    if t == GateType.INDEX:
+        return (a >> gate.const_value) & 1
+    if t == GateType.SUB:
+        return (a >> gate.const_value) & mask
+    if b is None:
+        return None
+    if t == GateType.AND:
+        return a & b & mask
+    if t == GateType.OR:
+        return (a | b) & mask
+    if t == GateType.XOR:
+        return (a ^ b) & mask
+    if t == GateType.NAND:
+        return ~(a & b) & mask
+    if t == GateType.NOR:
+        return ~(a | b) & mask
+    if t == GateType.NXOR:
+        return ~(a ^ b) & mask
+    if t == GateType.CONCAT:
+        return (a << gate.const_value) | b
+    if t == GateType.ADD:
+        return (a + b) & mask
+    if t == GateType.SUBTRACT:
+        return (a - b) & mask
+    if t == GateType.MUL:
+        return (a * b) & mask
+    if t == GateType.EQ:
+        return int(a == b)
+    return None
+
+COMMUTATIVE_GATES = BINARY_GATES | {GateType.ADD, GateType.MUL, GateType.EQ}
+
+# Porte équivalente quand une entrée vaut 0, ou vaut 1 sur tous les bits
+IDENTITY_ZERO = {GateType.OR: GateType.BUF, GateType.XOR: GateType.BUF, GateType.NOR: GateType.NOT, GateType.NXOR: GateType.NOT,
+                 GateType.ADD: GateType.BUF}
+IDENTITY_ONES = {GateType.AND: GateType.BUF, GateType.NAND: GateType.NOT, GateType.XOR: GateType.NOT, GateType.NXOR: GateType.BUF}
 
 @dataclass
 class Signal:
@@ -43,150 +175,795 @@ class Signal:
     index: int
     size: int = 1
 
-# === Compiler ===
+# === IR en colonnes ===
+#
+# L'IR est rangée par colonnes (un array par champ de GateIR) plutôt qu'en
+# liste d'objets : une porte coûte une quarantaine d'octets au lieu d'une
+# instance complète, et le writer binaire comme les simulateurs lisent les
+# colonnes directement. GateView expose une ligne avec les attributs de
+# GateIR pour les passes qui manipulent les portes une à une.
 
+GATE_COLUMNS = (
+    ("id", "i"), ("type", "B"), ("output", "i"), ("input1", "i"), ("input2", "i"), ("input3", "i"),
+    ("size", "i"), ("enabled_if", "i"), ("const_value", "Q"), ("has_const", "B"), ("skip", "i"),
+    ("origin", "i"),  # provenance : index dans NetlistCompiler.origins, -1 si inconnue
+)
+GATE_FIELDS = ("id", "type", "output", "input1", "input2", "input3", "size", "enabled_if", "const_value", "skip")
 
-import re
 
-import re
+class GateView:
+    # Ligne d'une GateTable, avec les attributs de GateIR (lecture et écriture)
+    __slots__ = ("table", "pos")
 
-def _interpolate(line: str, context: dict) -> str:
-    return re.sub(r"\{([^{}]+)\}", lambda m: str(eval(m.group(1), {}, context)), line)
-
-def expand_macros(lines: list[str]) -> list[str]:
-    def process_block(block: list[str], context: dict) -> list[str]:
-        expanded = []
-        i = 0
-
-        while i < len(block):
-            raw_line = block[i]
-            line = raw_line.strip()
-
-            if line.upper().startswith("FOR "):
-                match = re.match(r"FOR (\w+) IN (\d+) TO (\d+):", line)
-                if not match:
-                    raise ValueError(f"Syntaxe FOR invalide : {line}")
-                var, start, end = match.group(1), int(match.group(2)), int(match.group(3))
-                inner_block = []
-                i += 1
-
-                depth = 1
-                while i < len(block) and depth > 0:
-                    line_check = block[i].strip()
-                    if line_check.upper().startswith("FOR "):
-                        depth += 1
-                    elif line_check.upper() == "END":
-                        depth -= 1
-                        if depth == 0:
-                            break
-                    if depth > 0:
-                        inner_block.append(block[i])
-                    i += 1
-                if depth != 0:
-                    raise ValueError("Bloc FOR sans END")
-
-                for val in range(start, end + 1):
-                    new_context = context.copy()
-                    new_context[var] = val
-                    expanded.extend(process_block(inner_block, new_context))
-
-            elif line.upper().startswith("IF "):
-                cond_expr = line[3:].rstrip(":")
-                condition_true = eval(cond_expr, {}, context)
-                buffer = []
-                else_buffer = []
-                i += 1
-
-                while i < len(block):
-                    line_if = block[i].strip()
-                    if line_if.upper() == "ELSE:":
-                        i += 1
-                        break
-                    elif line_if.upper() == "ENDIF":
-                        break
-                    buffer.append(block[i])
-                    i += 1
+    def __init__(self, table: "GateTable", pos: int):
+        self.table = table
+        self.pos = pos
 
-                while i < len(block):
-                    line_else = block[i].strip()
-                    if line_else.upper() == "ENDIF":
-                        break
-                    else_buffer.append(block[i])
-                    i += 1
+    @property
+    def id(self) -> int:
+        return self.table.id[self.pos]
 
-                if condition_true:
-                    expanded.extend([_interpolate(l, context) for l in buffer])
-                else:
-                    expanded.extend([_interpolate(l, context) for l in else_buffer])
-                i += 1
+    @id.setter
+    def id(self, value: int):
+        self.table.id[self.pos] = value
+
+    @property
+    def output(self) -> int:
+        return self.table.output[self.pos]
+
+    @output.setter
+    def output(self, value: int):
+        self.table.output[self.pos] = value
+
+    @property
+    def input1(self) -> int:
+        return self.table.input1[self.pos]
+
+    @input1.setter
+    def input1(self, value: int):
+        self.table.input1[self.pos] = value
+
+    @property
+    def input2(self) -> int:
+        return self.table.input2[self.pos]
+
+    @input2.setter
+    def input2(self, value: int):
+        self.table.input2[self.pos] = value
+
+    @property
+    def input3(self) -> int:
+        return self.table.input3[self.pos]
+
+    @input3.setter
+    def input3(self, value: int):
+        self.table.input3[self.pos] = value
+
+    @property
+    def size(self) -> int:
+        return self.table.size[self.pos]
+
+    @size.setter
+    def size(self, value: int):
+        self.table.size[self.pos] = value
+
+    @property
+    def enabled_if(self) -> int:
+        return self.table.enabled_if[self.pos]
+
+    @enabled_if.setter
+    def enabled_if(self, value: int):
+        self.table.enabled_if[self.pos] = value
+
+    @property
+    def skip(self) -> int:
+        return self.table.skip[self.pos]
+
+    @skip.setter
+    def skip(self, value: int):
+        self.table.skip[self.pos] = value
+
+    @property
+    def origin(self) -> int:
+        return self.table.origin[self.pos]
+
+    @origin.setter
+    def origin(self, value: int):
+        self.table.origin[self.pos] = value
+
+    @property
+    def type(self) -> str:
+        return GATE_NAMES[self.table.type[self.pos]]
+
+    @type.setter
+    def type(self, value: str):
+        self.table.type[self.pos] = GATE_CODES[value]
+
+    @property
+    def const_value(self) -> Optional[int]:
+        return self.table.const_value[self.pos] if self.table.has_const[self.pos] else None
+
+    @const_value.setter
+    def const_value(self, value: Optional[int]):
+        self.table.has_const[self.pos] = value is not None
+        self.table.const_value[self.pos] = value or 0
+
+    def to_gate(self) -> GateIR:
+        return GateIR(**{name: getattr(self, name) for name in GATE_FIELDS})
+
+    def __eq__(self, other):
+        if not isinstance(other, (GateIR, GateView)):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in GATE_FIELDS)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_gate())
+
+
+class GateTable:
+    def __init__(self):
+        for name, code in GATE_COLUMNS:
+            setattr(self, name, array(code))
+
+    @classmethod
+    def from_gates(cls, gates) -> "GateTable":
+        table = cls()
+        for g in gates:
+            table.append(g)
+        return table
+
+    def add(self, id: int, type: str, output: int, input1: int = 0, input2: int = 0, input3: int = 0,
+            size: int = 1, enabled_if: int = -1, const_value: Optional[int] = None, skip: int = -1,
+            origin: int = -1) -> int:
+        # Mêmes paramètres que GateIR, plus la provenance ; renvoie la position de la porte
+        self.id.append(id)
+        self.type.append(GATE_CODES[type])
+        self.output.append(output)
+        self.input1.append(input1)
+        self.input2.append(input2)
+        self.input3.append(input3)
+        self.size.append(size)
+        self.enabled_if.append(enabled_if)
+        self.const_value.append(const_value or 0)
+        self.has_const.append(const_value is not None)
+        self.skip.append(skip)
+        self.origin.append(origin)
+        return len(self.id) - 1
+
+    def append(self, gate) -> int:
+        # Une GateView garde sa provenance, une GateIR n'en a pas
+        return self.add(**{name: getattr(gate, name) for name in GATE_FIELDS}, origin=getattr(gate, "origin", -1))
+
+    def select(self, positions) -> "GateTable":
+        # Nouvelle table avec les lignes demandées, dans l'ordre donné
+        positions = list(positions)
+        table = GateTable()
+        for name, code in GATE_COLUMNS:
+            column = getattr(self, name)
+            setattr(table, name, array(code, [column[p] for p in positions]))
+        return table
+
+    def clear(self) -> None:
+        for name, _ in GATE_COLUMNS:
+            del getattr(self, name)[:]
+
+    def inputs(self, pos: int) -> List[int]:
+        # gate_inputs sans passer par une vue
+        return [self.input1[pos], self.input2[pos], self.input3[pos]][:GATE_ARITY[self.type[pos]]]
+
+    def to_list(self) -> List[GateIR]:
+        return [view.to_gate() for view in self]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(getattr(self, name)) * getattr(self, name).itemsize for name, _ in GATE_COLUMNS)
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def __getitem__(self, pos: int) -> GateView:
+        if pos < 0:
+            pos += len(self.id)
+        if not 0 <= pos < len(self.id):
+            raise IndexError("porte hors de l'IR")
+        return GateView(self, pos)
+
+    def __iter__(self) -> Iterator[GateView]:
+        for pos in range(len(self.id)):
+            yield GateView(self, pos)
+
+    def __repr__(self):
+        return f"GateTable({len(self)} portes)"
+
+
+class SignalTable:
+    # Nom -> index, tailles rangées par index ; se lit comme un dict de Signal
+    def __init__(self):
+        self.names: List[str] = []
+        self.indexes: Dict[str, int] = {}
+        self.sizes = array("i")
+
+    def add(self, name: str, size: int = 1) -> int:
+        index = len(self.names)
+        self.names.append(name)
+        self.indexes[name] = index
+        self.sizes.append(size)
+        return index
+
+    def extend(self, names: List[str], sizes: array) -> int:
+        # Ajoute des signaux consécutifs ; renvoie l'index du premier
+        start = len(self.names)
+        self.names.extend(names)
+        self.indexes.update(zip(names, range(start, start + len(names))))
+        self.sizes.extend(sizes)
+        return start
+
+    def clear(self) -> None:
+        self.names.clear()
+        self.indexes.clear()
+        del self.sizes[:]
+
+    def __contains__(self, name) -> bool:
+        return name in self.indexes
+
+    def __getitem__(self, name: str) -> Signal:
+        index = self.indexes[name]
+        return Signal(name, index, self.sizes[index])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def items(self):
+        for name in self.names:
+            yield name, self[name]
+
+    def values(self):
+        for name in self.names:
+            yield self[name]
+
+
+def build_jump_table(ir: GateTable) -> List[int]:
+    # Même construction que jump_table dans simulator.c : blocs contigus de
+    # même condition, remplacés par la cible skip quand l'IR en fournit une
+    jump_table = [0] * len(ir)
+    last_block_start = 0
+    last_index = -1
+    for i, enabled_if in enumerate(ir.enabled_if):
+        if enabled_if != last_index:
+            if last_index != -1:
+                jump_table[last_block_start] = i
+            last_block_start = i
+            last_index = enabled_if
+        jump_table[i] = i + 1
+    for i, skip in enumerate(ir.skip):
+        if skip >= 0:
+            jump_table[i] = skip
+    return jump_table
+
+
+# === IR binaire ===
+#
+# En-tête : magic, version, flags, nb signaux, nb entrées, nb sorties, nb portes
+# puis les index des entrées et des sorties (int32), puis un enregistrement de
+# taille fixe par porte. Tout est en little-endian, aligné sur 4 octets.
+# La version 2 ajoute la cible de saut explicite (skip) à chaque porte.
+
+IR_MAGIC = b"ODZI"
+IR_VERSION = 2
+IR_HEADER = struct.Struct("<4sHHiiii")
+IR_GATE = struct.Struct("<iBBHiiiiiIi")  # id, type, has_const, size, out, in1, in2, in3, enabled_if, const, skip
+IR_GATE_V1 = struct.Struct("<iBBHiiiiiI")
+IR_GATE_FORMATS = {1: IR_GATE_V1, 2: IR_GATE}
+
+# Section optionnelle après les portes : table de fanout au format CSR,
+# offsets[nb_signaux + 1] puis les index des portes concernées (int32).
+IR_FLAG_FANOUT = 1
+# Section optionnelle suivante : provenance des portes. Nombre de sources et
+# taille du texte (int32), la source de chaque porte (int32, -1 si inconnue),
+# puis le texte UTF-8 "fichier\tligne\titérations" d'une source par ligne,
+# complété par des zéros jusqu'au multiple de 4.
+IR_FLAG_ORIGINS = 2
+
+
+def read_ir_header(data) -> dict:
+    magic, version, flags, signals, n_in, n_out, n_gates = IR_HEADER.unpack_from(data, 0)
+    if magic != IR_MAGIC:
+        raise ValueError("Fichier IR binaire invalide (mauvais magic)")
+    if version not in IR_GATE_FORMATS:
+        raise ValueError(f"Version d'IR binaire non supportée : {version}")
+    offset = IR_HEADER.size
+    view = memoryview(data)
+    inputs = view[offset:offset + 4 * n_in].cast("i").tolist()
+    offset += 4 * n_in
+    outputs = view[offset:offset + 4 * n_out].cast("i").tolist()
+    offset += 4 * n_out
+    return {
+        "version": version,
+        "flags": flags,
+        "signals": signals,
+        "inputs": inputs,
+        "outputs": outputs,
+        "gates": n_gates,
+        "gates_offset": offset,
+        "gate_size": IR_GATE_FORMATS[version].size,
+    }
+
+
+def iter_ir_binary(data) -> Iterator[GateIR]:
+    header = read_ir_header(data)
+    start = header["gates_offset"]
+    view = memoryview(data)[start:start + header["gates"] * header["gate_size"]]
+    for gid, code, has_const, size, out, in1, in2, in3, en, const, *skip in IR_GATE_FORMATS[header["version"]].iter_unpack(view):
+        yield GateIR(
+            id=gid,
+            type=GATE_NAMES[code],
+            output=out,
+            input1=in1,
+            input2=in2,
+            input3=in3,
+            size=size,
+            enabled_if=en,
+            const_value=const if has_const else None,
+            skip=skip[0] if skip else -1
+        )
 
+
+def read_ir_fanout(data) -> Optional[tuple]:
+    header = read_ir_header(data)
+    if not header["flags"] & IR_FLAG_FANOUT:
+        return None
+    view = memoryview(data)
+    offset = header["gates_offset"] + header["gates"] * header["gate_size"]
+    count = header["signals"] + 1
+    offsets = view[offset:offset + 4 * count].cast("i")
+    offset += 4 * count
+    gates = view[offset:offset + 4 * offsets[-1]].cast("i")
+    return offsets, gates
+
+
+def read_ir_origins(data) -> Optional[tuple]:
+    # (sources (fichier, ligne, itérations), source de chaque porte), None sans la section
+    header = read_ir_header(data)
+    if not header["flags"] & IR_FLAG_ORIGINS:
+        return None
+    view = memoryview(data)
+    offset = header["gates_offset"] + header["gates"] * header["gate_size"]
+    if header["flags"] & IR_FLAG_FANOUT:
+        offset += 4 * (header["signals"] + 1)
+        offset += 4 * view[offset - 4:offset].cast("i")[0]
+    count, length = struct.unpack_from("<ii", data, offset)
+    offset += 8
+    gates = view[offset:offset + 4 * header["gates"]].cast("i")
+    offset += 4 * header["gates"]
+    text = bytes(view[offset:offset + length]).decode()
+    origins = []
+    for entry in text.split("\n")[:count]:
+        path, line, iterations = entry.split("\t")
+        origins.append((path, int(line), iterations))
+    return origins, gates
+
+
+def ir_binary_gates(data):
+    # Vue NumPy sans copie sur les enregistrements de portes
+    import numpy as np
+    header = read_ir_header(data)
+    fields = [
+        ("id", "<i4"), ("type", "u1"), ("has_const", "u1"), ("size", "<u2"),
+        ("output", "<i4"), ("input1", "<i4"), ("input2", "<i4"), ("input3", "<i4"),
+        ("enabled_if", "<i4"), ("const_value", "<u4"),
+    ]
+    if header["version"] >= 2:
+        fields.append(("skip", "<i4"))
+    dtype = np.dtype(fields)
+    assert dtype.itemsize == header["gate_size"]
+    return np.frombuffer(data, dtype=dtype, count=header["gates"], offset=header["gates_offset"])
+
+
+# === Macros FOR / IF ===
+#
+# Les blocs FOR et IF sont analysés une seule fois en un petit arbre, et
+# chaque expression {expr} est compilée une seule fois avec compile().
+# L'expansion est un générateur qui alimente compile_line ligne à ligne :
+# une netlist dépliée n'est jamais gardée en mémoire sous forme de liste.
+
+FOR_RE = re.compile(r"FOR (\w+) IN (\d+) TO (\d+):")
+MACRO_EXPR_RE = re.compile(r"\{([^{}]+)\}")
+MACRO_GLOBALS: dict = {}  # les expressions ne voient que les builtins et les variables de boucle
+
+
+@dataclass
+class MacroLine:
+    text: str  # texte avant la première expression
+    parts: tuple = ()  # (expression compilée, texte qui la suit)
+    line: int = 0  # numéro de ligne dans la source
+
+    def render(self, context: dict) -> str:
+        out = self.text
+        for code, text in self.parts:
+            out += str(eval(code, MACRO_GLOBALS, context)) + text
+        return out
+
+
+@dataclass
+class MacroFor:
+    var: str
+    start: int
+    end: int
+    body: list
+
+
+@dataclass
+class MacroIf:
+    condition: object  # expression compilée
+    then_body: list
+    else_body: list
+
+
+def _macro_line(line: str, number: int) -> MacroLine:
+    pieces = MACRO_EXPR_RE.split(line)
+    parts = tuple((compile(pieces[i].strip(), "<netlist>", "eval"), pieces[i + 1]) for i in range(1, len(pieces), 2))
+    return MacroLine(pieces[0], parts, number)
+
+
+def _parse_macro_block(lines: List[str], pos: int, stop: tuple) -> tuple:
+    # Renvoie (noeuds, position suivante, mot de fin rencontré ou None)
+    nodes = []
+    while pos < len(lines):
+        line = lines[pos].strip()
+        upper = line.upper()
+        pos += 1
+        if upper in stop:
+            return nodes, pos, upper
+        if upper.startswith("FOR "):
+            match = FOR_RE.match(line)
+            if not match:
+                raise ValueError(f"Syntaxe FOR invalide : {line}")
+            body, pos, end = _parse_macro_block(lines, pos, ("END",))
+            if end is None:
+                raise ValueError("Bloc FOR sans END")
+            nodes.append(MacroFor(match.group(1), int(match.group(2)), int(match.group(3)), body))
+        elif upper.startswith("IF "):
+            condition = compile(line[3:].rstrip(":").strip(), "<netlist>", "eval")
+            then_body, pos, end = _parse_macro_block(lines, pos, ("ELSE:", "ENDIF"))
+            else_body = []
+            if end == "ELSE:":
+                else_body, pos, _ = _parse_macro_block(lines, pos, ("ENDIF",))
+            nodes.append(MacroIf(condition, then_body, else_body))
+        elif line and not line.startswith("#") and upper not in ("END", "ENDIF", "ELSE:"):
+            # Indentation conservée : les colonnes des jetons restent celles de la source
+            nodes.append(_macro_line(lines[pos - 1].rstrip(), pos))
+    return nodes, pos, None
+
+
+def parse_macros(lines: List[str]) -> list:
+    return _parse_macro_block(lines, 0, ())[0]
+
+
+def _expand(nodes: list, context: dict) -> Iterator[tuple]:
+    for node in nodes:
+        if type(node) is MacroLine:
+            yield node.line, node.render(context) if node.parts else node.text
+        elif type(node) is MacroFor:
+            # Un seul contexte, modifié en place et restauré en sortie de boucle
+            shadowed = node.var in context
+            outer = context.get(node.var)
+            for value in range(node.start, node.end + 1):
+                context[node.var] = value
+                yield from _expand(node.body, context)
+            if shadowed:
+                context[node.var] = outer
+            else:
+                context.pop(node.var, None)
+        else:
+            taken = eval(node.condition, MACRO_GLOBALS, context)
+            yield from _expand(node.then_body if taken else node.else_body, context)
+
+
+def iter_macro_lines(lines: List[str], context: Optional[dict] = None) -> Iterator[tuple]:
+    # (numéro de ligne source, ligne dépliée), sans lignes vides ni commentaires.
+    # context reçoit les variables des boucles FOR en cours pendant l'itération
+    return _expand(parse_macros(lines), {} if context is None else context)
+
+
+def iter_macros(lines: List[str]) -> Iterator[str]:
+    return (text for _, text in iter_macro_lines(lines))
+
+
+def expand_macros(lines: List[str]) -> List[str]:
+    return list(iter_macros(lines))
+
+
+# === Analyse lexicale des lignes .net ===
+#
+# Chaque ligne est découpée une seule fois. Les formes composées (A[3],
+# BUF:16, A:8) sont reconnues dès cette étape par une expression compilée
+# et chaque jeton garde son numéro de ligne dans la source et sa colonne
+# dans la ligne (après expansion des macros). Le découpage passe par
+# str.split, bien plus rapide qu'un finditer jeton par jeton.
+
+class TokenKind:
+    NAME = "NAME"
+    NUMBER = "NUMBER"
+    INDEX = "INDEX"  # A[3] : value = (base, bit)
+    SIZED = "SIZED"  # A:8 ou BUF:16 : value = (nom, taille)
+    EQUALS = "EQUALS"
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    value: object
+    line: int
+    col: int
+
+
+COMPOUND_TOKEN_RE = re.compile(r"([A-Za-z_][A-Za-z_0-9]*)(?:\[([0-9]+)\]|:([0-9]+))\Z")
+
+
+def syntax_error(token: Token, message: str) -> ValueError:
+    return ValueError(f"Ligne {token.line}, colonne {token.col} : {message}")
+
+
+def tokenize(text: str, line: int = 0) -> List[Token]:
+    if "#" in text:
+        text = text[:text.index("#")]  # commentaire jusqu'à la fin de la ligne
+    tokens = []
+    end = 0
+    new = tuple.__new__  # construction directe, sans le __new__ Python de NamedTuple
+    for word in (text.replace("=", " = ") if "=" in text else text).split():
+        # Seuls des blancs séparent les jetons : le prochain mot est à sa première occurrence
+        start = text.find(word, end)
+        end = start + len(word)
+        if word.isidentifier():
+            kind, value = TokenKind.NAME, word
+        elif word.isdigit():
+            kind, value = TokenKind.NUMBER, word
+        elif word == "=":
+            kind, value = TokenKind.EQUALS, word
+        else:
+            m = COMPOUND_TOKEN_RE.match(word)
+            if m is None:
+                raise syntax_error(Token("ERROR", word, None, line, start + 1),
+                                   f"jeton invalide '{word}' dans '{text.strip()}'")
+            if m.group(2) is not None:
+                kind, value = TokenKind.INDEX, (m.group(1), int(m.group(2)))
             else:
-                if line.upper() not in {"END", "ENDIF", "ELSE:"}:
-                    expanded.append(_interpolate(raw_line, context))
-                i += 1
+                kind, value = TokenKind.SIZED, (m.group(1), int(m.group(3)))
+        tokens.append(new(Token, (kind, word, value, line, start + 1)))
+    return tokens
+
+
+# === Modules ===
+#
+# MODULE NOM ... ENDMODULE définit un sous-circuit dont les ports sont ses
+# lignes INPUT/OUTPUT, et IMPORT fichier.net AS NOM fait d'une netlist
+# entière un module. INSTANCE U1 NOM A=X B=Y S=Z le câble dans le circuit
+# courant. Chaque module est compilé une seule fois en un fragment d'IR,
+# mémorisé d'une compilation à l'autre par le hash de sa source : une
+# instance n'est plus qu'une relocation des indices de signaux du fragment,
+# colonne par colonne. Les signaux internes de U1 s'appellent U1.<nom>.
+
+MODULE_RE = re.compile(r"MODULE ([A-Za-z_]\w*):?\Z")
+IMPORT_RE = re.compile(r"IMPORT (\S+) AS ([A-Za-z_]\w*)\Z")
+
+
+@dataclass
+class ModuleDef:
+    name: str
+    body: List[str]  # lignes du corps, numérotées comme dans la source
+    modules: Dict[str, "ModuleDef"]  # modules visibles depuis le corps
+    key: str  # hash de la source du module et de tout ce qu'il peut instancier
+    path: str = ""  # fichier qui contient le corps, pour la provenance des portes
+
+
+def _scope_key(definitions: list) -> str:
+    h = hashlib.sha256()
+    for name, source in definitions:
+        h.update(f"\0{name}\0{len(source)}\0".encode())
+        h.update(source.encode())
+    return h.hexdigest()
+
+
+def import_module(path: str, name: str, importing: tuple = ()) -> ModuleDef:
+    real = os.path.realpath(path)
+    if real in importing:
+        raise ValueError(f"IMPORT circulaire : {path}")
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    try:
+        body, modules, key = split_modules(lines, os.path.dirname(path), importing + (real,), path)
+    except ValueError as e:
+        raise ValueError(f"{path} : {e}") from None
+    # La clé ne dépend que du contenu : un même fichier importé sous deux noms est compilé une fois
+    return ModuleDef(name, body, modules, _scope_key([(key, "".join(lines))]), path)
 
-        return expanded
 
-    return process_block(lines, {})
+def split_modules(lines: List[str], directory: Optional[str] = None, importing: tuple = (),
+                  path: str = "") -> tuple:
+    # Retire les blocs MODULE et les lignes IMPORT d'une source. Renvoie
+    # (reste de la source, modules définis, clé de ces définitions) ; les
+    # lignes retirées sont remplacées par des lignes vides pour garder les
+    # numéros. Les modules d'une source se voient tous, quel que soit leur
+    # ordre ; leur clé couvre le texte de tous les blocs et, par la clé des
+    # IMPORT, le contenu de chaque fichier importé.
+    # Les chemins IMPORT partent du dossier du fichier qui importe, pas du dossier courant
+    if directory is None:
+        directory = os.path.dirname(path) or "."
+    body = None
+    blocks = []  # (nom, première ligne, ENDMODULE)
+    imports = []
+    pos = 0
+    while pos < len(lines):
+        line = lines[pos].strip()
+        upper = line.upper()
+        if upper.startswith("IMPORT "):
+            match = IMPORT_RE.match(line)
+            if not match:
+                raise ValueError(f"Ligne {pos + 1} : syntaxe IMPORT invalide : {line}")
+            imported = os.path.join(directory, match.group(1))
+            try:
+                imports.append(import_module(imported, match.group(2), importing))
+            except OSError as e:
+                raise ValueError(f"Ligne {pos + 1} : IMPORT impossible de {imported} : {e.strerror}") from None
+            body = body or list(lines)
+            body[pos] = ""
+        elif upper.startswith("MODULE "):
+            match = MODULE_RE.match(line)
+            if not match:
+                raise ValueError(f"Ligne {pos + 1} : syntaxe MODULE invalide : {line}")
+            start = pos
+            pos += 1
+            while pos < len(lines) and lines[pos].strip().upper() != "ENDMODULE":
+                inner = lines[pos].strip().upper()
+                if inner.startswith(("MODULE ", "IMPORT ")):
+                    raise ValueError(f"Ligne {pos + 1} : MODULE et IMPORT ne sont permis qu'en dehors d'un module")
+                pos += 1
+            if pos == len(lines):
+                raise ValueError(f"Ligne {start + 1} : MODULE {match.group(1)} sans ENDMODULE")
+            blocks.append((match.group(1), start, pos))
+            body = body or list(lines)
+            body[start:pos + 1] = [""] * (pos + 1 - start)
+        elif upper == "ENDMODULE":
+            raise ValueError(f"Ligne {pos + 1} : ENDMODULE sans MODULE")
+        pos += 1
+
+    modules: Dict[str, ModuleDef] = {}
+    if body is None:
+        return lines, modules, ""
+    definitions = [(m.name, m.key) for m in imports]
+    definitions += [(name, "".join(lines[start:end + 1])) for name, start, end in blocks]
+    key = _scope_key(definitions)
+    for module in imports:
+        if module.name in modules:
+            raise ValueError(f"Module défini deux fois : {module.name}")
+        modules[module.name] = module
+    for name, start, end in blocks:
+        if name in modules:
+            raise ValueError(f"Ligne {start + 1} : module défini deux fois : {name}")
+        module_body = [""] * (start + 1) + lines[start + 1:end]
+        modules[name] = ModuleDef(name, module_body, modules, _scope_key([(key, name)]), path)
+    return body, modules, key
+
+
+@dataclass
+class ModuleFragment:
+    ir: GateTable  # portes du module, sans les constantes partagées avec le circuit
+    names: List[str]
+    sizes: array
+    inputs: Dict[str, int]  # port -> signal du fragment
+    outputs: Dict[str, int]
+    consts: Dict[int, str]  # signal -> valeur, remplacé par la constante du circuit
+    internal: List[int]  # signaux recréés à chaque instance
+    internal_names: List[str]
+    internal_sizes: array
+    ids: int  # identifiants de portes consommés
+    ghost_marks: List[tuple]  # (position, condition) des GHOST de premier niveau
+    nested: List[int]  # positions des MUX de conditions imbriquées
+    origins: List[tuple]  # sources des portes ; fichier "" = celui du module, connu à l'instanciation
+    # Colonnes de signaux prêtes à reloger : n = entrée inutilisée (0), n + 1 = -1
+    output_ref: array
+    input1_ref: array
+    input2_ref: array
+    input3_ref: array
+    enabled_ref: array
 
 
+_FRAGMENTS: Dict[str, ModuleFragment] = {}  # clé du module -> fragment compilé
+_FRAGMENTS_MAX = 256
+
+C_SIGNAL_RE = re.compile(r"s\[\d+\]")  # expression C réduite à un signal, sans parenthèses à ajouter
 
 
 class NetlistCompiler:
     def __init__(self):
-        self.signal_table: Dict[str, Signal] = {}
+        self.signal_table = SignalTable()
         self.signal_counter = 0
-        self.ir: List[GateIR] = []
+        self.ir = GateTable()
         self.ir_id = 0
         self.const_cache: Dict[str, int] = {}  # valeur binaire -> index signal
         self.inputs: List[str] = []
         self.outputs: List[str] = []
         self.index_cache: Dict[tuple, Signal] = {} 
         self.enabled_index = -1
+        self.ghost_stack: List[int] = []
+        self.ghost_parent: Dict[int, int] = {}  # condition imbriquée -> condition englobante
+        self.ghost_marks: List[tuple] = []  # (position, condition) des GHOST de premier niveau
+        self.modules: Dict[str, ModuleDef] = {}
+        self.instances: set = set()
+        self.module_stack: tuple = ()  # clés des modules en cours de compilation
+        self.optimization_report: Dict[str, int] = {}
+        self.origins: List[tuple] = []  # (fichier, ligne, itérations FOR) ; colonne origin de l'IR
+        self.origin_indexes: Dict[tuple, int] = {}
+        self.origin_maps: Dict[str, list] = {}  # clé du module -> sources de son fragment dans le circuit
 
     def get_or_create_signal(self, name: str, size: int = 1) -> Signal:
-        if name not in self.signal_table:
-            sig = Signal(name, self.signal_counter, size)
-            self.signal_table[name] = sig
+        table = self.signal_table
+        index = table.indexes.get(name)
+        if index is None:
+            index = table.add(name, size)
             self.signal_counter += 1
-        return self.signal_table[name]
+        return Signal(name, index, table.sizes[index])
 
     def create_const(self, value: str) -> Signal:
         if value in self.const_cache:
             index = self.const_cache[value]
             return Signal(f"__const_{value}", index, len(value))
         sig = self.get_or_create_signal(f"__const_{value}", size=len(value))
-        self.ir.append(GateIR(
+        self.ir.add(
             id=self.ir_id,
             type=GateType.CONST,
             output=sig.index,
             size=sig.size,
             const_value=int(value,2),
             enabled_if=self.enabled_index
-        ))
+        )
         self.const_cache[value] = sig.index
         self.ir_id += 1
         return sig
 
 
-    def parse_arg(self, token: str, size=1) -> Signal:
+    def nested_condition(self, outer: int, inner: int) -> int:
+        # GHOST imbriqué : la condition effective vaut inner quand outer est
+        # vrai et 0 sinon. La porte est toujours évaluée (enabled_if = -1) :
+        # la condition n'est jamais périmée, même sans saut de bloc.
+        self.enabled_index = -1
+        zero = self.create_const("0")
+        sig = self.get_or_create_signal(f"__ghost_{self.ir_id}")
+        self.ir.add(
+            id=self.ir_id,
+            type=GateType.MUX,
+            output=sig.index,
+            input1=outer,
+            input2=zero.index,
+            input3=inner,
+            enabled_if=-1
+        )
+        self.ir_id += 1
+        self.enabled_index = outer
+        self.ghost_parent[sig.index] = outer
+        return sig.index
+
+    def _operand(self, token: Token, size: int = 1) -> Signal:
         # Constante binaire
-        if set(token).issubset({"0", "1"}):
-            return self.create_const(token)
+        if token.kind == TokenKind.NUMBER:
+            if token.text.strip("01"):
+                raise syntax_error(token, f"constante binaire invalide : {token.text}")
+            return self.create_const(token.text)
 
         # Index automatique : A[3]
-        m = re.match(r"([A-Za-z_][A-Za-z_0-9]*)\[(\d+)\]", token)
-        if m:
-            base, bit_index = m.group(1), int(m.group(2))
-            key = (base, bit_index)
+        if token.kind == TokenKind.INDEX:
+            key = token.value
             if key in self.index_cache:
                 return self.index_cache[key]
-
+            base, bit_index = key
             input_sig = self.get_or_create_signal(base)
-            tmp_name = f"__idx_{base}_{bit_index}"
-            tmp_sig = self.get_or_create_signal(tmp_name, size=1)
-
-            self.ir.append(GateIR(
+            tmp_sig = self.get_or_create_signal(f"__idx_{base}_{bit_index}", size=1)
+            self.ir.add(
                 id=self.ir_id,
                 type=GateType.INDEX,
                 output=tmp_sig.index,
@@ -194,240 +971,1507 @@ class NetlistCompiler:
                 size=1,
                 const_value=bit_index,
                 enabled_if=self.enabled_index
-            ))
+            )
             self.ir_id += 1
             self.index_cache[key] = tmp_sig
             return tmp_sig
 
         # Nom de signal classique
-        return self.get_or_create_signal(token,size)
+        if token.kind == TokenKind.NAME:
+            return self.get_or_create_signal(token.text, size)
+        raise syntax_error(token, f"opérande invalide : {token.text}")
 
+    def origin(self, path: str, line: int, iterations: str = "") -> int:
+        key = (path, line, iterations)
+        index = self.origin_indexes.get(key)
+        if index is None:
+            index = self.origin_indexes[key] = len(self.origins)
+            self.origins.append(key)
+        return index
 
-    def compile_line(self, line: str):
-        
-        line = line.strip()
-        if not line or line.startswith("#"):
-            return
-        
-        if line.startswith("GHOST_END"):
-            self.enabled_index = -1
+    def _compile_source(self, lines: List[str], path: str):
+        # compile_line sur chaque ligne dépliée, puis provenance des portes
+        # créées : fichier, ligne et valeurs des variables FOR, lues dans le
+        # contexte de l'expansion. Les portes d'une instance gardent la leur.
+        context = {}
+        seen: Dict[tuple, int] = {}
+        for number, line in iter_macro_lines(lines, context):
+            start = len(self.ir)
+            self.compile_line(line, number)
+            column = self.ir.origin
+            if len(column) == start:
+                continue
+            key = (number, *context.values())
+            origin = seen.get(key)
+            if origin is None:
+                iterations = " ".join(f"{var}={value}" for var, value in context.items())
+                origin = seen[key] = self.origin(path, number, iterations)
+            for p in range(start, len(column)):
+                if column[p] < 0:
+                    column[p] = origin
+
+    def parse_arg(self, token: str, size=1) -> Signal:
+        tokens = tokenize(token)
+        if len(tokens) != 1:
+            raise ValueError(f"Opérande invalide : {token}")
+        return self._operand(tokens[0], size)
+
+    @staticmethod
+    def _integer(token: Token) -> int:
+        if token.kind != TokenKind.NUMBER:
+            raise syntax_error(token, f"entier attendu : {token.text}")
+        return int(token.text)
+
+    def compile_line(self, line: str, line_number: int = 0):
+        tokens = tokenize(line, line_number)
+        if not tokens:
             return
-        
-        if line.startswith("GHOST"):
-            parts = line.split()
-            if len(parts) != 2:
-                raise ValueError(f"Ligne GHOST invalide : '{line}'")
-            _, name = parts
-            self.enabled_index = self.get_or_create_signal(name).index
+        head = tokens[0]
+        if len(tokens) > 1 and tokens[1].kind == TokenKind.EQUALS:
+            self._compile_assignment(tokens, line)
             return
+        directive = self.DIRECTIVES.get(head.text.upper()) if head.kind == TokenKind.NAME else None
+        if directive is None:
+            raise syntax_error(head, f"ligne invalide, pas de '=' → {line.strip()}")
+        directive(self, head, tokens[1:], line)
 
-        if line.upper().startswith("INPUT"):
-            _, *items = line.split()
-            for item in items:
-                if ":" in item:
-                    name, size_str = item.split(":")
-                    size = int(size_str)
-                else:
-                    name = item
-                    size = 1  # par défaut
-                self.inputs.append(name)
-                self.get_or_create_signal(name, size)
-            return
+    # --- Directives ---
 
-        if line.upper().startswith("OUTPUT"):
-            _, *names = line.split()
-            for name in names:
-                self.outputs.append(name)
-                self.get_or_create_signal(name)
-            return
+    def _ghost_end(self, head: Token, args: List[Token], line: str):
+        if self.ghost_stack:
+            self.ghost_stack.pop()
+        self.enabled_index = self.ghost_stack[-1] if self.ghost_stack else -1
 
-        # Séparation destination et expression
-        if "=" not in line:
-            raise ValueError(f"Ligne invalide : pas de '=' → {line}")
+    def _ghost(self, head: Token, args: List[Token], line: str):
+        if len(args) != 1:
+            raise syntax_error(head, f"ligne GHOST invalide : '{line.strip()}'")
+        condition = self._operand(args[0]).index
+        if self.enabled_index >= 0:
+            condition = self.nested_condition(self.enabled_index, condition)
+        else:
+            self.ghost_marks.append((len(self.ir), condition))
+        self.ghost_stack.append(condition)
+        self.enabled_index = condition
 
-        dest, expr = [s.strip() for s in line.split("=", 1)]
-        parts = expr.split()
-        if not parts:
-            raise ValueError(f"Ligne invalide ou vide après '=' : {line}")
+    def _input(self, head: Token, args: List[Token], line: str):
+        for token in args:
+            if token.kind == TokenKind.SIZED:
+                name, size = token.value
+            elif token.kind == TokenKind.NAME:
+                name, size = token.text, 1  # par défaut
+            else:
+                raise syntax_error(token, f"entrée invalide : {token.text}")
+            self.inputs.append(name)
+            self.get_or_create_signal(name, size)
 
-        op = parts[0].upper()
-        args = parts[1:]
+    def _output(self, head: Token, args: List[Token], line: str):
+        for token in args:
+            if token.kind == TokenKind.SIZED:
+                name, size = token.value
+            elif token.kind == TokenKind.NAME:
+                name, size = token.text, 1
+            else:
+                raise syntax_error(token, f"sortie invalide : {token.text}")
+            self.outputs.append(name)
+            self.get_or_create_signal(name, size)
 
-        # Syntaxe spéciale : BUF avec override de taille
-        if op.startswith("BUF:"):
-            try:
-                override_size = int(op.split(":")[1])
-            except ValueError:
-                raise ValueError(f"Taille invalide dans BUF: → {op}")
-            op = GateType.BUF
-            in1 = self.parse_arg(args[0],override_size)
-            dest_sig = self.get_or_create_signal(dest, size=override_size)
-            self.ir.append(GateIR(
-                id=self.ir_id,
-                type=op,
-                output=dest_sig.index,
-                input1=in1.index,
-                input2=0,
-                input3=0,
-                size=override_size,
-                enabled_if=self.enabled_index
-            ))
-            self.ir_id += 1
-            return
+    def _instance(self, head: Token, args: List[Token], line: str):
+        if len(args) < 2 or args[0].kind != TokenKind.NAME or args[1].kind != TokenKind.NAME:
+            raise syntax_error(head, f"ligne INSTANCE invalide, INSTANCE NOM MODULE PORT=SIGNAL... attendu : '{line.strip()}'")
+        name, module_name = args[0].text, args[1].text
+        module = self.modules.get(module_name)
+        if module is None:
+            raise syntax_error(args[1], f"module inconnu : {module_name}")
+        if name in self.instances:
+            raise syntax_error(args[0], f"instance déjà définie : {name}")
+        self.instances.add(name)
+        fragment = self._module_fragment(module)
 
+        # Ports : chaque signal du fragment reçoit son index dans le circuit
+        n = len(fragment.names)
+        mapping = [0] * (n + 2)
+        mapping[n + 1] = -1
+        connections = args[2:]
+        connected = set()
+        for i in range(0, len(connections), 3):
+            port, equals, value = (connections[i:i + 3] + [None, None])[:3]
+            if port.kind != TokenKind.NAME or equals is None or equals.kind != TokenKind.EQUALS or value is None:
+                raise syntax_error(port, f"connexion invalide, PORT=SIGNAL attendu → {line.strip()}")
+            if port.text in connected:
+                raise syntax_error(port, f"port connecté deux fois : {port.text}")
+            connected.add(port.text)
+            if port.text in fragment.inputs:
+                signal = fragment.inputs[port.text]
+                mapping[signal] = self._operand(value, fragment.sizes[signal]).index
+            elif port.text in fragment.outputs:
+                if value.kind != TokenKind.NAME:
+                    raise syntax_error(value, f"sortie d'instance invalide : {value.text}")
+                signal = fragment.outputs[port.text]
+                mapping[signal] = self.get_or_create_signal(value.text, fragment.sizes[signal]).index
+            else:
+                raise syntax_error(port, f"port inconnu pour {module_name} : {port.text}")
+        missing = [port for port in fragment.inputs if port not in connected]
+        if missing:
+            raise syntax_error(head, f"entrées non connectées pour {name} : {' '.join(missing)}")
 
-        # Vérification du nombre minimal d’arguments attendus
-        min_args_required = {
-            "AND": 2, "OR": 2, "XOR": 2, "NAND": 2, "NOR": 2, "NXOR": 2,
-            "NOT": 1, "MUX": 3,
-            "CONCAT": 2, "SUB": 3, "INDEX": 2,
-            "CONST": 1, "BUF" : 1, "LOAD" : 1, "STORE" : 2
-        }.get(op, 1)
+        table = self.signal_table
+        for port, signal in fragment.outputs.items():
+            if port not in connected and port not in fragment.inputs:
+                mapping[signal] = table.add(f"{name}.{port}", fragment.sizes[signal])
+                self.signal_counter += 1
+        for signal, value in fragment.consts.items():
+            mapping[signal] = self.create_const(value).index
+        first = table.extend([f"{name}.{local}" for local in fragment.internal_names], fragment.internal_sizes)
+        for index, signal in enumerate(fragment.internal, first):
+            mapping[signal] = index
+        self.signal_counter += len(fragment.internal)
 
-        if len(args) < min_args_required:
-            raise ValueError(f"Ligne '{line}' → trop peu d'arguments pour {op} (requis : {min_args_required})")
+        # Dans un bloc GHOST, chaque GHOST de premier niveau du module devient
+        # une condition imbriquée, créée au même endroit qu'en copiant le corps
+        outer = self.enabled_index
+        conditions = mapping[:]
+        conditions[n + 1] = outer
+        origins = self.origin_maps.get(module.key)
+        if origins is None:
+            # Sources du fragment -> sources du circuit (index -1 : inconnue)
+            origins = [self.origin(path or module.path, number, iterations)
+                       for path, number, iterations in fragment.origins]
+            origins.append(-1)
+            self.origin_maps[module.key] = origins
+        base_id = self.ir_id
+        self.ir_id += fragment.ids
+        start = 0
+        for mark, condition in (fragment.ghost_marks if outer >= 0 else []):
+            self._relocate(fragment, start, mark, mapping, conditions, origins, base_id)
+            conditions[condition] = self.nested_condition(outer, mapping[condition])
+            self.enabled_index = outer
+            start = mark
+        self._relocate(fragment, start, len(fragment.ir), mapping, conditions, origins, base_id)
 
+    def _relocate(self, fragment: ModuleFragment, start: int, end: int, mapping: list, conditions: list,
+                  origins: list, base_id: int):
+        ir, source = self.ir, fragment.ir
+        offset = len(ir)
+        signal = mapping.__getitem__
+        ir.id.extend(map(base_id.__add__, source.id[start:end]))
+        ir.type.extend(source.type[start:end])
+        ir.output.extend(map(signal, fragment.output_ref[start:end]))
+        ir.input1.extend(map(signal, fragment.input1_ref[start:end]))
+        ir.input2.extend(map(signal, fragment.input2_ref[start:end]))
+        ir.input3.extend(map(signal, fragment.input3_ref[start:end]))
+        ir.size.extend(source.size[start:end])
+        ir.enabled_if.extend(map(conditions.__getitem__, fragment.enabled_ref[start:end]))
+        ir.const_value.extend(source.const_value[start:end])
+        ir.has_const.extend(source.has_const[start:end])
+        ir.skip.extend(source.skip[start:end])
+        ir.origin.extend(map(origins.__getitem__, source.origin[start:end]))
+        # Une condition imbriquée lit la condition effective du bloc englobant
+        for p in fragment.nested:
+            if start <= p < end:
+                q = offset + p - start
+                ir.enabled_if[q] = -1
+                ir.input1[q] = conditions[source.input1[p]]
+                self.ghost_parent[ir.output[q]] = ir.input1[q]
 
-        if op == GateType.CONST:
-            dest_sig = self.get_or_create_signal(dest, size=len(args[0]))
-            self.ir.append(GateIR(
-                id=self.ir_id,
-                type=GateType.CONST,
-                output=dest_sig.index,
-                size=dest_sig.size,
-                const_value=int(args[0], 2),
-                enabled_if=self.enabled_index
-            ))
-            self.ir_id += 1
+    def _module_fragment(self, module: ModuleDef) -> ModuleFragment:
+        fragment = _FRAGMENTS.get(module.key)
+        if fragment is not None:
+            return fragment
+        if module.key in self.module_stack:
+            raise ValueError(f"Instanciation récursive du module {module.name}")
+        compiler = NetlistCompiler()
+        compiler.modules = module.modules
+        compiler.module_stack = self.module_stack + (module.key,)
+        try:
+            compiler._compile_source(module.body, "")
+        except ValueError as e:
+            raise ValueError(f"Module {module.name} : {e}") from None
+        fragment = compiler._fragment()
+        if len(_FRAGMENTS) >= _FRAGMENTS_MAX:
+            _FRAGMENTS.clear()
+        _FRAGMENTS[module.key] = fragment
+        return fragment
+
+    def _fragment(self) -> ModuleFragment:
+        table, ir = self.signal_table, self.ir
+        n = len(table)
+        consts = {index: value for value, index in self.const_cache.items()}
+        const_code = GATE_CODES[GateType.CONST]
+        kept = [p for p in range(len(ir)) if ir.type[p] != const_code or ir.output[p] not in consts]
+        body = ir.select(kept)
+        inputs = {name: table.indexes[name] for name in self.inputs}
+        outputs = {name: table.indexes[name] for name in self.outputs}
+        ports = set(inputs.values()) | set(outputs.values())
+        internal = [s for s in range(n) if s not in ports and s not in consts]
+        mux_code = GATE_CODES[GateType.MUX]
+        nested = [p for p in range(len(body)) if body.type[p] == mux_code and body.enabled_if[p] == -1
+                  and body.output[p] in self.ghost_parent]
+        marks = [(bisect_left(kept, p), condition) for p, condition in self.ghost_marks]
+
+        def refs(column, arity):
+            return array("i", [column[p] if GATE_ARITY[body.type[p]] > arity else n for p in range(len(body))])
+
+        return ModuleFragment(
+            ir=body, names=list(table.names), sizes=array("i", table.sizes), inputs=inputs, outputs=outputs,
+            consts=consts, internal=internal, internal_names=[table.names[s] for s in internal],
+            internal_sizes=array("i", [table.sizes[s] for s in internal]), ids=self.ir_id, ghost_marks=marks, nested=nested,
+            origins=list(self.origins),
+            output_ref=array("i", [s if s >= 0 else n + 1 for s in body.output]),
+            input1_ref=refs(body.input1, 0), input2_ref=refs(body.input2, 1), input3_ref=refs(body.input3, 2),
+            enabled_ref=array("i", [s if s >= 0 else n + 1 for s in body.enabled_if]),
+        )
+
+    DIRECTIVES = {"GHOST_END": _ghost_end, "GHOST": _ghost, "INPUT": _input, "OUTPUT": _output,
+                  "INSTANCE": _instance}
+
+    # --- Affectations : DEST = OP args ---
+
+    def _compile_assignment(self, tokens: List[Token], line: str):
+        dest = tokens[0]
+        if dest.kind != TokenKind.NAME:
+            raise syntax_error(dest, f"destination invalide : {dest.text}")
+        if len(tokens) < 3:
+            raise syntax_error(tokens[1], f"ligne invalide ou vide après '=' : {line.strip()}")
+        op_token, args = tokens[2], tokens[3:]  # chaque argument est vérifié par _operand ou _integer
+
+        # Syntaxe spéciale : BUF avec override de taille
+        if op_token.kind == TokenKind.SIZED:
+            op, override_size = op_token.value
+            if op.upper() != GateType.BUF:
+                raise syntax_error(op_token, f"taille imposée non supportée pour {op}")
+            if not args:
+                raise syntax_error(op_token, f"trop peu d'arguments pour {op_token.text} (requis : 1)")
+            self._op_sized_buf(dest.text, override_size, args)
             return
 
+        op = op_token.text.upper()
+        entry = self.OPCODES.get(op) if op_token.kind == TokenKind.NAME else None
+        if entry is None:
+            raise syntax_error(op_token, f"opérateur inconnu : {op_token.text}")
+        min_args_required, handler = entry
+        if len(args) < min_args_required:
+            raise syntax_error(op_token, f"trop peu d'arguments pour {op} (requis : {min_args_required}) → {line.strip()}")
+        handler(self, op, dest.text, args, line)
 
-        if op == GateType.CONCAT and len(args) > 2:
-            # concat multiple : expansion récursive
-            concat_signals = [self.parse_arg(tok) for tok in args]
-            tmp_name = f"__tmp_concat_{self.ir_id}"
-            tmp_sig = concat_signals[0]
-            for i in range(1, len(concat_signals)-1):
-                new_tmp_name = f"{tmp_name}_{i}"
-                new_sig = self.get_or_create_signal(new_tmp_name, size=tmp_sig.size + concat_signals[i].size)
-                self.ir.append(GateIR(
-                    id=self.ir_id,
-                    type=GateType.CONCAT,
-                    output=new_sig.index,
-                    input1=tmp_sig.index,
-                    input2=concat_signals[i].index,
-                    size=new_sig.size,
-                    const_value=concat_signals[i].size,
-                    enabled_if=self.enabled_index
-                ))
-                self.ir_id += 1
-                tmp_sig = new_sig
-
-            # dernière concat vers dest
-            final_input = concat_signals[-1]
-            inferred_size = tmp_sig.size + final_input.size
-            dest_sig = self.get_or_create_signal(dest, size=inferred_size)
-            self.ir.append(GateIR(
+    def _op_sized_buf(self, dest: str, override_size: int, args: List[Token]):
+        in1 = self._operand(args[0], override_size)
+        dest_sig = self.get_or_create_signal(dest, size=override_size)
+        self.ir.add(
+            id=self.ir_id,
+            type=GateType.BUF,
+            output=dest_sig.index,
+            input1=in1.index,
+            input2=0,
+            input3=0,
+            size=override_size,
+            enabled_if=self.enabled_index
+        )
+        self.ir_id += 1
+
+    def _op_const(self, op: str, dest: str, args: List[Token], line: str):
+        value = args[0]
+        if value.kind != TokenKind.NUMBER or value.text.strip("01"):
+            raise syntax_error(value, f"constante binaire invalide : {value.text}")
+        dest_sig = self.get_or_create_signal(dest, size=len(value.text))
+        self.ir.add(
+            id=self.ir_id,
+            type=GateType.CONST,
+            output=dest_sig.index,
+            size=dest_sig.size,
+            const_value=int(value.text, 2),
+            enabled_if=self.enabled_index
+        )
+        self.ir_id += 1
+
+    def _op_concat(self, op: str, dest: str, args: List[Token], line: str):
+        if len(args) == 2:
+            self._op_gate(op, dest, args, line)
+            return
+        # concat multiple : expansion récursive
+        concat_signals = [self._operand(tok) for tok in args]
+        tmp_name = f"__tmp_concat_{self.ir_id}"
+        tmp_sig = concat_signals[0]
+        for i in range(1, len(concat_signals)-1):
+            new_tmp_name = f"{tmp_name}_{i}"
+            new_sig = self.get_or_create_signal(new_tmp_name, size=tmp_sig.size + concat_signals[i].size)
+            self.ir.add(
                 id=self.ir_id,
                 type=GateType.CONCAT,
-                output=dest_sig.index,
+                output=new_sig.index,
                 input1=tmp_sig.index,
-                input2=final_input.index,
-                size=dest_sig.size,
-                const_value=final_input.size,
+                input2=concat_signals[i].index,
+                size=new_sig.size,
+                const_value=concat_signals[i].size,
                 enabled_if=self.enabled_index
-            ))
+            )
             self.ir_id += 1
-            return
-
-        in1 = self.parse_arg(args[0]) if len(args) > 0 else None
-        if op != GateType.INDEX and op!=GateType.SUB:
-            in2 = self.parse_arg(args[1]) if len(args) > 1 else None
-        else:
-            in2 = None
-        in3 = self.parse_arg(args[2]) if len(args) > 2 and op == GateType.MUX else None
+            tmp_sig = new_sig
 
-        constante = None
-        
-
-        # inférence de taille à partir des entrées
-        sizes = [s.size for s in (in1, in2, in3) if s]
+        # dernière concat vers dest
+        final_input = concat_signals[-1]
+        inferred_size = tmp_sig.size + final_input.size
+        dest_sig = self.get_or_create_signal(dest, size=inferred_size)
+        self.ir.add(
+            id=self.ir_id,
+            type=GateType.CONCAT,
+            output=dest_sig.index,
+            input1=tmp_sig.index,
+            input2=final_input.index,
+            size=dest_sig.size,
+            const_value=final_input.size,
+            enabled_if=self.enabled_index
+        )
+        self.ir_id += 1
 
-        if op==GateType.STORE:
-            assert sizes[0]==RAM_EL_SIZE, f"error ligne {line} une adresse RAM doit etre de taille 16"
-            self.ir.append(GateIR(
+    def _op_store(self, op: str, dest: str, args: List[Token], line: str):
+        address, value = self._operand(args[0]), self._operand(args[1])
+        assert address.size == RAM_EL_SIZE, f"error ligne {line.strip()} une adresse RAM doit etre de taille 16"
+        self.ir.add(
             id=self.ir_id,
-            type=op,
+            type=GateType.STORE,
             output=-1,
-            input1=in1.index,
-            input2=in2.index,
+            input1=address.index,
+            input2=value.index,
             input3=0,
             size=RAM_EL_SIZE,
-            const_value=constante,
             enabled_if=self.enabled_index
-            ))
-            return
+        )
 
+    def _op_gate(self, op: str, dest: str, args: List[Token], line: str):
+        # Les opérandes sont lus dans l'ordre : in1, puis in2 (sauf INDEX/SUB), puis in3 (MUX)
+        in1 = self._operand(args[0])
+        in2 = self._operand(args[1]) if len(args) > 1 and op != GateType.INDEX and op != GateType.SUB else None
+        in3 = self._operand(args[2]) if len(args) > 2 and op == GateType.MUX else None
+        sizes = [s.size for s in (in1, in2, in3) if s]
+        constante = None
 
-        if op==GateType.CONCAT:
-            inferred_size = sizes[0]+sizes[1]
+        # inférence de taille à partir des entrées
+        if op == GateType.CONCAT:
+            inferred_size = sizes[0] + sizes[1]
             constante = sizes[1]
-        elif op==GateType.INDEX:
+        elif op == GateType.INDEX:
             inferred_size = 1
-            constante = int(args[1])
-        elif op==GateType.SUB:
-            inferred_size = int(args[2]) - int(args[1])+1
-            constante = int(args[1])
-        elif op == GateType.BUF and in1:
+            constante = self._integer(args[1])
+        elif op == GateType.SUB:
+            constante = self._integer(args[1])
+            inferred_size = self._integer(args[2]) - constante + 1
+        elif op == GateType.BUF:
             inferred_size = in1.size
+        elif op == GateType.EQ:
+            inferred_size = 1
         elif op == GateType.LOAD:
-            assert sizes[0]==RAM_EL_SIZE, f"error ligne {line} une adresse RAM doit etre de taille 16"
+            assert sizes[0] == RAM_EL_SIZE, f"error ligne {line.strip()} une adresse RAM doit etre de taille 16"
             inferred_size = RAM_EL_SIZE
         elif op == GateType.ROM:
-            assert sizes[0]==RAM_EL_SIZE, f"error ligne {line} une adresse ROM doit etre de taille 16"
+            assert sizes[0] == RAM_EL_SIZE, f"error ligne {line.strip()} une adresse ROM doit etre de taille 16"
             inferred_size = ROM_EL_SIZE
         else:
-            inferred_size = max(sizes) if sizes else 1
+            inferred_size = max(sizes)
 
         dest_sig = self.get_or_create_signal(dest, size=inferred_size)
-
-        self.ir.append(GateIR(
+        self.ir.add(
             id=self.ir_id,
             type=op,
             output=dest_sig.index,
-            input1=in1.index if in1 else 0,
+            input1=in1.index,
             input2=in2.index if in2 else 0,
             input3=in3.index if in3 else 0,
             size=dest_sig.size,
             const_value=constante,
             enabled_if=self.enabled_index
-        ))
+        )
         self.ir_id += 1
 
+    # Nombre minimal d'arguments et traitement de chaque opérateur
+    OPCODES = {
+        GateType.AND: (2, _op_gate), GateType.OR: (2, _op_gate), GateType.XOR: (2, _op_gate),
+        GateType.NAND: (2, _op_gate), GateType.NOR: (2, _op_gate), GateType.NXOR: (2, _op_gate),
+        GateType.NOT: (1, _op_gate), GateType.MUX: (3, _op_gate), GateType.BUF: (1, _op_gate),
+        GateType.CONCAT: (2, _op_concat), GateType.SUB: (3, _op_gate), GateType.INDEX: (2, _op_gate),
+        GateType.CONST: (1, _op_const), GateType.LOAD: (1, _op_gate), GateType.STORE: (2, _op_store),
+        GateType.ROM: (1, _op_gate),
+        GateType.ADD: (2, _op_gate), GateType.SUBTRACT: (2, _op_gate), GateType.MUL: (2, _op_gate),
+        GateType.EQ: (2, _op_gate),
+    }
+
+
+    # === Optimisations ===
+    #
+    # L'IR est évaluée dans l'ordre à chaque cycle et les signaux gardent leur
+    # valeur d'un cycle à l'autre : un signal lu avant d'être écrit est un
+    # registre. Les passes ne touchent une porte que si le résultat reste
+    # identique cycle par cycle, registres et GHOST compris.
+
+    def _dataflow(self):
+        writers = defaultdict(list)  # signal -> positions des portes qui l'écrivent
+        readers = defaultdict(list)  # signal -> positions des portes qui le lisent
+        ir = self.ir
+        store = GATE_CODES[GateType.STORE]
+        columns = zip(ir.type, ir.output, ir.input1, ir.input2, ir.input3, ir.enabled_if)
+        for p, (code, out, a, b, c, en) in enumerate(columns):
+            n = GATE_ARITY[code]
+            if n > 0:
+                readers[a].append(p)
+            if n > 1:
+                readers[b].append(p)
+            if n > 2:
+                readers[c].append(p)
+            if en >= 0:
+                readers[en].append(p)
+            if code != store:
+                writers[out].append(p)
+        return writers, readers
+
+    @staticmethod
+    def _written_between(signal: int, start: int, end: int, writers) -> bool:
+        positions = writers.get(signal, ())
+        k = bisect_right(positions, start)
+        return k < len(positions) and positions[k] < end
+
+    def _reads_known(self, p: int, known: Dict[int, int]) -> bool:
+        # Sans entrée constante connue, seule une porte CONST peut se replier
+        return self.ir.type[p] == GATE_CODES[GateType.CONST] or any(s in known for s in self.ir.inputs(p))
+
+    def _constant_signals(self, writers, readers) -> Dict[int, int]:
+        inputs = {int(i) for i in self.inputs}
+        # Un signal jamais écrit garde sa valeur initiale 0
+        known = {s: 0 for s in readers if s not in writers and s not in inputs}
+        pending = deque(s for s in writers if s not in inputs)
+        queued = set(pending)
+        store = GATE_CODES[GateType.STORE]
+        while pending:
+            s = pending.popleft()
+            queued.discard(s)
+            values = {eval_const_gate(self.ir[p], known) if self._reads_known(p, known) else None for p in writers[s]}
+            if len(values) != 1:
+                continue
+            v = values.pop()
+            if v is None:
+                continue
+            if v != 0:
+                # Avant la première écriture, le signal vaut encore 0
+                first = next((p for p in writers[s] if self.ir.enabled_if[p] == -1), None)
+                if first is None or any(r <= first for r in readers.get(s, ())):
+                    continue
+            known[s] = v
+            for r in readers.get(s, ()):
+                out = self.ir.output[r]
+                if self.ir.type[r] != store and out not in known and out not in queued and out not in inputs:
+                    pending.append(out)
+                    queued.add(out)
+        return known
+
+    def _simplify_gate(self, p: int, g: GateIR, known: Dict[int, int], writers) -> bool:
+        if g.type in (GateType.CONST, GateType.LOAD, GateType.STORE):
+            return False
+        value = eval_const_gate(g, known)
+        if value is not None:
+            g.type = GateType.CONST
+            g.const_value = value
+            g.size = max(g.size, value.bit_length())
+            g.input1 = g.input2 = g.input3 = 0
+            return True
+
+        mask = (1 << g.size) - 1
+        if g.type in BINARY_GATES or g.type == GateType.ADD:
+            for const_in, other in ((g.input1, g.input2), (g.input2, g.input1)):
+                c = known.get(const_in)
+                if c is None:
+                    continue
+                c &= mask
+                new_type = IDENTITY_ZERO.get(g.type) if c == 0 else IDENTITY_ONES.get(g.type) if c == mask else None
+                if new_type:
+                    g.type = new_type
+                    g.input1, g.input2 = other, 0
+                    return True
+
+        elif g.type == GateType.MUX and g.input1 in known:
+            g.input1 = g.input3 if known[g.input1] else g.input2
+            g.type = GateType.BUF
+            g.input2 = g.input3 = 0
+            return True
+
+        elif g.type == GateType.NOT:
+            # NOT(NOT x) -> BUF x, si x et la condition n'ont pas changé entre les deux
+            ws = writers.get(g.input1, ())
+            if len(ws) == 1 and ws[0] < p:
+                q = ws[0]
+                inner = self.ir[q]
+                # T = NOT T bascule : T a changé entre les deux, la porte interne l'écrit
+                if (inner.type == GateType.NOT and inner.size == g.size and inner.output != inner.input1
+                        and inner.enabled_if in (-1, g.enabled_if)
+                        and not self._written_between(inner.input1, q, p, writers)
+                        and (inner.enabled_if == -1 or not self._written_between(inner.enabled_if, q, p, writers))):
+                    g.type = GateType.BUF
+                    g.input1 = inner.input1
+                    return True
+        return False
+
+    def fold_constants(self) -> int:
+        writers, readers = self._dataflow()
+        known = self._constant_signals(writers, readers)
+        changed = 0
+        kept = []
+        for p, g in enumerate(self.ir):
+            if g.enabled_if in known:
+                changed += 1
+                if known[g.enabled_if] == 0:
+                    continue  # bloc GHOST jamais actif
+                g.enabled_if = -1
+            if (g.type == GateType.NOT or self._reads_known(p, known)) and self._simplify_gate(p, g, known, writers):
+                changed += 1
+            kept.append(p)
+        self.ir = self.ir.select(kept)
+        return changed
+
+    def eliminate_dead_gates(self) -> int:
+        roots = {int(o) for o in self.outputs}
+        stores = [p for p, code in enumerate(self.ir.type) if code == GATE_CODES[GateType.STORE]]
+        if not roots and not stores:
+            return 0  # rien d'observable : on garde la netlist telle quelle
+        writers, _ = self._dataflow()
+        live = [False] * len(self.ir)
+        live_signals = set()
+        stack = []
+
+        def mark(p: int):
+            enabled_if = self.ir.enabled_if[p]
+            for s in self.ir.inputs(p) + ([enabled_if] if enabled_if >= 0 else []):
+                if s not in live_signals:
+                    live_signals.add(s)
+                    stack.append(s)
 
-    def compile_netlist(self, lines: List[str]) -> List[GateIR]:
-        self.signal_table.clear()
+        for s in roots:
+            live_signals.add(s)
+            stack.append(s)
+        for p in stores:
+            live[p] = True
+            mark(p)
+        while stack:
+            for p in writers.get(stack.pop(), ()):
+                if not live[p]:
+                    live[p] = True
+                    mark(p)
+
+        removed = live.count(False)
+        self.ir = self.ir.select(p for p, alive in enumerate(live) if alive)
+        return removed
+
+    def _signal_widths(self, writers) -> Dict[int, int]:
+        # Nombre de bits que chaque signal peut réellement occuper, par point fixe
+        widths = defaultdict(int)
+        for index, size in enumerate(self.signal_table.sizes):
+            if index not in writers:
+                widths[index] = size
+        ir = self.ir
+        rows = [(GATE_NAMES[code], out, a, b, c, size, const)
+                for code, out, a, b, c, size, const in zip(ir.type, ir.output, ir.input1, ir.input2, ir.input3, ir.size, ir.const_value)
+                if code != GATE_CODES[GateType.STORE]]
+        changed = True
+        while changed:
+            changed = False
+            for t, out, a, b, c, size, const in rows:
+                wa, wb, wc = widths[a], widths[b], widths[c]
+                if t == GateType.CONST:
+                    w = (const & ((1 << size) - 1)).bit_length()
+                elif t == GateType.AND:
+                    w = min(wa, wb, size)
+                elif t in (GateType.OR, GateType.XOR):
+                    w = min(max(wa, wb), size)
+                elif t == GateType.MUX:
+                    w = min(max(wb, wc), size)
+                elif t == GateType.BUF:
+                    w = min(wa, size)
+                elif t == GateType.INDEX:
+                    w = 1
+                elif t == GateType.CONCAT:
+                    w = min(max(wa + const, wb), 64)
+                elif t == GateType.ROM:
+                    w = ROM_EL_SIZE
+                else:
+                    w = size
+                if w > widths[out]:
+                    widths[out] = w
+                    changed = True
+        return widths
+
+    def propagate_copies(self) -> int:
+        # Les lecteurs de DST = BUF SRC lisent directement SRC quand SRC n'a pas
+        # été réécrit entre la copie et la lecture. Pour une lecture placée
+        # avant la copie (rétroaction d'un registre), l'intervalle fait le tour
+        # du cycle. Seules les copies qui portent un état réel survivent.
+        writers, readers = self._dataflow()
+        widths = self._signal_widths(writers)
+        inputs = {int(i) for i in self.inputs}
+        n = len(self.ir)
+        changed = 0
+
+        for q, g in enumerate(self.ir):
+            if g.type != GateType.BUF:
+                continue
+            src, dst, cond = g.input1, g.output, g.enabled_if
+            if src == dst or len(writers[dst]) != 1 or widths[src] > g.size:
+                continue
+            for r in readers.get(dst, ()):
+                if cond != -1:
+                    # Copie dans un GHOST : seulement vers un lecteur du même bloc
+                    valid = (r > q and self.ir[r].enabled_if == cond
+                             and not self._written_between(cond, q, r, writers)
+                             and not self._written_between(src, q, r, writers))
+                elif r > q:
+                    valid = not self._written_between(src, q, r, writers)
+                elif r < q:
+                    valid = (src not in inputs
+                             and not self._written_between(src, q, n, writers)
+                             and not self._written_between(src, -1, r, writers))
+                else:
+                    valid = False
+                reader = self.ir[r]
+                if valid and dst in gate_inputs(reader):
+                    rename_gate_inputs(reader, {dst: src})
+                    changed += 1
+
+        # DST = BUF DST ne fait rien
+        writers, _ = self._dataflow()
+        widths = self._signal_widths(writers)
+        kept = [p for p, g in enumerate(self.ir)
+                if not (g.type == GateType.BUF and g.input1 == g.output and widths[g.output] <= g.size)]
+        changed += len(self.ir) - len(kept)
+        self.ir = self.ir.select(kept)
+        return changed
+
+    def merge_equivalent_gates(self) -> int:
+        # Hash-consing : deux portes de même type, mêmes entrées (au même
+        # instant du cycle), même taille et même condition calculent la même
+        # valeur ; la seconde est supprimée et ses lecteurs lisent la première.
+        writers, readers = self._dataflow()
+        protected = {int(i) for i in self.inputs} | {int(o) for o in self.outputs}
+        protected |= {e for e in self.ir.enabled_if if e >= 0}
+        version = defaultdict(int)  # nombre d'écritures déjà vues par signal
+        table = {}
+        rename = {}
+        removed = set()
+
+        ir = self.ir
+        for q, (code, out, size, enabled_if) in enumerate(zip(ir.type, ir.output, ir.size, ir.enabled_if)):
+            t = GATE_NAMES[code]
+            if t not in (GateType.LOAD, GateType.STORE) and len(writers[out]) == 1:
+                operands = [(rename.get(s, s), version[rename.get(s, s)]) for s in ir.inputs(q)]
+                if t in COMMUTATIVE_GATES:
+                    operands.sort()
+                const_value = ir.const_value[q] if ir.has_const[q] else None
+                key = (t, tuple(operands), size, const_value, enabled_if, version[enabled_if])
+                p = table.get(key)
+                if p is None:
+                    table[key] = q
+                elif out not in protected and all(r <= p or r > q for r in readers.get(out, ())):
+                    rename[out] = ir.output[p]
+                    removed.add(q)
+                    continue
+            if t != GateType.STORE:
+                version[out] += 1
+
+        if not removed:
+            return 0
+        kept = []
+        for q, g in enumerate(self.ir):
+            if q not in removed:
+                rename_gate_inputs(g, rename)
+                kept.append(q)
+        self.ir = self.ir.select(kept)
+        return len(removed)
+
+    # === Reconnaissance d'opérateurs arithmétiques ===
+    #
+    # Les additionneurs à propagation de retenue et les multiplieurs en
+    # tableau écrits porte par porte sont remplacés par une porte ADD ou MUL
+    # sur le mot entier. Un motif n'est accepté que si ses signaux internes
+    # ont un seul écrivain placé avant leurs lecteurs, que toutes ses portes
+    # partagent la même condition GHOST et que les opérandes ne changent pas
+    # entre le début et la fin du motif : le mot calculé d'un coup vaut alors
+    # exactement ce que la version porte à porte calculait.
+
+    def _pattern_is_safe(self, positions: set, operands, enabled_if: int, end: int, writers) -> bool:
+        internal = {self.ir[p].output for p in positions}
+        for p in positions:
+            g = self.ir[p]
+            if g.enabled_if not in (-1, enabled_if):
+                return False
+            if g.type != GateType.INDEX and g.enabled_if != enabled_if:
+                return False
+            for s in gate_inputs(g):
+                if s in internal and writers[s][0] >= p:
+                    return False  # lecture d'une valeur du cycle précédent
+        start = min(positions)
+        watched = set(operands) | ({enabled_if} if enabled_if >= 0 else set())
+        return not any(self._written_between(s, start - 1, end + 1, writers) for s in watched)
+
+    def _concat_bits(self, q: int, writers) -> Optional[tuple]:
+        # Bits (poids faible en premier) d'un mot bâti par une chaîne de CONCAT 1 bit
+        bits, positions = [], [q]
+        g = self.ir[q]
+        while g.const_value == 1:
+            bits.append(g.input2)
+            ws = writers.get(g.input1, ())
+            if len(ws) == 1 and self.ir[ws[0]].type == GateType.CONCAT:
+                positions.append(ws[0])
+                g = self.ir[ws[0]]
+            else:
+                bits.append(g.input1)
+                return bits, positions
+        return None
+
+    def _match_ripple_adder(self, bits: List[int], writers) -> Optional[tuple]:
+        def gate(s, *types):
+            ws = writers.get(s, ())
+            if len(ws) == 1 and self.ir[ws[0]].type in types and self.ir[ws[0]].size == 1:
+                return ws[0], self.ir[ws[0]]
+            return None, None
+
+        def operand_bits(x, i):
+            # x = XOR a[i] b[i] où a[i] et b[i] sont des INDEX sur deux mots
+            px, gx = gate(x, GateType.XOR)
+            if gx is None:
+                return None
+            pa, ga = gate(gx.input1, GateType.INDEX)
+            pb, gb = gate(gx.input2, GateType.INDEX)
+            if ga is None or gb is None or ga.const_value != i or gb.const_value != i:
+                return None
+            return px, (pa, pb), (gx.input1, gx.input2), (ga.input1, gb.input1)
+
+        positions, indexes = set(), set()
+        words = carry_in = None
+        prev = None  # (x, bits a/b, retenue) du rang précédent
+        for i, s in enumerate(bits):
+            ps, gs = gate(s, GateType.XOR)
+            if gs is None:
+                return None
+            match = None
+            for x, c in ((gs.input1, gs.input2), (gs.input2, gs.input1)):
+                ops = operand_bits(x, i)
+                if ops is None or (words is not None and sorted(ops[3]) != sorted(words)):
+                    continue
+                if prev is None:
+                    match = (x, c, ops, set())
+                    break
+                # c = OR (AND a b) (AND x c) du rang précédent
+                pc, gc = gate(c, GateType.OR)
+                if gc is None:
+                    continue
+                pl, gl = gate(gc.input1, GateType.AND)
+                pr, gr = gate(gc.input2, GateType.AND)
+                if gl is None or gr is None:
+                    continue
+                prev_ab, prev_xc = sorted(prev[1]), sorted((prev[0], prev[2]))
+                for (p1, g1), (p2, g2) in (((pl, gl), (pr, gr)), ((pr, gr), (pl, gl))):
+                    if sorted((g1.input1, g1.input2)) == prev_ab and sorted((g2.input1, g2.input2)) == prev_xc:
+                        match = (x, c, ops, {pc, p1, p2})
+                        break
+                if match:
+                    break
+            if match is None:
+                return None
+            x, c, (px, index_pos, ab, src), extra = match
+            if words is None:
+                words, carry_in = src, c
+            positions |= {ps, px} | extra
+            indexes |= set(index_pos)
+            prev = (x, ab, c)
+        return words, carry_in, positions, indexes
+
+    def _recognize_adders(self) -> int:
+        writers, readers = self._dataflow()
+        known = self._constant_signals(writers, readers)
+        widths = self._signal_widths(writers)
+        used = set()
+        before = defaultdict(list)  # position -> portes à insérer juste avant
+        changed = 0
+
+        for q, g in enumerate(self.ir):
+            if g.type != GateType.CONCAT or q in used or len(writers[g.output]) != 1:
+                continue
+            chain = self._concat_bits(q, writers)
+            if chain is None or len(chain[0]) < 2:
+                continue
+            bits, concat_pos = chain
+            match = self._match_ripple_adder(bits, writers)
+            if match is None:
+                continue
+            (a, b), carry, positions, indexes = match
+            carry_value = known.get(carry)
+            if carry_value not in (0, None) or (carry_value is None and widths[carry] > 1):
+                continue
+            pattern = positions | set(concat_pos)
+            operands = (a, b) if carry_value == 0 else (a, b, carry)
+            if pattern & used or not self._pattern_is_safe(pattern | indexes, operands, g.enabled_if, q, writers):
+                continue
+
+            n = len(bits)
+            total = self.get_or_create_signal(f"__add_{self.signal_counter}", n)
+            start = min(pattern)
+            # Les ADD prennent la provenance du mot de somme qu'ils remplacent
+            if carry_value == 0:
+                before[start].append((GateIR(0, GateType.ADD, total.index, a, b, size=n, enabled_if=g.enabled_if), g.origin))
+            else:
+                partial = self.get_or_create_signal(f"__add_{self.signal_counter}", n)
+                before[start].append((GateIR(0, GateType.ADD, partial.index, a, b, size=n, enabled_if=g.enabled_if), g.origin))
+                before[start].append((GateIR(0, GateType.ADD, total.index, partial.index, carry, size=n,
+                                             enabled_if=g.enabled_if), g.origin))
+            # Les bits de somme restent disponibles pour d'éventuels autres lecteurs
+            for i, s in enumerate(bits):
+                bit = self.ir[writers[s][0]]
+                bit.type, bit.input1, bit.input2, bit.const_value = GateType.INDEX, total.index, 0, i
+            g.type, g.input1, g.input2, g.const_value, g.size = GateType.BUF, total.index, 0, None, n
+            used |= pattern
+            changed += 1
+
+        if changed:
+            ir = GateTable()
+            for p, g in enumerate(self.ir):
+                for extra, origin in before.get(p, ()):
+                    ir.origin[ir.append(extra)] = origin
+                ir.append(g)
+            ir.id = array("i", range(len(ir)))
+            self.ir = ir
+            self.ir_id = len(ir)
+        return changed
+
+    def _multiplier_terms(self, s: int, n: int, writers, known, positions: set, terms: list) -> bool:
+        # Décompose s en somme de termes (B[k] ? A << k : 0) modulo 2^n ; une
+        # porte déjà parcourue (accumulateur ACC = ADD ACC B) n'en est pas un
+        ws = writers.get(s, ())
+        if len(ws) != 1 or ws[0] in positions:
+            return False
+        p, g = ws[0], self.ir[ws[0]]
+        if g.size < n:
+            return False
+        positions.add(p)
+        if g.type == GateType.ADD:
+            return (self._multiplier_terms(g.input1, n, writers, known, positions, terms)
+                    and self._multiplier_terms(g.input2, n, writers, known, positions, terms))
+        if g.type == GateType.BUF:
+            return self._multiplier_terms(g.input1, n, writers, known, positions, terms)
+
+        shift = 0
+        while g.type in (GateType.BUF, GateType.SUB, GateType.CONCAT):
+            if g.type == GateType.SUB and g.const_value != 0:
+                return False
+            if g.type == GateType.CONCAT:
+                if known.get(g.input2) != 0:
+                    return False
+                shift += g.const_value
+            ws = writers.get(g.input1, ())
+            if len(ws) != 1 or ws[0] in positions or self.ir[ws[0]].size < n:
+                return False
+            p, g = ws[0], self.ir[ws[0]]
+            positions.add(p)
+        if g.type != GateType.MUX or known.get(g.input2) != 0:
+            return False
+        ws = writers.get(g.input1, ())
+        if len(ws) != 1 or self.ir[ws[0]].type != GateType.INDEX:
+            return False
+        select = self.ir[ws[0]]
+        positions.add(ws[0])
+        terms.append((g.input3, select.input1, select.const_value, shift))
+        return True
+
+    def _recognize_multipliers(self) -> int:
+        writers, readers = self._dataflow()
+        known = self._constant_signals(writers, readers)
+        changed = 0
+        used = set()
+        # Du dernier ADD au premier : la somme complète est reconnue avant ses sommes partielles
+        for q in range(len(self.ir) - 1, -1, -1):
+            g = self.ir[q]
+            if g.type != GateType.ADD or q in used or len(writers[g.output]) != 1:
+                continue
+            n = g.size
+            positions, terms = set(), []
+            if not self._multiplier_terms(g.output, n, writers, known, positions, terms):
+                continue
+            a, b = terms[0][0], terms[0][1]
+            if (any(t[0] != a or t[1] != b or t[2] != t[3] for t in terms)
+                    or sorted(t[2] for t in terms) != list(range(n))):
+                continue
+            if positions & used or not self._pattern_is_safe(positions, (a, b), g.enabled_if, q, writers):
+                continue
+            g.type, g.input1, g.input2 = GateType.MUL, a, b
+            used |= positions
+            changed += 1
+        return changed
+
+    def recognize_arithmetic(self) -> int:
+        return self._recognize_adders() + self._recognize_multipliers()
+
+    # === Blocs GHOST ===
+    #
+    # Le simulateur saute d'un coup les portes dont la condition est fausse
+    # grâce à la cible skip de la première porte du bloc. Pour que ce saut
+    # couvre un maximum de portes, on regroupe les portes par condition (en
+    # respectant les dépendances) puis on calcule, pour chaque porte sous
+    # condition, la fin de la plage qui serait de toute façon inactive.
+
+    def _size_ghost_conditions(self) -> None:
+        # Le MUX d'une condition imbriquée doit laisser passer tous les bits de la condition interne
+        if not self.ghost_parent:
+            return
+        writers, _ = self._dataflow()
+        widths = self._signal_widths(writers)
+        for g in self.ir:
+            if g.type == GateType.MUX and g.output in self.ghost_parent:
+                g.size = max(1, widths[g.input3])
+
+    def _ghost_group(self, p: int) -> int:
+        # Le MUX d'une condition imbriquée appartient au bloc englobant
+        ir = self.ir
+        if ir.type[p] == GATE_CODES[GateType.MUX] and ir.enabled_if[p] == -1 and ir.output[p] in self.ghost_parent:
+            return self.ghost_parent[ir.output[p]]
+        return ir.enabled_if[p]
+
+    def schedule_ghost_blocks(self) -> int:
+        """Réordonne l'IR pour rendre contiguës les portes d'une même condition.
+
+        Seules les dépendances réelles contraignent l'ordre : lecture après
+        écriture, écriture après lecture, écritures successives d'un même
+        signal, et ordre des accès RAM (LOAD/STORE). Renvoie le nombre de
+        blocs contigus gagnés (l'ordre d'origine est gardé s'il est meilleur).
+        """
+        memory = -2
+        successors = [[] for _ in self.ir]
+        pending = [0] * len(self.ir)
+        last_writer: Dict[int, int] = {}
+        readers_since: Dict[int, List[int]] = defaultdict(list)
+
+        def depend(before: int, after: int):
+            successors[before].append(after)
+            pending[after] += 1
+
+        ir = self.ir
+        for j, (code, out, enabled_if) in enumerate(zip(ir.type, ir.output, ir.enabled_if)):
+            t = GATE_NAMES[code]
+            reads = ir.inputs(j) + ([enabled_if] if enabled_if >= 0 else [])
+            if t == GateType.LOAD:
+                reads.append(memory)
+            writes = [memory] if t == GateType.STORE else [out]
+            for s in set(reads):
+                if s in last_writer:
+                    depend(last_writer[s], j)
+                readers_since[s].append(j)
+            for s in writes:
+                for r in readers_since.pop(s, ()):
+                    if r != j:
+                        depend(r, j)
+                if s in last_writer:
+                    depend(last_writer[s], j)
+                last_writer[s] = j
+
+        children = defaultdict(list)
+        for child, parent in self.ghost_parent.items():
+            children[parent].append(child)
+
+        def parent_of(group: int) -> Optional[int]:
+            return None if group == -1 else self.ghost_parent.get(group, -1)
+
+        def descendants(group: int) -> List[int]:
+            out, stack = [], list(children.get(group, ()))
+            while stack:
+                c = stack.pop()
+                out.append(c)
+                stack.extend(children.get(c, ()))
+            return out
+
+        ready = defaultdict(list)  # groupe -> tas des positions d'origine prêtes
+        for j in range(len(self.ir)):
+            if pending[j] == 0:
+                heappush(ready[self._ghost_group(j)], j)
+
+        order = []
+        current = -1
+        while len(order) < len(self.ir):
+            # Rester dans le bloc courant, puis ses blocs imbriqués, puis remonter
+            group = current
+            chosen = None
+            while group is not None and chosen is None:
+                if ready[group]:
+                    chosen = group
+                else:
+                    nested = [c for c in (descendants(group) if group != -1 else list(ready)) if ready[c]]
+                    if nested:
+                        chosen = min(nested, key=lambda c: ready[c][0])
+                group = parent_of(group)
+            j = heappop(ready[chosen])
+            order.append(j)
+            current = chosen
+            for k in successors[j]:
+                pending[k] -= 1
+                if pending[k] == 0:
+                    heappush(ready[self._ghost_group(k)], k)
+
+        def runs(positions):
+            enabled = [self.ir.enabled_if[j] for j in positions]
+            return sum(1 for i, e in enumerate(enabled) if e >= 0 and (i == 0 or enabled[i - 1] != e))
+
+        saved = runs(range(len(self.ir))) - runs(order)
+        if saved < 0:
+            return 0
+        self.ir = self.ir.select(order)
+        return saved
+
+    def assign_skips(self) -> None:
+        """Calcule la cible skip de chaque porte sous condition.
+
+        Si la condition e de la porte i est fausse, les portes suivantes de
+        condition e, ou d'une condition imbriquée dans e dont le MUX est dans
+        la plage, seraient toutes inactives : on peut reprendre directement
+        après elles. Un MUX de condition imbriquée n'est sauté que si tous
+        ses lecteurs sont dans la plage, après lui ; une porte qui vaut
+        toujours 0 peut l'être sans condition.
+        """
+        writers, readers = self._dataflow()
+        known = self._constant_signals(writers, readers)
+        ir = self.ir
+        n = len(ir)
+        mux, store = GATE_CODES[GateType.MUX], GATE_CODES[GateType.STORE]
+        previous = None  # (condition, cible) de la porte précédente, réutilisée si même condition
+        for i, e in enumerate(ir.enabled_if):
+            if e < 0:
+                ir.skip[i] = -1
+                previous = None
+                continue
+            if previous is not None and previous[0] == e and previous[1] > i:
+                ir.skip[i] = previous[1]
+                continue
+
+            nested = set()
+            combiners = []
+            k = i
+            while k < n:
+                enabled_if, code, out = ir.enabled_if[k], ir.type[k], ir.output[k]
+                if enabled_if == e or enabled_if in nested:
+                    k += 1
+                elif (code == mux and enabled_if == -1 and known.get(ir.input2[k]) == 0
+                      and self.ghost_parent.get(out, -1) in nested | {e}):
+                    nested.add(out)
+                    combiners.append(k)
+                    k += 1
+                elif enabled_if == -1 and code != store and known.get(out) == 0:
+                    k += 1  # toujours 0, comme avant sa première évaluation
+                else:
+                    break
+            changed = True
+            while changed:
+                changed = False
+                for p in combiners:
+                    if p < k and any(r <= p or r >= k for r in readers.get(ir.output[p], ())):
+                        k = p
+                        changed = True
+            ir.skip[i] = k
+            previous = (e, k)
+
+    def optimize(self, arithmetic: bool = False) -> Dict[str, int]:
+        report = {"before": len(self.ir), "folded": 0, "arithmetic": 0, "merged": 0, "copies": 0, "dead": 0}
+        while True:
+            # Avant le repliage, qui déformerait le premier étage des additionneurs
+            arith = self.recognize_arithmetic() if arithmetic else 0
+            folded = self.fold_constants()
+            merged = self.merge_equivalent_gates()
+            copies = self.propagate_copies()
+            dead = self.eliminate_dead_gates()
+            report["folded"] += folded
+            report["arithmetic"] += arith
+            report["merged"] += merged
+            report["copies"] += copies
+            report["dead"] += dead
+            if not folded and not arith and not merged and not copies and not dead:
+                break
+        report["reordered"] = self.schedule_ghost_blocks()
+        self.ir.id = array("i", range(len(self.ir)))
+        self.ir_id = len(self.ir)
+        report["after"] = len(self.ir)
+        self.optimization_report = report
+        return report
+
+    def compile_netlist(self, lines: List[str], optimize: bool = False, arithmetic: bool = False,
+                        directory: Optional[str] = None, path: str = "<netlist>") -> GateTable:
+        # directory : base des chemins IMPORT, par défaut le dossier de path ; path : son nom dans les provenances
+        # Tables neuves : un simulateur construit sur la compilation précédente garde la sienne
+        self.signal_table = SignalTable()
         self.signal_counter = 0
-        self.ir.clear()
+        self.ir = GateTable()
         self.ir_id = 0
         self.const_cache.clear()
+        self.index_cache.clear()
         self.inputs.clear()
         self.outputs.clear()
+        self.enabled_index = -1
+        self.ghost_stack.clear()
+        self.ghost_parent.clear()
+        self.ghost_marks.clear()
+        self.instances.clear()
+        self.origins = []
+        self.origin_indexes = {}
+        self.origin_maps.clear()
 
-        for line in expand_macros(lines):
-            self.compile_line(line)
+        lines, self.modules, _ = split_modules(lines, directory, path=path)
+        self._compile_source(lines, path)
+        self._size_ghost_conditions()
         for i in range(len(self.inputs)):
             self.inputs[i] = str(self.signal_table[self.inputs[i]].index)
         for i in range(len(self.outputs)):
             self.outputs[i] = str(self.signal_table[self.outputs[i]].index)
+        if optimize or arithmetic:
+            self.optimize(arithmetic)
+        self.assign_skips()
         return self.ir
 
-    def generate_ir_string(self, lines: List[str]) -> str:
-        self.compile_netlist(lines)
+    def generate_ir_string(self, lines: List[str], optimize: bool = False, arithmetic: bool = False,
+                           directory: Optional[str] = None, path: str = "<netlist>") -> str:
+        self.compile_netlist(lines, optimize, arithmetic, directory, path)
         result = []
         result.append(f"# INPUTS: {', '.join(self.inputs)}")
         result.append(f"# OUTPUTS: {', '.join(self.outputs)}")
         result.append(f"# SIGNALS: {self.signal_counter}")
         for instr in self.ir:
             result.append(str(instr))
-        return "\n".join(result)+"\n"
\ No newline at end of file
+        return "\n".join(result)+"\n"
+
+    def fanout_table(self):
+        # Pour chaque signal, les portes à réévaluer quand il change : celles
+        # qui le lisent (entrées ou condition GHOST) et, s'il a plusieurs
+        # écrivains, celles qui l'écrivent, pour qu'elles réimposent leur valeur.
+        writers, readers = self._dataflow()
+        offsets = [0]
+        gates = []
+        for s in range(self.signal_counter):
+            deps = set(readers.get(s, ()))
+            if len(writers.get(s, ())) > 1:
+                deps.update(writers[s])
+            gates.extend(sorted(deps))
+            offsets.append(len(gates))
+        return offsets, gates
+
+    def format_ir_binary(self, fanout: bool = True, origins: bool = True) -> bytes:
+        inputs = [int(i) for i in self.inputs]
+        outputs = [int(o) for o in self.outputs]
+        offsets, fanout_gates = self.fanout_table() if fanout else ([], [])
+        text = "\n".join(f"{path}\t{line}\t{iterations}" for path, line, iterations in self.origins).encode()
+        origins_size = 8 + 4 * len(self.ir) + (len(text) + 3) // 4 * 4 if origins else 0
+        out = bytearray(IR_HEADER.size + 4 * (len(inputs) + len(outputs)) + IR_GATE.size * len(self.ir)
+                        + 4 * (len(offsets) + len(fanout_gates)) + origins_size)
+        flags = (IR_FLAG_FANOUT if fanout else 0) | (IR_FLAG_ORIGINS if origins else 0)
+        IR_HEADER.pack_into(out, 0, IR_MAGIC, IR_VERSION, flags, self.signal_counter,
+                            len(inputs), len(outputs), len(self.ir))
+        offset = IR_HEADER.size
+        struct.pack_into(f"<{len(inputs)}i", out, offset, *inputs)
+        offset += 4 * len(inputs)
+        struct.pack_into(f"<{len(outputs)}i", out, offset, *outputs)
+        offset += 4 * len(outputs)
+        ir = self.ir
+        for row in zip(ir.id, ir.type, ir.has_const, ir.size, ir.output, ir.input1, ir.input2, ir.input3,
+                       ir.enabled_if, ir.const_value, ir.skip):
+            IR_GATE.pack_into(out, offset, *row[:9], row[9] & 0xFFFFFFFF, row[10])
+            offset += IR_GATE.size
+        if fanout:
+            struct.pack_into(f"<{len(offsets)}i", out, offset, *offsets)
+            offset += 4 * len(offsets)
+            struct.pack_into(f"<{len(fanout_gates)}i", out, offset, *fanout_gates)
+            offset += 4 * len(fanout_gates)
+        if origins:
+            struct.pack_into("<ii", out, offset, len(self.origins), len(text))
+            offset += 8
+            struct.pack_into(f"<{len(self.ir)}i", out, offset, *self.ir.origin)
+            offset += 4 * len(self.ir)
+            out[offset:offset + len(text)] = text
+        return bytes(out)
+
+    def generate_ir_binary(self, lines: List[str], optimize: bool = False, arithmetic: bool = False,
+                           directory: Optional[str] = None, path: str = "<netlist>") -> bytes:
+        self.compile_netlist(lines, optimize, arithmetic, directory, path)
+        return self.format_ir_binary()
+    # === Génération de code C ===
+    #
+    # Toute l'IR devient une seule fonction C, netlist_step, qui évalue un
+    # cycle : plus de boucle, plus de switch, plus de décodage d'Instruction.
+    # Masques, constantes et décalages INDEX/SUB/CONCAT sont écrits en dur,
+    # et les sauts GHOST de jump_table deviennent des goto. Une condition
+    # déjà testée n'est pas retestée tant qu'aucune porte ne l'a réécrite.
+    # Les calculs suivent eval_gate dans simulator.c (int 32 bits) ; seuls
+    # les décalages de 32 bits ou plus, indéfinis en C, donnent 0.
+
+    @staticmethod
+    def _c_int(value: int) -> str:
+        value &= 0xFFFFFFFF
+        return str(value) if value < 0x80000000 else f"(int){value:#x}u"
+
+    def _c_statement(self, p: int) -> str:
+        ir = self.ir
+        t = GATE_NAMES[ir.type[p]]
+        o, k, size = ir.output[p], ir.const_value[p], ir.size[p]
+        a, b, c = f"s[{ir.input1[p]}]", f"s[{ir.input2[p]}]", f"s[{ir.input3[p]}]"
+
+        def masked(expr: str) -> str:
+            if size >= 32:
+                return expr
+            # Sans parenthèses, "s[a] | s[b] & m" ne masquerait que s[b]
+            return f"{expr if C_SIGNAL_RE.fullmatch(expr) else f'({expr})'} & {(1 << size) - 1:#x}"
+
+        def shifted(expr: str, shift: int) -> str:
+            return expr if shift == 0 else f"{expr} >> {shift}" if shift < 32 else "0"
+
+        if t == GateType.STORE:
+            return f"store({a}, {masked(b)});"
+        if t == GateType.AND:
+            value = masked(f"{a} & {b}")
+        elif t == GateType.OR:
+            value = masked(f"{a} | {b}")
+        elif t == GateType.XOR:
+            value = masked(f"{a} ^ {b}")
+        elif t == GateType.NAND:
+            value = masked(f"~({a} & {b})")
+        elif t == GateType.NOR:
+            value = masked(f"~({a} | {b})")
+        elif t == GateType.NXOR:
+            value = masked(f"~({a} ^ {b})")
+        elif t == GateType.NOT:
+            value = masked(f"~{a}")
+        elif t == GateType.CONST:
+            value = self._c_int(k & ((1 << size) - 1))
+        elif t == GateType.MUX:
+            value = masked(f"{a} ? {c} : {b}")
+        elif t == GateType.CONCAT:
+            value = f"(int)((unsigned){a} << {k}) | {b}" if k < 32 else b
+        elif t == GateType.INDEX:
+            value = f"({shifted(a, k)}) & 1"
+        elif t == GateType.SUB:
+            value = masked(shifted(a, k))
+        elif t == GateType.BUF:
+            value = masked(a)
+        elif t == GateType.LOAD:
+            value = masked(f"ram[{a}]")
+        elif t == GateType.ROM:
+            value = f"rom[{a}]"
+        elif t == GateType.ADD:
+            value = masked(f"(int)((unsigned){a} + (unsigned){b})")
+        elif t == GateType.SUBTRACT:
+            value = masked(f"(int)((unsigned){a} - (unsigned){b})")
+        elif t == GateType.MUL:
+            value = masked(f"(int)((unsigned){a} * (unsigned){b})")
+        elif t == GateType.EQ:
+            value = f"{a} == {b}"
+        else:
+            raise ValueError(f"Type de porte non supporté par le backend C : {t}")
+        return f"s[{o}] = {value};"
+
+    def format_c_step(self) -> str:
+        ir = self.ir
+        n = len(ir)
+        jumps = build_jump_table(ir)
+        targets = {jumps[p] for p in range(n) if ir.enabled_if[p] >= 0 and jumps[p] != p + 1}
+        out = [
+            "/* Généré par netlist_compiler.py (format_c_step) : un cycle de la netlist.",
+            "   cc -O2 -shared -fPIC fichier.c -o fichier.so, puis simulateur --step fichier.so */",
+            "",
+            f"const int netlist_signal_count = {self.signal_counter};",
+            f"const int netlist_gate_count = {n};",
+            "",
+            "void netlist_step(int* restrict s, int* ram, const int* rom, void (*store)(int, int)) {",
+        ]
+        known = -1  # condition vraie à coup sûr à cet endroit
+        for p in range(n):
+            if p in targets:
+                out.append(f"L{p}:")
+                known = -1  # on peut arriver ici par un saut
+            statement = self._c_statement(p)
+            condition = ir.enabled_if[p]
+            if condition < 0 or condition == known:
+                out.append(f"    {statement}")
+            elif jumps[p] == p + 1:
+                out.append(f"    if (s[{condition}]) {statement}")
+            else:
+                out.append(f"    if (!s[{condition}]) goto L{jumps[p]};")
+                out.append(f"    {statement}")
+                known = condition
+            if ir.output[p] == known:
+                known = -1
+        if n in targets:
+            out.append(f"L{n}: ;")
+        out.append("}")
+        return "\n".join(out) + "\n"
+
+    def generate_c_step(self, lines: List[str], optimize: bool = False, arithmetic: bool = False,
+                        directory: Optional[str] = None, path: str = "<netlist>") -> str:
+        self.compile_netlist(lines, optimize, arithmetic, directory, path)
+        return self.format_c_step()
+
+    # === Génération de code Python ===
+    #
+    # Même idée que format_c_step, pour la simulation en Python : un cycle
+    # devient une fonction step(state, ram, rom) avec un local par signal,
+    # masques et constantes en dur. Seuls les signaux qui passent d'un cycle
+    # à l'autre (lus avant toute écriture inconditionnelle : registres,
+    # portes de blocs GHOST) sont lus dans state puis réécrits ; les autres
+    # y gardent une valeur quelconque. Les sauts GHOST deviennent des blocs
+    # if imbriqués ; un saut qui dépasserait le bloc englobant est coupé à
+    # sa fin et sa suite gardée par un drapeau. Les calculs suivent
+    # CycleSimulator.step (entiers Python), qui sert de référence ; un
+    # masque est omis quand les entrées tiennent déjà dans la taille.
+
+    def _signal_bits(self) -> List[float]:
+        # Nombre de bits que peut occuper chaque signal (inf : inconnu)
+        ir = self.ir
+        bits = [-1.0] * max(self.signal_counter, 1)
+        for p in range(len(ir)):
+            t = GATE_NAMES[ir.type[p]]
+            if t == GateType.STORE:
+                continue
+            if t in (GateType.INDEX, GateType.EQ):
+                width = 1.0
+            elif t in (GateType.CONCAT, GateType.ROM):
+                width = float("inf")  # ni l'un ni l'autre n'est masqué
+            else:
+                width = float(ir.size[p])
+            bits[ir.output[p]] = max(bits[ir.output[p]], width)
+        # Un signal qu'aucune porte n'écrit garde la valeur qu'on lui a donnée
+        return [float("inf") if width < 0 else width for width in bits]
+
+    def _python_statement(self, p: int, bits: List[float]) -> str:
+        ir = self.ir
+        t = GATE_NAMES[ir.type[p]]
+        o, k, size = ir.output[p], ir.const_value[p], ir.size[p]
+        mask = (1 << size) - 1
+        a, b, c = f"s{ir.input1[p]}", f"s{ir.input2[p]}", f"s{ir.input3[p]}"
+        width_a, width_b, width_c = bits[ir.input1[p]], bits[ir.input2[p]], bits[ir.input3[p]]
+
+        def shifted(expr: str) -> str:
+            return f"({expr} >> {k})" if k else expr
+
+        def masked(expr: str, width: float) -> str:
+            return expr if width <= size else f"({expr}) & {mask:#x}"
+
+        if t == GateType.STORE:
+            return f"v = {b} & {mask:#x}; ram[{a}] = v; stores.append(({a}, v))"
+        if t == GateType.AND:
+            value = masked(f"{a} & {b}", min(width_a, width_b))
+        elif t == GateType.OR:
+            value = masked(f"{a} | {b}", max(width_a, width_b))
+        elif t == GateType.XOR:
+            value = masked(f"{a} ^ {b}", max(width_a, width_b))
+        elif t == GateType.NAND:
+            value = f"~({a} & {b}) & {mask:#x}"
+        elif t == GateType.NOR:
+            value = f"~({a} | {b}) & {mask:#x}"
+        elif t == GateType.NXOR:
+            value = f"~({a} ^ {b}) & {mask:#x}"
+        elif t == GateType.NOT:
+            value = f"~{a} & {mask:#x}"
+        elif t == GateType.CONST:
+            value = str(k & mask)
+        elif t == GateType.MUX:
+            value = masked(f"{c} if {a} else {b}", max(width_b, width_c))
+        elif t == GateType.CONCAT:
+            value = f"({a} << {k}) | {b}"
+        elif t == GateType.INDEX:
+            value = f"{shifted(a)} & 1"
+        elif t == GateType.SUB:
+            value = masked(shifted(a), width_a - k)
+        elif t == GateType.BUF:
+            value = masked(a, width_a)
+        elif t == GateType.LOAD:
+            value = f"ram[{a}] & {mask:#x}"
+        elif t == GateType.ROM:
+            value = f"rom[{a}]"
+        elif t == GateType.ADD:
+            value = f"({a} + {b}) & {mask:#x}"
+        elif t == GateType.SUBTRACT:
+            value = f"({a} - {b}) & {mask:#x}"
+        elif t == GateType.MUL:
+            value = f"({a} * {b}) & {mask:#x}"
+        elif t == GateType.EQ:
+            value = f"1 if {a} == {b} else 0"
+        else:
+            raise ValueError(f"Type de porte non supporté par le backend Python : {t}")
+        return f"s{o} = {value}"
+
+    def format_python_step(self) -> str:
+        ir = self.ir
+        n = len(ir)
+        jumps = build_jump_table(ir)
+        bits = self._signal_bits()
+        body = []
+        state = set()  # signaux lus avant d'avoir été écrits
+        written = [set()]  # signaux écrits, au niveau de la fonction puis dans chaque bloc ouvert
+        flags = []
+        blocks = []  # fin de chaque bloc if ouvert, du plus externe au plus interne
+        pending = defaultdict(list)  # début -> (fin, drapeau) des suites de sauts coupés
+
+        def open_block(guard: str, skip: str, end: int) -> None:
+            # guard : condition d'exécution du bloc ; skip : son contraire
+            if blocks and end > blocks[-1]:
+                if not skip.startswith("j"):
+                    flag = f"j{len(flags)}"
+                    flags.append(flag)
+                    body.append("    " * len(blocks) + f"    {flag} = {skip}")
+                    guard, skip = f"not {flag}", flag
+                pending[blocks[-1]].append((end, skip))
+                end = blocks[-1]
+            body.append("    " * len(blocks) + f"    if {guard}:")
+            blocks.append(end)
+            written.append(set())
+
+        known = -1  # condition vraie à coup sûr à cet endroit
+        for p in range(n):
+            while blocks and blocks[-1] <= p:
+                blocks.pop()
+                written.pop()
+                known = -1
+            for end, flag in sorted(pending.pop(p, []), reverse=True):
+                open_block(f"not {flag}", flag, end)
+            statement = self._python_statement(p, bits)
+            condition = ir.enabled_if[p]
+            reads = {int(i) for i in re.findall(r"\bs(\d+)", statement.split(" = ", 1)[1])}
+            if condition >= 0:
+                reads.add(condition)
+            state |= {i for i in reads if not any(i in w for w in written)}
+            indent = "    " * len(blocks) + "    "
+            if condition < 0 or condition == known:
+                body.append(indent + statement)
+                if GATE_NAMES[ir.type[p]] != GateType.STORE:
+                    written[-1].add(ir.output[p])
+            elif jumps[p] == p + 1:
+                body.append(indent + f"if s{condition}: {statement}")
+            else:
+                open_block(f"s{condition}", f"not s{condition}", jumps[p])
+                body.append("    " * len(blocks) + "    " + statement)
+                if GATE_NAMES[ir.type[p]] != GateType.STORE:
+                    written[-1].add(ir.output[p])
+                known = condition
+            if ir.output[p] == known:
+                known = -1
+
+        # Retournent dans state : les signaux gardés d'un cycle à l'autre et les
+        # sorties déclarées (OUTPUT). Une sortie écrite seulement sous condition
+        # est aussi lue au début, pour garder sa valeur. Les autres signaux
+        # restent locaux : tous les recopier divise le débit par trois.
+        assigned = {ir.output[p] for p in range(n) if GATE_NAMES[ir.type[p]] != GateType.STORE}
+        outputs = state & assigned | {int(o) for o in self.outputs} & assigned
+        state |= outputs - written[0]
+        out = [
+            "# Généré par netlist_compiler.py (format_python_step) : un cycle de la netlist.",
+            f"SIGNAL_COUNT = {self.signal_counter}",
+            f"GATE_COUNT = {n}",
+            "",
+            "",
+            "def step(state, ram, rom):",
+            "    stores = []",
+        ]
+        out += [f"    s{i} = state[{i}]" for i in sorted(state)]
+        out += [f"    {flag} = False" for flag in flags]
+        out += body
+        out += [f"    state[{i}] = s{i}" for i in sorted(outputs)]
+        out.append("    return stores")
+        return "\n".join(out) + "\n"
+
+    def generate_python_step(self, lines: List[str], optimize: bool = False, arithmetic: bool = False,
+                             directory: Optional[str] = None, path: str = "<netlist>") -> str:
+        self.compile_netlist(lines, optimize, arithmetic, directory, path)
+        return self.format_python_step()
@@ -0,0 +1,505 @@
+import ctypes
+import hashlib
+import os
+import subprocess
+import tempfile
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from netlist_compiler import GATE_NAMES, GateIR, GateTable, GateType, NetlistCompiler, Signal, build_jump_table
+
+RAM_SIZE = 65536
+ROM_SIZE = 65536
+
+# === Moteur vectorisé ===
+#
+# Chaque signal est une ligne d'une matrice (nb_signaux, nb_vecteurs) : une
+# porte de l'IR devient une seule opération NumPy appliquée à tous les
+# vecteurs de test en même temps. Les portes sont évaluées dans l'ordre de
+# l'IR, exactement comme la boucle de simulator.c.
+
+DEFAULT_CHUNK_SIZE = 1 << 14
+
+
+def _mask(size: int) -> np.uint64:
+    return np.uint64((1 << size) - 1)
+
+
+class VectorSimulator:
+    def __init__(self, compiler: NetlistCompiler, rom: Optional[np.ndarray] = None):
+        self.ir: GateTable = compiler.ir
+        self.signal_count = compiler.signal_counter
+        by_index = {sig.index: sig for sig in compiler.signal_table.values()}
+        self.inputs: Dict[str, Signal] = {}
+        for index in compiler.inputs:
+            sig = by_index[int(index)]
+            self.inputs[sig.name] = sig
+        self.outputs: Dict[str, Signal] = {}
+        for index in compiler.outputs:
+            sig = by_index[int(index)]
+            self.outputs[sig.name] = sig
+        self.rom = None if rom is None else np.asarray(rom, dtype=np.uint64)
+
+        for gate in self.ir:
+            if gate.type in (GateType.LOAD, GateType.STORE):
+                raise ValueError(f"Porte {gate.type} non supportée par le moteur vectorisé (netlist non combinatoire)")
+            if gate.type == GateType.ROM and self.rom is None:
+                raise ValueError("La netlist lit la ROM : fournir le contenu de la ROM au simulateur")
+
+        self._signals: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_file(cls, path: str, rom: Optional[np.ndarray] = None) -> "VectorSimulator":
+        with open(path, 'r') as f:
+            lines = f.readlines()
+        compiler = NetlistCompiler()
+        compiler.compile_netlist(lines, path=path)
+        return cls(compiler, rom)
+
+    def _buffer(self, width: int) -> np.ndarray:
+        # La matrice est réutilisée d'un paquet à l'autre pour borner la mémoire
+        if self._signals is None or self._signals.shape[1] != width:
+            self._signals = np.zeros((self.signal_count, width), dtype=np.uint64)
+        else:
+            self._signals.fill(0)
+        return self._signals
+
+    def _eval_gate(self, gate: GateIR, s: np.ndarray) -> Optional[np.ndarray]:
+        t = gate.type
+        mask = _mask(gate.size)
+        a = s[gate.input1]
+        b = s[gate.input2]
+
+        if t == GateType.AND:
+            return a & b & mask
+        if t == GateType.OR:
+            return (a | b) & mask
+        if t == GateType.XOR:
+            return (a ^ b) & mask
+        if t == GateType.NAND:
+            return ~(a & b) & mask
+        if t == GateType.NOR:
+            return ~(a | b) & mask
+        if t == GateType.NXOR:
+            return ~(a ^ b) & mask
+        if t == GateType.NOT:
+            return ~a & mask
+        if t == GateType.CONST:
+            return np.full(s.shape[1], gate.const_value & ((1 << gate.size) - 1), dtype=np.uint64)
+        if t == GateType.MUX:
+            return np.where(a != 0, s[gate.input3], b) & mask
+        if t == GateType.CONCAT:
+            return (a << np.uint64(gate.const_value)) | b
+        if t == GateType.INDEX:
+            return (a >> np.uint64(gate.const_value)) & np.uint64(1)
+        if t == GateType.SUB:
+            return (a >> np.uint64(gate.const_value)) & mask
+        if t == GateType.BUF:
+            return a & mask
+        if t == GateType.ROM:
+            return self.rom[np.minimum(a, len(self.rom) - 1)]
+        # uint64 : les débordements bouclent, le masque ramène modulo 2^size
+        if t == GateType.ADD:
+            return (a + b) & mask
+        if t == GateType.SUBTRACT:
+            return (a - b) & mask
+        if t == GateType.MUL:
+            return (a * b) & mask
+        if t == GateType.EQ:
+            return (a == b).astype(np.uint64)
+        raise ValueError(f"Type de porte inconnu : {t}")
+
+    def run(self, inputs: Dict[str, np.ndarray], cycles: int = 1) -> np.ndarray:
+        """Évalue l'IR sur un paquet de vecteurs et renvoie la matrice des signaux."""
+        width = len(next(iter(inputs.values()))) if inputs else 1
+        s = self._buffer(width)
+        for name, values in inputs.items():
+            if name not in self.inputs:
+                raise KeyError(f"Entrée inconnue : {name}")
+            s[self.inputs[name].index] = np.asarray(values, dtype=np.uint64)
+
+        for _ in range(cycles):
+            for gate in self.ir:
+                if gate.enabled_if >= 0:
+                    enabled = s[gate.enabled_if] != 0
+                    if not enabled.any():
+                        continue
+                    result = self._eval_gate(gate, s)
+                    if not enabled.all():
+                        result = np.where(enabled, result, s[gate.output])
+                else:
+                    result = self._eval_gate(gate, s)
+                s[gate.output] = result
+        return s
+
+    def evaluate(self, inputs: Dict[str, np.ndarray], cycles: int = 1) -> Dict[str, np.ndarray]:
+        s = self.run(inputs, cycles)
+        return {name: s[sig.index].copy() for name, sig in self.outputs.items()}
+
+
+# === Génération des vecteurs de test par paquets ===
+
+def iter_exhaustive(sizes: Dict[str, int], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, np.ndarray]]]:
+    """Parcourt toutes les combinaisons d'entrées, un paquet de chunk_size vecteurs à la fois.
+
+    Le numéro de vecteur k est découpé en champs de bits : la première entrée
+    occupe les bits de poids faible, la suivante les bits au-dessus, etc.
+    """
+    total_bits = sum(sizes.values())
+    if total_bits > 63:
+        raise ValueError(f"Espace d'entrée trop grand pour un parcours exhaustif : {total_bits} bits")
+    total = 1 << total_bits
+    stop = total if stop is None else min(stop, total)
+
+    for base in range(start, stop, chunk_size):
+        counter = np.arange(base, min(base + chunk_size, stop), dtype=np.uint64)
+        values = {}
+        offset = 0
+        for name, size in sizes.items():
+            values[name] = (counter >> np.uint64(offset)) & _mask(size)
+            offset += size
+        yield base, values
+
+
+def iter_random(sizes: Dict[str, int], count: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                seed: int = 0) -> Iterator[Tuple[int, Dict[str, np.ndarray]]]:
+    rng = np.random.default_rng(seed)
+    for base in range(0, count, chunk_size):
+        width = min(chunk_size, count - base)
+        values = {name: rng.integers(0, 1 << size, width, dtype=np.uint64) for name, size in sizes.items()}
+        yield base, values
+
+
+# === Vérification ===
+
+Reference = Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]
+
+
+def verify(sim: VectorSimulator, reference: Reference,
+           vectors: Iterator[Tuple[int, Dict[str, np.ndarray]]]) -> Optional[dict]:
+    """Compare les sorties de la netlist à une fonction de référence vectorisée.
+
+    Renvoie None si tout concorde, sinon le premier vecteur fautif.
+    """
+    for _, values in vectors:
+        got = sim.evaluate(values)
+        expected = reference(values)
+        for name, exp in expected.items():
+            exp = np.asarray(exp, dtype=np.uint64) & _mask(sim.outputs[name].size)
+            bad = np.nonzero(got[name] != exp)[0]
+            if len(bad):
+                k = int(bad[0])
+                return {
+                    "inputs": {n: int(v[k]) for n, v in values.items()},
+                    "output": name,
+                    "got": int(got[name][k]),
+                    "expected": int(exp[k]),
+                }
+    return None
+
+
+def verify_exhaustive(sim: VectorSimulator, reference: Reference,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE, start: int = 0,
+                      stop: Optional[int] = None) -> Optional[dict]:
+    sizes = {name: sig.size for name, sig in sim.inputs.items()}
+    return verify(sim, reference, iter_exhaustive(sizes, chunk_size, start, stop))
+
+
+# === Simulation cycle par cycle ===
+#
+# Équivalent Python de la boucle de simulator.c : RAM, ROM, STORE et sauts de
+# blocs GHOST compris. Lent (une dispatch par porte), mais sert de référence
+# pour vérifier que les passes d'optimisation ne changent pas le comportement.
+
+def map_rom(path: str) -> np.ndarray:
+    """ROM binaire (.bin, uint32 little-endian) projetée en mémoire, sans copie."""
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype="<u4")
+    return np.memmap(path, dtype="<u4", mode="r")
+
+
+def load_rom(path: str) -> List[int]:
+    if path.endswith(".bin"):
+        rom = map_rom(path)[:ROM_SIZE].tolist()
+    else:
+        rom = []
+        with open(path, 'r') as f:
+            for line in f:
+                bits = ''.join(c for c in line if c in '01')[:32]
+                rom.append(int(bits, 2) if bits else 0)
+    return rom + [0] * (ROM_SIZE - len(rom))
+
+
+class CycleSimulator:
+    def __init__(self, ir, signal_count: int, rom: List[int]):
+        # ir : GateTable, ou toute séquence de GateIR
+        table = ir if isinstance(ir, GateTable) else GateTable.from_gates(ir)
+        # Une ligne par porte, lue directement dans les colonnes de l'IR
+        self.ir = [(GATE_NAMES[code], enabled_if, out, a, b, c, (1 << size) - 1, const)
+                   for code, enabled_if, out, a, b, c, size, const
+                   in zip(table.type, table.enabled_if, table.output, table.input1, table.input2, table.input3,
+                          table.size, table.const_value)]
+        self.jump_table = build_jump_table(table)
+        self.signals = [0] * max(signal_count, 1)
+        self.ram = [0] * RAM_SIZE
+        self.ram[0] = 1
+        self.rom = rom
+        self.cycles = 0
+
+    @classmethod
+    def from_compiler(cls, compiler: NetlistCompiler, rom: List[int]) -> "CycleSimulator":
+        return cls(compiler.ir, compiler.signal_counter, rom)
+
+    def step(self) -> List[Tuple[int, int]]:
+        """Évalue un cycle et renvoie les écritures RAM (adresse, valeur) effectuées."""
+        s = self.signals
+        ram = self.ram
+        ir = self.ir
+        jump_table = self.jump_table
+        stores = []
+        i = 0
+        n = len(ir)
+        while i < n:
+            t, enabled_if, out, in1, in2, in3, mask, const = ir[i]
+            if enabled_if >= 0 and s[enabled_if] == 0:
+                i = jump_table[i]
+                continue
+            a = s[in1]
+            if t == GateType.AND:
+                s[out] = a & s[in2] & mask
+            elif t == GateType.OR:
+                s[out] = (a | s[in2]) & mask
+            elif t == GateType.XOR:
+                s[out] = (a ^ s[in2]) & mask
+            elif t == GateType.NAND:
+                s[out] = ~(a & s[in2]) & mask
+            elif t == GateType.NOR:
+                s[out] = ~(a | s[in2]) & mask
+            elif t == GateType.NXOR:
+                s[out] = ~(a ^ s[in2]) & mask
+            elif t == GateType.NOT:
+                s[out] = ~a & mask
+            elif t == GateType.CONST:
+                s[out] = const & mask
+            elif t == GateType.MUX:
+                s[out] = (s[in3] if a else s[in2]) & mask
+            elif t == GateType.CONCAT:
+                s[out] = (a << const) | s[in2]
+            elif t == GateType.INDEX:
+                s[out] = (a >> const) & 1
+            elif t == GateType.SUB:
+                s[out] = (a >> const) & mask
+            elif t == GateType.BUF:
+                s[out] = a & mask
+            elif t == GateType.STORE:
+                value = s[in2] & mask
+                ram[a] = value
+                stores.append((a, value))
+            elif t == GateType.LOAD:
+                s[out] = ram[a] & mask
+            elif t == GateType.ROM:
+                s[out] = self.rom[a]
+            elif t == GateType.ADD:
+                s[out] = (a + s[in2]) & mask
+            elif t == GateType.SUBTRACT:
+                s[out] = (a - s[in2]) & mask
+            elif t == GateType.MUL:
+                s[out] = (a * s[in2]) & mask
+            elif t == GateType.EQ:
+                s[out] = int(a == s[in2])
+            i += 1
+        self.cycles += 1
+        return stores
+
+    def running(self) -> bool:
+        return self.ram[0] != 0
+
+    def end_frame(self) -> None:
+        # Ce que fait simulator.c quand le programme demande une image (ram[1])
+        self.ram[1] = 0
+
+
+# === Fonction de cycle Python compilée ===
+#
+# NetlistCompiler.format_python_step écrit un cycle entier sous forme d'une
+# fonction Python sans dispatch par porte. compile() ne la traite qu'une
+# fois par IR : les fonctions sont gardées par hash de l'IR binaire.
+
+_STEP_FUNCTIONS: Dict[str, Callable] = {}  # hash de l'IR -> step(state, ram, rom)
+_STEP_FUNCTIONS_MAX = 32
+
+
+def compile_python_step(compiler: NetlistCompiler) -> Callable:
+    key = hashlib.sha256(compiler.format_ir_binary(fanout=False, origins=False)).hexdigest()
+    step = _STEP_FUNCTIONS.get(key)
+    if step is None:
+        namespace = {}
+        exec(compile(compiler.format_python_step(), f"<netlist {key[:12]}>", "exec"), namespace)
+        if len(_STEP_FUNCTIONS) >= _STEP_FUNCTIONS_MAX:
+            _STEP_FUNCTIONS.clear()
+        step = _STEP_FUNCTIONS[key] = namespace["step"]
+    return step
+
+
+class CompiledCycleSimulator(CycleSimulator):
+    """CycleSimulator dont le cycle est la fonction générée par compile_python_step.
+
+    Après chaque cycle, signals contient les registres et les sorties (OUTPUT)
+    comme avec CycleSimulator, mais pas les signaux intermédiaires."""
+
+    def __init__(self, compiler: NetlistCompiler, rom: List[int]):
+        # Pas d'appel à CycleSimulator.__init__ : ni lignes d'IR ni table de sauts ici
+        self.step_function = compile_python_step(compiler)
+        self.signals = [0] * max(compiler.signal_counter, 1)
+        self.ram = [0] * RAM_SIZE
+        self.ram[0] = 1
+        self.rom = rom
+        self.cycles = 0
+
+    @classmethod
+    def from_compiler(cls, compiler: NetlistCompiler, rom: List[int]) -> "CompiledCycleSimulator":
+        return cls(compiler, rom)
+
+    def step(self) -> List[Tuple[int, int]]:
+        stores = self.step_function(self.signals, self.ram, self.rom)
+        self.cycles += 1
+        return stores
+
+
+# === Fonction de cycle C compilée ===
+#
+# NetlistCompiler.format_c_step compilée avec cc en bibliothèque partagée et
+# appelée par ctypes, comme le simulateur C avec --step. Signaux, RAM et ROM
+# sont des tableaux uint32 : les int négatifs du C s'y lisent sur 32 bits,
+# comme les entiers masqués de CycleSimulator.
+
+C_STORE = ctypes.CFUNCTYPE(None, ctypes.c_int, ctypes.c_int)
+
+
+def compile_c_step(compiler: NetlistCompiler, cc: Optional[str] = None) -> Callable:
+    cc = cc or os.environ.get("CC", "cc")
+    with tempfile.TemporaryDirectory() as tmp:
+        source, library = os.path.join(tmp, "step.c"), os.path.join(tmp, "step.so")
+        with open(source, "w") as f:
+            f.write(compiler.format_c_step())
+        subprocess.run([cc, "-O2", "-shared", "-fPIC", source, "-o", library], check=True)
+        step = ctypes.CDLL(library).netlist_step  # chargée : le fichier peut disparaître
+    step.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, C_STORE]
+    step.restype = None
+    return step
+
+
+class CStepSimulator(CycleSimulator):
+    """CycleSimulator dont le cycle est la fonction C de compile_c_step.
+
+    Comme avec CycleSimulator, tous les signaux sont à jour après chaque cycle."""
+
+    def __init__(self, compiler: NetlistCompiler, rom: List[int], cc: Optional[str] = None):
+        # Pas d'appel à CycleSimulator.__init__ : ni lignes d'IR ni table de sauts ici
+        self.step_function = compile_c_step(compiler, cc)
+        self.signals = np.zeros(max(compiler.signal_counter, 1), dtype=np.uint32)
+        self.ram = np.zeros(RAM_SIZE, dtype=np.uint32)
+        self.ram[0] = 1
+        self.rom = np.array(rom, dtype=np.uint32)
+        self.cycles = 0
+        self._stores = []
+        self._store = C_STORE(self._on_store)  # gardée : ctypes ne garde pas le callback
+
+    @classmethod
+    def from_compiler(cls, compiler: NetlistCompiler, rom: List[int]) -> "CStepSimulator":
+        return cls(compiler, rom)
+
+    def _on_store(self, address: int, value: int) -> None:
+        address, value = address & 0xFFFFFFFF, value & 0xFFFFFFFF
+        self.ram[address] = value
+        self._stores.append((address, value))
+
+    def step(self) -> List[Tuple[int, int]]:
+        self._stores = []
+        self.step_function(self.signals.ctypes.data, self.ram.ctypes.data, self.rom.ctypes.data, self._store)
+        self.cycles += 1
+        return self._stores
+
+
+def first_divergence(a: CycleSimulator, b: CycleSimulator, max_cycles: int,
+                     probes: Sequence[Tuple[int, int]] = ()) -> Optional[int]:
+    """Exécute deux simulations en parallèle et renvoie le premier cycle où
+    leurs écritures RAM, ou les signaux de probes (index dans a, index dans b),
+    diffèrent (None s'ils restent identiques)."""
+    for cycle in range(max_cycles):
+        if a.running() != b.running():
+            return cycle
+        if not a.running():
+            return None
+        if a.step() != b.step():
+            return cycle
+        if any(a.signals[i] != b.signals[j] for i, j in probes):
+            return cycle
+        if a.ram[1] != b.ram[1]:
+            return cycle
+        if a.ram[1]:
+            a.end_frame()
+            b.end_frame()
+    return None
+
+
+def check_optimizer(lines: List[str], rom_paths: List[str], max_cycles: int = 5000,
+                    arithmetic: bool = False, path: str = "<netlist>") -> Dict[str, Optional[int]]:
+    """Compare l'IR optimisée à l'IR brute sur chaque ROM (écritures RAM et
+    sorties) : None si identique, sinon le premier cycle divergent. path :
+    fichier de la netlist, dont le dossier sert de base aux IMPORT."""
+    reference = NetlistCompiler()
+    reference.compile_netlist(lines, path=path)
+    optimized = NetlistCompiler()
+    optimized.compile_netlist(lines, optimize=True, arithmetic=arithmetic, path=path)
+    outputs = [(int(a), int(b)) for a, b in zip(reference.outputs, optimized.outputs)]
+    results = {}
+    for rom_path in rom_paths:
+        rom = load_rom(rom_path)
+        results[rom_path] = first_divergence(CycleSimulator.from_compiler(reference, rom),
+                                             CycleSimulator.from_compiler(optimized, rom),
+                                             max_cycles, outputs)
+    return results
+
+
+def check_c_step(lines: List[str], rom_paths: List[str], max_cycles: int = 5000, optimize: bool = False,
+                 arithmetic: bool = False, path: str = "<netlist>", cc: Optional[str] = None
+                 ) -> Dict[str, Optional[int]]:
+    """Compare la fonction de cycle C (format_c_step) à CycleSimulator sur la
+    même IR, ROM par ROM (écritures RAM et tous les signaux) : None si
+    identique, sinon le premier cycle divergent. Sans ROM, une seule
+    exécution sur une ROM vide, sous la clé "". path : comme pour check_optimizer."""
+    compiler = NetlistCompiler()
+    compiler.compile_netlist(lines, optimize=optimize, arithmetic=arithmetic, path=path)
+    signals = [(i, i) for i in range(compiler.signal_counter)]
+    results = {}
+    for rom_path in rom_paths or [""]:
+        rom = load_rom(rom_path) if rom_path else [0] * ROM_SIZE
+        results[rom_path] = first_divergence(CycleSimulator.from_compiler(compiler, rom),
+                                             CStepSimulator(compiler, rom, cc), max_cycles, signals)
+    return results
+
+
+def check_arithmetic(lines: List[str], count: int = 1 << 20, seed: int = 0,
+                     exhaustive_bits: int = 24, path: str = "<netlist>") -> Optional[dict]:
+    """Compare une netlist combinatoire porte à porte et sa version où les
+    additionneurs et multiplieurs sont reconnus (portes ADD/MUL).
+
+    Parcours exhaustif si les entrées tiennent sur exhaustive_bits bits,
+    sinon count vecteurs aléatoires. Renvoie None ou le premier vecteur fautif.
+    path : comme pour check_optimizer.
+    """
+    reference = NetlistCompiler()
+    reference.compile_netlist(lines, path=path)
+    recognized = NetlistCompiler()
+    recognized.compile_netlist(lines, arithmetic=True, path=path)
+    gate_level = VectorSimulator(reference)
+    word_level = VectorSimulator(recognized)
+    sizes = {name: sig.size for name, sig in gate_level.inputs.items()}
+    if sum(sizes.values()) <= exhaustive_bits:
+        vectors = iter_exhaustive(sizes)
+    else:
+        vectors = iter_random(sizes, count, seed=seed)
+    return verify(word_level, gate_level.evaluate, vectors)
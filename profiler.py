@@ -0,0 +1,143 @@
+"""Points chauds de la netlist par ligne source : le simulateur C compte les
+évaluations de chaque porte et les sauts de blocs GHOST (--profile), et la
+provenance rangée dans l'IR binaire ramène ces compteurs aux lignes du .net
+qui ont créé les portes, ou à chaque itération FOR avec --iterations.
+
+    python profiler.py netlists/cpu.irb roms/snake.bin --max-cycles 200000 [--top 20] [--iterations]
+    python profiler.py netlists/cpu.irb --profile profil.txt [--output rapport.txt]
+"""
+import argparse
+import linecache
+import os
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import List
+
+from netlist_compiler import read_ir_header, read_ir_origins
+from simulator_runner import DEFAULT_EXECUTABLE, run_headless
+
+
+@dataclass
+class GateProfile:
+    cycles: int
+    mode: str
+    evals: List[int]  # évaluations de chaque porte
+    skips: List[int]  # sauts de bloc GHOST pris à partir de chaque porte
+    targets: List[int]  # porte où reprend chaque saut
+
+
+@dataclass
+class HotSpot:
+    path: str
+    line: int
+    iterations: str  # "i=3 j=0", vide hors FOR ou sans --iterations
+    gates: int
+    evals: int
+    skipped: int  # passages sans évaluation, porte sautée par un bloc GHOST
+
+
+def read_profile(path: str) -> GateProfile:
+    # Format écrit par write_profile() dans simulator.c
+    with open(path) as f:
+        header = f.readline().split()
+        if header[:2] != ["#", "profil"]:
+            raise ValueError(f"{path} : profil du simulateur attendu")
+        fields = dict(zip(header[2::2], header[3::2]))
+        profile = GateProfile(int(fields["cycles"]), fields["mode"], [], [], [])
+        for line in f:
+            if line.startswith("#"):
+                continue
+            _, evals, skips, target = line.split()
+            profile.evals.append(int(evals))
+            profile.skips.append(int(skips))
+            profile.targets.append(int(target))
+    if len(profile.evals) != int(fields["portes"]):
+        raise ValueError(f"{path} : profil tronqué")
+    return profile
+
+
+def skipped_gates(profile: GateProfile) -> List[int]:
+    # Un saut de i vers sa cible passe toutes les portes entre les deux
+    delta = [0] * (len(profile.evals) + 1)
+    for i, (count, target) in enumerate(zip(profile.skips, profile.targets)):
+        if count:
+            delta[i] += count
+            delta[max(target, i)] -= count
+    skipped, total = [], 0
+    for d in delta[:-1]:
+        total += d
+        skipped.append(total)
+    return skipped
+
+
+def hot_spots(ir_data: bytes, profile: GateProfile, iterations: bool = False) -> List[HotSpot]:
+    if read_ir_header(ir_data)["gates"] != len(profile.evals):
+        raise ValueError("Le profil ne vient pas de cette IR (nombre de portes différent)")
+    found = read_ir_origins(ir_data)
+    if found is None:
+        raise ValueError("IR binaire sans provenance des portes : la recompiler (build.py --binary)")
+    origins, gate_origins = found
+    spots = {}
+    for evals, skipped, origin in zip(profile.evals, skipped_gates(profile), gate_origins):
+        path, line, loops = origins[origin] if origin >= 0 else ("?", 0, "")
+        key = (path, line, loops if iterations else "")
+        spot = spots.get(key)
+        if spot is None:
+            spot = spots[key] = HotSpot(*key, 0, 0, 0)
+        spot.gates += 1
+        spot.evals += evals
+        spot.skipped += skipped
+    return sorted(spots.values(), key=lambda s: (-s.evals, s.path, s.line, s.iterations))
+
+
+def format_report(spots: List[HotSpot], profile: GateProfile, top: int = 20) -> str:
+    total = sum(s.evals for s in spots)
+    cycles = max(profile.cycles, 1)
+    out = [f"{profile.cycles} cycles (mode {profile.mode}), {total} évaluations de portes "
+           f"({total / cycles:.1f} par cycle), {len(spots)} lignes source",
+           f"{'évaluations':>12} {'%':>6} {'/cycle':>8} {'sautées/cycle':>14} {'portes':>7}  source"]
+    for s in spots[:top]:
+        where = f"{s.path}:{s.line}" + (f" [{s.iterations}]" if s.iterations else "")
+        text = linecache.getline(s.path, s.line).strip()
+        out.append(f"{s.evals:>12} {s.evals / max(total, 1):>6.1%} {s.evals / cycles:>8.1f} "
+                   f"{s.skipped / cycles:>14.1f} {s.gates:>7}  {where}  {text[:60]}")
+    return "\n".join(out) + "\n"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Points chauds de la netlist par ligne source")
+    parser.add_argument("ir", help="netlist compilée (.irb)")
+    parser.add_argument("rom", nargs="?", help="programme à simuler (.bin ou .rom), sauf avec --profile")
+    parser.add_argument("--profile", metavar="FICHIER", help="profil déjà écrit par le simulateur (--profile)")
+    parser.add_argument("--max-cycles", type=int, default=100000, help="cycles simulés")
+    parser.add_argument("--event", action="store_true", help="mode événementiel")
+    parser.add_argument("--executable", default=DEFAULT_EXECUTABLE)
+    parser.add_argument("--iterations", action="store_true", help="une ligne par itération FOR")
+    parser.add_argument("--top", type=int, default=20, help="lignes affichées")
+    parser.add_argument("--output", metavar="FICHIER", help="écrire le rapport dans ce fichier")
+    args = parser.parse_args()
+    if not args.profile and not args.rom:
+        parser.error("un programme ou --profile est nécessaire")
+
+    with open(args.ir, 'rb') as f:
+        ir_data = f.read()
+    if args.profile:
+        profile = read_profile(args.profile)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profil.txt")
+            run_headless(args.ir, args.rom, args.max_cycles, executable=args.executable, event=args.event,
+                         profile=path)
+            profile = read_profile(path)
+    report = format_report(hot_spots(ir_data, profile, args.iterations), profile, args.top)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report, end="")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
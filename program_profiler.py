@@ -0,0 +1,145 @@
+"""Où un programme passe ses cycles : le simulateur compte les exécutions de
+chaque adresse de la ROM (--pc-histogram) et la carte des adresses écrite
+par l'assembleur (build.py --map) les ramène aux lignes du .asb, aux
+routines (label englobant, comme DRAW dans snake.asb) et aux appels (call).
+
+    python build.py roms/snake.asb --map
+    python program_profiler.py roms/snake.bin netlists/cpu.irb --max-cycles 1000000 [--top 15]
+    python program_profiler.py roms/snake.bin --histogram pc.txt [--map roms/snake.map]
+"""
+import argparse
+import linecache
+import os
+import sys
+import tempfile
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from assembler_compiler import ALU_VALUES, decode, rom_from_bytes, source_map_from_text
+from simulator_runner import DEFAULT_EXECUTABLE, run_headless
+
+MOV2, JUMP = ALU_VALUES["MOV2"], ALU_VALUES["JUMP"]
+
+
+@dataclass
+class ProgramProfile:
+    cycles: int
+    lines: List[Tuple[str, int, Optional[str], int]]  # (fichier, ligne, routine, cycles), les plus chères d'abord
+    routines: List[Tuple[str, int, int]]  # (routine, cycles, appels)
+    calls: List[Tuple[str, int, str, int]]  # (fichier, ligne de l'appel, routine appelée, appels)
+    unmapped: int = 0  # cycles à des adresses absentes de la carte
+
+
+def read_histogram(path: str) -> Tuple[int, Dict[int, int]]:
+    # Format écrit par write_pc_histogram() dans simulator.c
+    histogram = {}
+    with open(path) as f:
+        header = f.readline().split()
+        if header[:2] != ["#", "histogramme"]:
+            raise ValueError(f"{path} : histogramme du simulateur attendu")
+        cycles = int(header[3])
+        for line in f:
+            if not line.startswith("#"):
+                address, count = line.split()
+                histogram[int(address)] = int(count)
+    return cycles, histogram
+
+
+def call_sites(words: List[int]) -> Dict[int, int]:
+    # Saut d'un call : "r15 = adresse de retour" puis saut inconditionnel vers une constante
+    sites = {}
+    for a in range(1, len(words)):
+        code, _, _, r2, target = decode(words[a])
+        if code != JUMP or r2 >= 0:
+            continue
+        code, dest, _, r2, back = decode(words[a - 1])
+        if code == MOV2 and dest == 15 and r2 < 0 and back == a + 1:
+            sites[a] = target
+    return sites
+
+
+def profile_program(words: List[int], source_map: list, cycles: int, histogram: Dict[int, int]) -> ProgramProfile:
+    lines, routines, calls = Counter(), Counter(), Counter()
+    unmapped = 0
+    for address, count in histogram.items():
+        if address >= len(source_map):
+            unmapped += count
+            continue
+        file, line, routine = source_map[address]
+        lines[(file, line, routine)] += count
+        routines[routine or "(début)"] += count
+    called = Counter()
+    for address, target in call_sites(words).items():
+        count = histogram.get(address, 0)
+        if count and target < len(source_map):
+            file, line, _ = source_map[address]
+            callee = source_map[target][2] or f"@{target}"
+            calls[(file, line, callee)] += count
+            called[callee] += count
+    return ProgramProfile(
+        cycles=cycles,
+        lines=[(*key, count) for key, count in lines.most_common()],
+        routines=[(name, count, called[name]) for name, count in routines.most_common()],
+        calls=[(*key, count) for key, count in calls.most_common()],
+        unmapped=unmapped,
+    )
+
+
+def format_report(profile: ProgramProfile, source_dir: str = ".", top: int = 15) -> str:
+    cycles = max(profile.cycles, 1)
+    out = [f"{profile.cycles} cycles" + (f", dont {profile.unmapped} hors de la carte" if profile.unmapped else ""),
+           "", "Routines :", f"{'cycles':>12} {'%':>6} {'appels':>9} {'cycles/appel':>13}  routine"]
+    for name, count, called in profile.routines[:top]:
+        per_call = f"{count / called:.1f}" if called else "-"
+        out.append(f"{count:>12} {count / cycles:>6.1%} {called:>9} {per_call:>13}  {name}")
+    out += ["", "Lignes :", f"{'cycles':>12} {'%':>6}  source"]
+    for file, line, routine, count in profile.lines[:top]:
+        text = linecache.getline(os.path.join(source_dir, file), line).strip()
+        out.append(f"{count:>12} {count / cycles:>6.1%}  {file}:{line} ({routine or '-'})  {text[:60]}")
+    if profile.calls:
+        out += ["", "Appels :", f"{'appels':>12}  appelant -> routine"]
+        for file, line, callee, count in profile.calls[:top]:
+            out.append(f"{count:>12}  {file}:{line} -> {callee}")
+    return "\n".join(out) + "\n"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Profil d'un programme par ligne source et par routine")
+    parser.add_argument("rom", help="programme assemblé (.bin)")
+    parser.add_argument("ir", nargs="?", help="netlist compilée à simuler (.ir ou .irb), sauf avec --histogram")
+    parser.add_argument("--map", help="carte des adresses (défaut : la ROM avec l'extension .map)")
+    parser.add_argument("--histogram", metavar="FICHIER", help="histogramme déjà écrit par le simulateur (--pc-histogram)")
+    parser.add_argument("--max-cycles", type=int, default=1000000, help="cycles simulés")
+    parser.add_argument("--step", metavar="SO", help="fonction de cycle compilée (--step du simulateur)")
+    parser.add_argument("--executable", default=DEFAULT_EXECUTABLE)
+    parser.add_argument("--top", type=int, default=15, help="lignes affichées par tableau")
+    parser.add_argument("--output", metavar="FICHIER", help="écrire le rapport dans ce fichier")
+    args = parser.parse_args()
+    if not args.histogram and not args.ir:
+        parser.error("une netlist ou --histogram est nécessaire")
+
+    map_path = args.map or os.path.splitext(args.rom)[0] + ".map"
+    with open(map_path) as f:
+        source_map = source_map_from_text(f.read())
+    with open(args.rom, 'rb') as f:
+        words = rom_from_bytes(f.read())
+    if args.histogram:
+        cycles, histogram = read_histogram(args.histogram)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pc.txt")
+            run_headless(args.ir, args.rom, args.max_cycles, executable=args.executable, step=args.step,
+                         pc_histogram=path)
+            cycles, histogram = read_histogram(path)
+    report = format_report(profile_program(words, source_map, cycles, histogram), os.path.dirname(map_path), args.top)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report, end="")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,12 +5,17 @@
 #include <time.h>
 #include <stdint.h>
 #include <stdbool.h>
+#include <stddef.h>
 
 #ifndef LINUX
 //chiant à installer, lien d'un tres bon tuto : https://www.youtube.com/watch?v=uv4fda8Z8Tk
     #include "inc/SDL.h"
 #else
     #include <SDL2/SDL.h>
+    #include <sys/mman.h>
+    #include <sys/stat.h>
+    #include <fcntl.h>
+    #include <unistd.h>
 #endif
 
 
@@ -44,6 +49,7 @@ typedef struct {
     int enabled_if;
     int const_value; // valeur compressée
     int has_const;
+    int skip; // porte où reprendre si la condition est fausse (-1 : calculé ici)
 } Instruction;
 
 enum {
@@ -64,18 +70,32 @@ enum {
     GATE_LOAD,
     GATE_STORE,
     GATE_ROM,
+    GATE_ADD,
+    GATE_SUBTRACT,
+    GATE_MUL,
+    GATE_EQ,
 };
 
 Instruction instructions[MAX_INSTRUCTIONS];
 int instruction_count = 0;
+int signal_count = 0;
 
 int inputs[MAX_SIGNALS];
 int input_count = 0;
 int outputs[MAX_SIGNALS];
 int output_count = 0;
 int jump_table[MAX_INSTRUCTIONS];
+int* fanout_start = NULL; // signal -> portes à réévaluer, au format CSR
+int* fanout_gates = NULL;
 int ram[RAM_SIZE];
 int rom[RAM_SIZE];
+bool headless = false; // --headless, voir plus bas
+
+// Flux des messages de diagnostic : stderr sans fenêtre, pour que la sortie
+// standard ne contienne que le résumé JSON
+FILE* diag(void) {
+    return headless ? stderr : stdout;
+}
 
 int gate_type_from_string(const char* str) {
     if (strcmp(str, "AND") == 0) return GATE_AND;
@@ -94,6 +114,10 @@ int gate_type_from_string(const char* str) {
     if (strcmp(str, "LOAD") == 0) return GATE_LOAD;
     if (strcmp(str, "STORE") == 0) return GATE_STORE;
     if (strcmp(str, "ROM") == 0) return GATE_ROM;
+    if (strcmp(str, "ADD") == 0) return GATE_ADD;
+    if (strcmp(str, "SUBTRACT") == 0) return GATE_SUBTRACT;
+    if (strcmp(str, "MUL") == 0) return GATE_MUL;
+    if (strcmp(str, "EQ") == 0) return GATE_EQ;
     return GATE_UNKNOWN;
 }
 
@@ -116,6 +140,7 @@ void print_binary(int value, int size) {
 void parse_line(const char* line) {
     Instruction inst = {0};
     inst.has_const = 0;
+    inst.skip = -1;
 
     char type_char[16];
 
@@ -132,77 +157,201 @@ void parse_line(const char* line) {
             inst.has_const = 1;
             sscanf(pos, "const_value=%d", &inst.const_value);
         }
+
+        pos = strstr(line, "skip=");
+        if (pos) {
+            sscanf(pos, "skip=%d", &inst.skip);
+        }
         
 
     instructions[instruction_count++] = inst;
 }
 
-void afficher_signaux(const char* label, int* table, int count) {
-    printf("%s (%d) : ", label, count);
-    for (int i = 0; i < count; i++) {
-        printf("%d ", table[i]);
-    }
-    printf("\n");
-}
-
-void load_rom_text_binary(const char* filename) {
-    FILE* file = fopen(filename, "r");
-    if (!file) {
-        perror("Erreur à l'ouverture du fichier texte");
-        exit(1);
-    }
+// === IR binaire (voir IR_HEADER / IR_GATE dans netlist_compiler.py) ===
 
-    char line[128];  // plus large au cas où il y a des espaces
-    int i = 0;
+#define IR_VERSION 2
+#define IR_FLAG_FANOUT 1
+#define IR_FLAG_ORIGINS 2
 
-    while (fgets(line, sizeof(line), file) && i < ROM_SIZE) {
-        int value = 0;
-        int bit_count = 0;
+typedef struct {
+    char magic[4];
+    uint16_t version;
+    uint16_t flags;
+    int32_t signal_count;
+    int32_t input_count;
+    int32_t output_count;
+    int32_t gate_count;
+} IrBinHeader;
 
-        for (int j = 0; line[j] != '\0' && bit_count < 32; j++) {
-            if (line[j] == '0' || line[j] == '1') {
-                value = (value << 1) | (line[j] - '0');
-                bit_count++;
-            }
-            // Sinon : ignore les espaces, tabulations, retours chariot, etc.
-        }
+typedef struct {
+    int32_t id;
+    uint8_t type;
+    uint8_t has_const;
+    uint16_t size;
+    int32_t output;
+    int32_t input1;
+    int32_t input2;
+    int32_t input3;
+    int32_t enabled_if;
+    uint32_t const_value;
+    int32_t skip; // absent en version 1
+} IrBinGate;
+
+bool is_ir_binary(const char* filename) {
+    char magic[4] = {0};
+    FILE* f = fopen(filename, "rb");
+    if (!f) return false;
+    size_t n = fread(magic, 1, 4, f);
+    fclose(f);
+    return n == 4 && memcmp(magic, "ODZI", 4) == 0;
+}
 
-        rom[i++] = value;
+// Renvoie le contenu du fichier, projeté en mémoire quand c'est possible
+const uint8_t* map_file(const char* filename, size_t* size) {
+#ifdef LINUX
+    int fd = open(filename, O_RDONLY);
+    if (fd < 0) return NULL;
+    struct stat st;
+    if (fstat(fd, &st) != 0) {
+        close(fd);
+        return NULL;
     }
-
-    fclose(file);
-
-    while (i < ROM_SIZE) {
-        rom[i++] = 0;
+    *size = st.st_size;
+    void* data = mmap(NULL, *size, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+    return data == MAP_FAILED ? NULL : (const uint8_t*)data;
+#else
+    FILE* f = fopen(filename, "rb");
+    if (!f) return NULL;
+    fseek(f, 0, SEEK_END);
+    *size = ftell(f);
+    fseek(f, 0, SEEK_SET);
+    uint8_t* data = malloc(*size);
+    if (data && fread(data, 1, *size, f) != *size) {
+        free(data);
+        data = NULL;
     }
+    fclose(f);
+    return data;
+#endif
 }
 
-Uint32* framebuffer = NULL;
-int fb_pitch = 0;
-
-void set_pixel(int x, int y, Uint32 color) {
-    if (x < 0 || x >= SCREEN_WIDTH || y < 0 || y >= SCREEN_HEIGHT) return;
-    framebuffer[y * (fb_pitch / 4) + x] = color;
+void unmap_file(const uint8_t* data, size_t size) {
+#ifdef LINUX
+    munmap((void*)data, size);
+#else
+    (void)size;
+    free((void*)data);
+#endif
 }
 
+// Avance `offset` sur une section de `bytes` octets si elle tient dans le fichier
+static bool take_section(size_t* offset, size_t size, size_t bytes) {
+    if (bytes > size - *offset) {
+        return false;
+    }
+    *offset += bytes;
+    return true;
+}
 
+int load_ir_binary(const char* filename) {
+    size_t size = 0;
+    const uint8_t* data = map_file(filename, &size);
+    if (!data) {
+        perror("Erreur d'ouverture de l'IR binaire");
+        return 1;
+    }
+    const IrBinHeader* header = (const IrBinHeader*)data;
+    if (size < sizeof(IrBinHeader) || header->version < 1 || header->version > IR_VERSION) {
+        fprintf(stderr, "IR binaire invalide ou de version non supportee\n");
+        unmap_file(data, size);
+        return 1;
+    }
+    if (header->signal_count < 0 || header->input_count < 0 || header->output_count < 0 || header->gate_count < 0) {
+        fprintf(stderr, "IR binaire invalide (compteurs negatifs)\n");
+        unmap_file(data, size);
+        return 1;
+    }
+    if (header->gate_count > MAX_INSTRUCTIONS || header->signal_count > MAX_SIGNALS
+        || header->input_count > MAX_SIGNALS || header->output_count > MAX_SIGNALS) {
+        fprintf(stderr, "IR binaire trop grand (%d signaux, %d portes)\n", header->signal_count, header->gate_count);
+        unmap_file(data, size);
+        return 1;
+    }
 
-int main(int argc, char** argv) {
-
-    printf("PROUT !\n");
-
-    if (argc != 3) {
-        printf("Usage: %s <fichier.ir> <program.rom>\n", argv[0]);
+    // Chaque section doit tenir dans le fichier avant d'être lue
+    size_t gate_size = header->version == 1 ? offsetof(IrBinGate, skip) : sizeof(IrBinGate);
+    size_t offset = sizeof(IrBinHeader);
+    size_t fanout_offset = 0;
+    int32_t total = 0;
+    bool complete = take_section(&offset, size, (size_t)(header->input_count + header->output_count) * sizeof(int32_t))
+                    && take_section(&offset, size, (size_t)header->gate_count * gate_size);
+    if (complete && (header->flags & IR_FLAG_FANOUT)) {
+        fanout_offset = offset;
+        complete = take_section(&offset, size, (size_t)(header->signal_count + 1) * sizeof(int32_t));
+        if (complete) {
+            memcpy(&total, data + offset - sizeof(int32_t), sizeof(int32_t));
+            complete = total >= 0 && take_section(&offset, size, (size_t)total * sizeof(int32_t));
+        }
+    }
+    if (complete && (header->flags & IR_FLAG_ORIGINS)) {
+        int32_t counts[2];  // nombre de sources, longueur du texte
+        complete = take_section(&offset, size, sizeof(counts));
+        if (complete) {
+            memcpy(counts, data + offset - sizeof(counts), sizeof(counts));
+            complete = counts[1] >= 0 && take_section(&offset, size, (size_t)header->gate_count * sizeof(int32_t))
+                       && take_section(&offset, size, (size_t)counts[1]);
+        }
+    }
+    if (!complete) {
+        fprintf(stderr, "IR binaire tronque ou corrompu (%zu octets)\n", size);
+        unmap_file(data, size);
         return 1;
     }
 
-    FILE* f = fopen(argv[1], "r");
+    const int32_t* ports = (const int32_t*)(data + sizeof(IrBinHeader));
+    signal_count = header->signal_count;
+    input_count = header->input_count;
+    output_count = header->output_count;
+    memcpy(inputs, ports, input_count * sizeof(int32_t));
+    memcpy(outputs, ports + input_count, output_count * sizeof(int32_t));
+
+    const uint8_t* gates = (const uint8_t*)(ports + input_count + output_count);
+    for (int i = 0; i < header->gate_count; i++) {
+        const IrBinGate* g = (const IrBinGate*)(gates + i * gate_size);
+        Instruction* inst = &instructions[i];
+        inst->id = g->id;
+        inst->type = g->type;
+        inst->output = g->output;
+        inst->input1 = g->input1;
+        inst->input2 = g->input2;
+        inst->input3 = g->input3;
+        inst->size = g->size;
+        inst->enabled_if = g->enabled_if;
+        inst->const_value = (int)g->const_value;
+        inst->has_const = g->has_const;
+        inst->skip = header->version == 1 ? -1 : g->skip;
+    }
+    instruction_count = header->gate_count;
+
+    if (header->flags & IR_FLAG_FANOUT) {
+        const int32_t* offsets = (const int32_t*)(data + fanout_offset);
+        fanout_start = malloc((signal_count + 1) * sizeof(int));
+        fanout_gates = malloc((total > 0 ? total : 1) * sizeof(int));
+        memcpy(fanout_start, offsets, (signal_count + 1) * sizeof(int));
+        memcpy(fanout_gates, offsets + signal_count + 1, total * sizeof(int));
+    }
+    unmap_file(data, size);
+    return 0;
+}
+
+void load_ir_text(const char* filename) {
+    FILE* f = fopen(filename, "r");
     if (!f) {
         perror("Erreur d'ouverture du fichier");
-        return 1;
+        exit(1);
     }
 
-    int signal_count = 0;
     char line[MAX_LINE];
     while (fgets(line, sizeof(line), f)) {
         if (strncmp(line, "# SIGNALS:", 10) == 0) {
@@ -234,41 +383,238 @@ int main(int argc, char** argv) {
         parse_line(line);
     }
     fclose(f);
+}
 
-    load_rom_text_binary(argv[2]);
+void afficher_signaux(const char* label, int* table, int count) {
+    fprintf(diag(), "%s (%d) : ", label, count);
+    for (int i = 0; i < count; i++) {
+        fprintf(diag(), "%d ", table[i]);
+    }
+    fprintf(diag(), "\n");
+}
 
-    if (SDL_Init(SDL_INIT_VIDEO) != 0) {
-        printf("Erreur SDL_Init : %s\n", SDL_GetError());
-        return 1;
+void load_rom_text_binary(const char* filename) {
+    FILE* file = fopen(filename, "r");
+    if (!file) {
+        perror("Erreur à l'ouverture du fichier texte");
+        exit(1);
     }
 
-    SDL_Window* window = SDL_CreateWindow(
-        "Fenêtre SDL2",
-        SDL_WINDOWPOS_CENTERED,
-        SDL_WINDOWPOS_CENTERED,
-        SCREEN_WIDTH, SCREEN_HEIGHT,
-        SDL_WINDOW_RESIZABLE
-    );
+    char line[128];  // plus large au cas où il y a des espaces
+    int i = 0;
 
-    if (!window) {
-        printf("Erreur SDL_CreateWindow : %s\n", SDL_GetError());
-        SDL_Quit();
+    while (fgets(line, sizeof(line), file) && i < ROM_SIZE) {
+        int value = 0;
+        int bit_count = 0;
+
+        for (int j = 0; line[j] != '\0' && bit_count < 32; j++) {
+            if (line[j] == '0' || line[j] == '1') {
+                value = (value << 1) | (line[j] - '0');
+                bit_count++;
+            }
+            // Sinon : ignore les espaces, tabulations, retours chariot, etc.
+        }
+
+        rom[i++] = value;
+    }
+
+    fclose(file);
+
+    while (i < ROM_SIZE) {
+        rom[i++] = 0;
+    }
+}
+
+// ROM binaire (.bin) : mots de 32 bits little-endian, sans en-tête
+int load_rom_packed(const char* filename) {
+    size_t size = 0;
+    const uint8_t* data = map_file(filename, &size);
+    if (!data) {
+        perror("Erreur d'ouverture de la ROM binaire");
         return 1;
     }
+    if (size % 4 != 0) {
+        fprintf(stderr, "ROM binaire invalide : %zu octets, pas un multiple de 4\n", size);
+        unmap_file(data, size);
+        return 1;
+    }
+    size_t count = size / 4 < ROM_SIZE ? size / 4 : ROM_SIZE;
+    for (size_t i = 0; i < count; i++) {
+        const uint8_t* w = data + 4 * i;
+        rom[i] = (int)((uint32_t)w[0] | (uint32_t)w[1] << 8 | (uint32_t)w[2] << 16 | (uint32_t)w[3] << 24);
+    }
+    memset(rom + count, 0, (ROM_SIZE - count) * sizeof(int));
+    unmap_file(data, size);
+    return 0;
+}
 
-    SDL_Renderer* renderer = SDL_CreateRenderer(window, -1, 0);
-    SDL_Texture* texture = SDL_CreateTexture(
-        renderer,
-        SDL_PIXELFORMAT_ARGB8888,
-        SDL_TEXTUREACCESS_STREAMING,
-        SCREEN_WIDTH, SCREEN_HEIGHT
-    );
-    void* pixels;
-    SDL_LockTexture(texture, NULL, &pixels, &fb_pitch);
-    memset(pixels, 0, fb_pitch * SCREEN_HEIGHT);
-    framebuffer = (Uint32*)pixels;
-    
+// Format choisi par l'extension : .bin binaire, sinon texte (une ligne de '0'/'1' par mot)
+int load_rom(const char* filename) {
+    size_t n = strlen(filename);
+    if (n >= 4 && strcmp(filename + n - 4, ".bin") == 0) {
+        return load_rom_packed(filename);
+    }
+    load_rom_text_binary(filename);
+    return 0;
+}
+
+// === Mémoire vidéo ===
+//
+// Une écriture dans la mémoire vidéo marque seulement le mot comme modifié :
+// l'image est redessinée depuis la RAM, mot par mot, une fois par image
+// présentée (refresh_framebuffer). L'écran est rangé par colonnes de 8 pixels
+// de large, un mot couvre donc un bloc de 8x2 pixels : video_word_pixel donne
+// le premier pixel du bloc de chaque mot, video_bit_pixel la position de
+// chaque bit dans le bloc (bit 15 en haut à gauche).
+
+Uint32* framebuffer = NULL;
+int fb_pitch = 0;
+
+int video_word_pixel[VIDEO_RAM_SIZE];
+int video_bit_pixel[16];
+unsigned char video_dirty[VIDEO_RAM_SIZE];
+int dirty_words[VIDEO_RAM_SIZE];
+int dirty_word_count = 0;
+int dirty_row_min = SCREEN_HEIGHT, dirty_row_max = -1;  // lignes redessinées, pas encore envoyées à la texture
+
+// À rappeler si fb_pitch change
+void init_video(void) {
+    int stride = fb_pitch / 4;
+    for (int w = 0; w < VIDEO_RAM_SIZE; w++) {
+        video_word_pixel[w] = (w % (SCREEN_HEIGHT / 2)) * 2 * stride + w / (SCREEN_HEIGHT / 2) * 8;
+    }
+    for (int t = 0; t < 16; t++) {
+        video_bit_pixel[t] = (15 - t) / 8 * stride + (15 - t) % 8;
+    }
+}
+
+void refresh_framebuffer(void) {
+    for (int k = 0; k < dirty_word_count; k++) {
+        int w = dirty_words[k];
+        int value = ram[VIDEO_RAM_START + w];
+        Uint32* block = framebuffer + video_word_pixel[w];
+        for (int t = 0; t < 16; t++) {
+            block[video_bit_pixel[t]] = 0xFFFFFF * ((value >> t) & 1);
+        }
+        video_dirty[w] = 0;
+        int row = (w % (SCREEN_HEIGHT / 2)) * 2;
+        if (row < dirty_row_min) dirty_row_min = row;
+        if (row + 1 > dirty_row_max) dirty_row_max = row + 1;
+    }
+    dirty_word_count = 0;
+}
 
+// Envoie à la texture les lignes redessinées depuis le dernier appel, puis l'affiche
+void present_frame(SDL_Renderer* renderer, SDL_Texture* texture) {
+    if (dirty_row_max >= dirty_row_min) {
+        SDL_Rect rows = {0, dirty_row_min, SCREEN_WIDTH, dirty_row_max - dirty_row_min + 1};
+        SDL_UpdateTexture(texture, &rows, framebuffer + dirty_row_min * (fb_pitch / 4), fb_pitch);
+        dirty_row_min = SCREEN_HEIGHT;
+        dirty_row_max = -1;
+    }
+    SDL_RenderClear(renderer);
+    SDL_RenderCopy(renderer, texture, NULL, NULL);
+    SDL_RenderPresent(renderer);
+}
+
+// === Évaluation des portes ===
+
+long long gate_evals = 0;
+
+void store_ram(int a, int value) {
+    ram[a] = value;
+    if(DEBUG || a==42)fprintf(diag(), "\nRam[%d] got value %d", a, ram[a]);
+    if(a>=VIDEO_RAM_START && a<VIDEO_RAM_START+VIDEO_RAM_SIZE && !video_dirty[a-VIDEO_RAM_START]){
+        video_dirty[a-VIDEO_RAM_START] = 1;
+        dirty_words[dirty_word_count++] = a-VIDEO_RAM_START;
+    }
+}
+
+// Valeur produite par une porte (tout sauf STORE)
+static inline int eval_gate(const Instruction* inst, const int* signals) {
+    int mask = (1 << inst->size) - 1;
+
+    int a = signals[inst->input1];
+    int b = signals[inst->input2];
+    int c = signals[inst->input3];
+
+    switch (inst->type) {
+        case GATE_AND:
+            return (a & b) & mask;
+        case GATE_OR:
+            return (a | b) & mask;
+        case GATE_XOR:
+            return (a ^ b) & mask;
+        case GATE_NAND:
+            return ~(a & b) & mask;
+        case GATE_NOR:
+            return ~(a | b) & mask;
+        case GATE_NXOR:
+            return ~(a ^ b) & mask;
+        case GATE_NOT:
+            return ~a & mask;
+        case GATE_CONST:
+            return inst->const_value & mask;
+        case GATE_MUX:
+            return (a ? c : b) & mask;
+        case GATE_CONCAT: {
+            int size_b = inst->const_value;
+            return (a << size_b) | b;
+        }
+        case GATE_INDEX: {
+            int bit_index = inst->const_value;
+            return (a >> bit_index) & 1;
+        }
+        case GATE_SUB: {
+            int start = inst->const_value;
+            int len = inst->size;
+            return (a >> start) & ((1 << len) - 1);
+        }
+        case GATE_BUF:
+            return a & mask;
+        case GATE_LOAD:
+            if(DEBUG || a==42){fprintf(diag(), "\nRead Ram[%d] and got value %d", a, ram[a]);}
+            return ram[a] & mask;
+        case GATE_ROM:
+            return rom[a];
+        // Opérateurs sur mots entiers, calculés en non signé modulo 2^size
+        case GATE_ADD:
+            return (int)((unsigned)a + (unsigned)b) & mask;
+        case GATE_SUBTRACT:
+            return (int)((unsigned)a - (unsigned)b) & mask;
+        case GATE_MUL:
+            return (int)((unsigned)a * (unsigned)b) & mask;
+        case GATE_EQ:
+            return a == b;
+        default:
+            // handle unknown gate type
+            return signals[inst->output];
+    }
+}
+
+// === Mode événementiel ===
+//
+// Une porte n'est réévaluée que si un des signaux de son fanout a changé
+// depuis sa dernière évaluation. Les portes sont toujours parcourues dans
+// l'ordre de l'IR : une porte marquée plus loin est évaluée dans le même
+// cycle, une porte marquée plus tôt au cycle suivant, exactement comme le
+// balayage complet. LOAD et STORE dépendent de la RAM et sont toujours évaluées.
+
+bool event_mode = false;
+unsigned char* dirty = NULL;
+
+static inline void mark_fanout(int signal) {
+    for (int k = fanout_start[signal]; k < fanout_start[signal + 1]; k++) {
+        dirty[fanout_gates[k]] = 1;
+    }
+}
+
+void init_event_mode(void) {
+    dirty = malloc(instruction_count > 0 ? instruction_count : 1);
+    memset(dirty, 1, instruction_count);
+}
+
+void build_jump_table(void) {
     int last_block_start = 0;
     int last_index = -1;
 
@@ -286,11 +632,499 @@ int main(int argc, char** argv) {
         }
         jump_table[jumpcpt] = jumpcpt+1;
     }
+    // Cibles calculées par le compilateur (blocs GHOST imbriqués ou réordonnés)
+    for (int i = 0; i < instruction_count; i++) {
+        if (instructions[i].skip >= 0) {
+            jump_table[i] = instructions[i].skip;
+        }
+    }
+}
 
-    printf("Instructions lues : %d\n", instruction_count);
+// === Profilage ===
+//
+// --profile fichier : compte, pour chaque porte, ses évaluations et le
+// nombre de fois où son bloc GHOST a été sauté à partir d'elle, puis les
+// écrit en texte à la fin (profiler.py les ramène aux lignes du .net grâce
+// à la provenance de l'IR binaire). Les boucles de cycle existent en deux
+// versions, avec et sans compteurs : sans --profile, rien ne change.
+
+const char* profile_path = NULL;
+long long* profile_evals = NULL;
+long long* profile_skips = NULL;
+
+int init_profile(void) {
+    profile_evals = calloc(instruction_count > 0 ? instruction_count : 1, sizeof(long long));
+    profile_skips = calloc(instruction_count > 0 ? instruction_count : 1, sizeof(long long));
+    return profile_evals && profile_skips ? 0 : 1;
+}
 
-    Uint32 start_time = SDL_GetTicks();
+int write_profile(long long cycles, const char* mode) {
+    FILE* file = fopen(profile_path, "w");
+    if (!file) {
+        fprintf(stderr, "Impossible d'ecrire %s\n", profile_path);
+        return 1;
+    }
+    fprintf(file, "# profil cycles %lld portes %d mode %s\n", cycles, instruction_count, mode);
+    fprintf(file, "# porte evaluations sauts cible\n");
+    for (int i = 0; i < instruction_count; i++) {
+        fprintf(file, "%d %lld %lld %d\n", i, profile_evals[i], profile_skips[i], jump_table[i]);
+    }
+    fclose(file);
+    return 0;
+}
+
+// --pc-histogram fichier : nombre d'exécutions de chaque adresse de la ROM,
+// lue sur l'adresse de la porte ROM qui charge l'instruction (la première
+// sans condition GHOST). Si cette adresse est écrite avant la porte
+// (PC = BUF PC_REG), elle se lit en fin de cycle ; si elle l'est après
+// (PC_REG, netlist optimisée), en début de cycle. Marche aussi avec la fonction de cycle compilée.
+
+const char* pc_histogram_path = NULL;
+long long* pc_counts = NULL;
+int pc_signal = -1;
+bool pc_before_cycle = false;
+
+int init_pc_histogram(void) {
+    int fetch = -1;
+    for (int i = 0; i < instruction_count && fetch < 0; i++) {
+        if (instructions[i].type == GATE_ROM && instructions[i].enabled_if < 0) {
+            fetch = i;
+        }
+    }
+    if (fetch < 0) {
+        fprintf(stderr, "--pc-histogram : aucune porte ROM sans condition dans la netlist\n");
+        return 1;
+    }
+    pc_signal = instructions[fetch].input1;
+    bool before = false, after = false;
+    for (int i = 0; i < instruction_count; i++) {
+        if (instructions[i].type != GATE_STORE && instructions[i].output == pc_signal) {
+            if (i < fetch) before = true; else after = true;
+        }
+    }
+    if (before && after) {
+        fprintf(stderr, "--pc-histogram : l'adresse de la porte ROM %d est ecrite avant et apres elle\n", fetch);
+        return 1;
+    }
+    pc_before_cycle = after;
+    pc_counts = calloc(ROM_SIZE, sizeof(long long));
+    return pc_counts ? 0 : 1;
+}
+
+int write_pc_histogram(long long cycles) {
+    FILE* file = fopen(pc_histogram_path, "w");
+    if (!file) {
+        fprintf(stderr, "Impossible d'ecrire %s\n", pc_histogram_path);
+        return 1;
+    }
+    fprintf(file, "# histogramme cycles %lld\n", cycles);
+    fprintf(file, "# adresse executions\n");
+    for (int a = 0; a < ROM_SIZE; a++) {
+        if (pc_counts[a]) {
+            fprintf(file, "%d %lld\n", a, pc_counts[a]);
+        }
+    }
+    fclose(file);
+    return 0;
+}
+
+static inline void cycle_scan(int* signals, bool profile) {
+    for (int i = 0; i < instruction_count;) {
+        Instruction* inst = &instructions[i];
+
+        if(inst->enabled_if>=0 && signals[inst->enabled_if]==0){
+            if (profile) profile_skips[i]++;
+            i = jump_table[i];
+            continue;
+        }
+
+        gate_evals++;
+        if (profile) profile_evals[i]++;
+        if (inst->type == GATE_STORE) {
+            store_ram(signals[inst->input1], signals[inst->input2] & ((1 << inst->size) - 1));
+        } else {
+            signals[inst->output] = eval_gate(inst, signals);
+        }
+        i++;
+    }
+}
+
+static inline void cycle_event(int* signals, bool profile) {
+    for (int i = 0; i < instruction_count;) {
+        Instruction* inst = &instructions[i];
+
+        if(inst->enabled_if>=0 && signals[inst->enabled_if]==0){
+            if (profile) profile_skips[i]++;
+            i = jump_table[i];
+            continue;
+        }
+
+        if (inst->type == GATE_STORE) {
+            gate_evals++;
+            if (profile) profile_evals[i]++;
+            store_ram(signals[inst->input1], signals[inst->input2] & ((1 << inst->size) - 1));
+        } else if (dirty[i] || inst->type == GATE_LOAD) {
+            gate_evals++;
+            if (profile) profile_evals[i]++;
+            dirty[i] = 0;
+            int value = eval_gate(inst, signals);
+            if (value != signals[inst->output]) {
+                signals[inst->output] = value;
+                mark_fanout(inst->output);
+            }
+        }
+        i++;
+    }
+}
+
+void run_cycle_scan(int* signals) {
+    cycle_scan(signals, false);
+}
+
+void run_cycle_event(int* signals) {
+    cycle_event(signals, false);
+}
+
+void run_cycle_scan_profiled(int* signals) {
+    cycle_scan(signals, true);
+}
+
+void run_cycle_event_profiled(int* signals) {
+    cycle_event(signals, true);
+}
+
+
+// === Fonction de cycle compilée ===
+//
+// netlist_compiler.py (format_c_step) écrit toute l'IR sous forme d'une
+// fonction C netlist_step, sans boucle ni switch. Elle est soit liée au
+// simulateur (cc -D STATIC_STEP simulator.c cpu.c), soit chargée au
+// démarrage avec --step cpu.so (SDL_LoadObject : dlopen sous Linux,
+// LoadLibrary sous Windows). Elle doit venir de la même IR que celle chargée.
+
+typedef void (*StepFunction)(int* signals, int* ram, const int* rom, void (*store)(int, int));
+StepFunction compiled_step = NULL;
+
+#ifdef STATIC_STEP
+extern const int netlist_signal_count;
+extern const int netlist_gate_count;
+void netlist_step(int* signals, int* ram, const int* rom, void (*store)(int, int));
+#endif
+
+int check_step(const char* name, int signals, int gates) {
+    if (signals != signal_count || gates != instruction_count) {
+        fprintf(stderr, "%s ne correspond pas a l'IR chargee (%d signaux et %d portes, attendu %d et %d)\n",
+               name, signals, gates, signal_count, instruction_count);
+        return 1;
+    }
+    return 0;
+}
+
+int load_step(const char* path) {
+    void* library = SDL_LoadObject(path);
+    if (!library) {
+        fprintf(stderr, "Impossible de charger %s : %s\n", path, SDL_GetError());
+        return 1;
+    }
+    StepFunction step = (StepFunction)SDL_LoadFunction(library, "netlist_step");
+    const int* signals = SDL_LoadFunction(library, "netlist_signal_count");
+    const int* gates = SDL_LoadFunction(library, "netlist_gate_count");
+    if (!step || !signals || !gates) {
+        fprintf(stderr, "%s ne contient pas de fonction netlist_step\n", path);
+        return 1;
+    }
+    if (check_step(path, *signals, *gates) != 0) {
+        return 1;
+    }
+    compiled_step = step;
+    return 0;
+}
+
+
+// === Mode sans fenêtre ===
+//
+// --headless : pas de SDL (ni fenêtre ni cadence de 60 images/s), pas
+// d'affichage à chaque cycle, entrées de la netlist à 0. Le programme tourne
+// jusqu'à ram[0] = 0 ou --max-cycles, puis un résumé JSON est écrit
+// (--summary fichier, sinon sur la sortie standard, où rien d'autre n'est
+// écrit : les messages de diagnostic passent par diag(), donc stderr).
+// --dump-frames dossier écrit chaque image en PBM (frame_00001.pbm, ...),
+// aussi avec fenêtre.
+
+long long max_cycles = STEP_LIMIT;
+const char* dump_dir = NULL;
+const char* summary_path = NULL;
+
+double wall_seconds(void) {
+    struct timespec ts;
+    timespec_get(&ts, TIME_UTC);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+// FNV-1a 32 bits sur les mots de la RAM en little-endian (simulator_runner.ram_checksum)
+uint32_t ram_checksum(void) {
+    uint32_t hash = 2166136261u;
+    for (int i = 0; i < RAM_SIZE; i++) {
+        uint32_t value = (uint32_t)ram[i];
+        for (int k = 0; k < 4; k++) {
+            hash = (hash ^ ((value >> (8 * k)) & 0xFF)) * 16777619u;
+        }
+    }
+    return hash;
+}
+
+int dump_frame(int frame) {
+    char path[1024];
+    snprintf(path, sizeof(path), "%s/frame_%05d.pbm", dump_dir, frame);
+    FILE* file = fopen(path, "wb");
+    if (!file) {
+        fprintf(stderr, "Impossible d'ecrire %s\n", path);
+        return 1;
+    }
+    // PBM binaire : 1 bit par pixel, 1 = noir
+    fprintf(file, "P4\n%d %d\n", SCREEN_WIDTH, SCREEN_HEIGHT);
+    unsigned char row[SCREEN_WIDTH / 8];
+    for (int y = 0; y < SCREEN_HEIGHT; y++) {
+        memset(row, 0, sizeof(row));
+        for (int x = 0; x < SCREEN_WIDTH; x++) {
+            if (!(framebuffer[y * (fb_pitch / 4) + x] & 0xFFFFFF)) {
+                row[x / 8] |= 0x80 >> (x % 8);
+            }
+        }
+        fwrite(row, 1, sizeof(row), file);
+    }
+    fclose(file);
+    return 0;
+}
+
+int write_summary(long long cycles, int frames, double seconds, const char* mode) {
+    FILE* file = summary_path ? fopen(summary_path, "w") : stdout;
+    if (!file) {
+        fprintf(stderr, "Impossible d'ecrire %s\n", summary_path);
+        return 1;
+    }
+    fprintf(file, "{\"cycles\": %lld, \"frames\": %d, \"halted\": %s, \"wall_time\": %.6f, "
+                  "\"cycles_per_second\": %.1f, \"gate_evals\": %lld, \"ram_checksum\": %u, \"mode\": \"%s\"}\n",
+            cycles, frames, ram[0] ? "false" : "true", seconds, seconds > 0 ? cycles / seconds : 0.0,
+            gate_evals, ram_checksum(), mode);
+    if (summary_path) {
+        fclose(file);
+    }
+    return 0;
+}
+
+// === Fenêtre : cadence d'affichage et entrées ===
+//
+// En mode normal, chaque image demandée (ram[1]) est affichée, à FPS images/s
+// au plus. En mode turbo (--turbo au démarrage, Tab pendant l'exécution), la
+// boucle n'attend plus : seule une image sur frame_skip est affichée
+// (--frame-skip n), ou sinon au plus turbo_fps images par seconde d'horloge
+// (--turbo-fps f). Le clavier est lu toutes les POLL_TIME ms dans les deux
+// modes, même si le programme ne demande jamais d'image, et le titre de la
+// fenêtre donne chaque seconde les cycles/s et images/s obtenus.
+
+#define WINDOW_TITLE "Fenêtre SDL2"
+#define POLL_TIME 10  // ms
+#define TITLE_TIME 1000  // ms
+#define CLOCK_CHECK_CYCLES 1024  // cycles entre deux lectures de l'horloge
+
+bool turbo = false;
+int frame_skip = 0;
+int turbo_fps = 30;
+
+// Image demandée n° frame, dont la précédente a été affichée à last_shown (ms)
+bool frame_shown(int frame, Uint32 last_shown) {
+    if (!turbo) {
+        return true;
+    }
+    if (frame_skip > 0) {
+        return frame % frame_skip == 0;
+    }
+    return SDL_GetTicks() - last_shown >= (Uint32)(1000 / turbo_fps);
+}
+
+void poll_events(void) {
     SDL_Event event;
+    while (SDL_PollEvent(&event)) {
+        if (event.type == SDL_QUIT) {
+            ram[0] = 0;
+        }
+        if (event.type != SDL_KEYDOWN && event.type != SDL_KEYUP) {
+            continue;
+        }
+        int pressed = event.type == SDL_KEYDOWN;
+        switch (event.key.keysym.sym) {
+            case SDLK_UP:
+                ram[10] = pressed;
+                break;
+            case SDLK_DOWN:
+                ram[11] = pressed;
+                break;
+            case SDLK_LEFT:
+                ram[12] = pressed;
+                break;
+            case SDLK_RIGHT:
+                ram[13] = pressed;
+                break;
+            case SDLK_SPACE:
+                ram[14] = pressed;
+                break;
+            case SDLK_TAB:
+                if (pressed && !event.key.repeat) {
+                    turbo = !turbo;
+                }
+                break;
+        }
+    }
+}
+
+void update_title(SDL_Window* window, long long cycles, int frames, int shown, double seconds) {
+    char title[256];
+    snprintf(title, sizeof(title), WINDOW_TITLE " - %.0f cycles/s, %.0f images/s (%.0f affichees)%s",
+             cycles / seconds, frames / seconds, shown / seconds, turbo ? " - turbo" : "");
+    SDL_SetWindowTitle(window, title);
+}
+
+
+#ifndef SIMULATOR_NO_MAIN
+int main(int argc, char** argv) {
+
+    if (argc < 3) {
+        printf("Usage: %s <fichier.ir> <programme.bin|.rom> [--event] [--step fichier.so] [--headless]\n"
+               "       [--max-cycles n] [--dump-frames dossier] [--summary fichier.json] [--profile fichier]\n"
+               "       [--pc-histogram fichier] [--turbo] [--frame-skip n] [--turbo-fps f]\n", argv[0]);
+        return 1;
+    }
+    const char* step_path = NULL;
+    for (int k = 3; k < argc; k++) {
+        if (strcmp(argv[k], "--event") == 0) {
+            event_mode = true;
+        } else if (strcmp(argv[k], "--step") == 0 && k + 1 < argc) {
+            step_path = argv[++k];
+        } else if (strcmp(argv[k], "--headless") == 0) {
+            headless = true;
+        } else if (strcmp(argv[k], "--max-cycles") == 0 && k + 1 < argc) {
+            max_cycles = atoll(argv[++k]);
+        } else if (strcmp(argv[k], "--dump-frames") == 0 && k + 1 < argc) {
+            dump_dir = argv[++k];
+        } else if (strcmp(argv[k], "--summary") == 0 && k + 1 < argc) {
+            summary_path = argv[++k];
+        } else if (strcmp(argv[k], "--profile") == 0 && k + 1 < argc) {
+            profile_path = argv[++k];
+        } else if (strcmp(argv[k], "--pc-histogram") == 0 && k + 1 < argc) {
+            pc_histogram_path = argv[++k];
+        } else if (strcmp(argv[k], "--turbo") == 0) {
+            turbo = true;
+        } else if (strcmp(argv[k], "--frame-skip") == 0 && k + 1 < argc) {
+            frame_skip = atoi(argv[++k]);
+        } else if (strcmp(argv[k], "--turbo-fps") == 0 && k + 1 < argc) {
+            turbo_fps = atoi(argv[++k]);
+        } else {
+            fprintf(stderr, "Option inconnue : %s\n", argv[k]);
+            return 1;
+        }
+    }
+
+    if (frame_skip < 0 || turbo_fps <= 0) {
+        fprintf(stderr, "--frame-skip doit etre positif et --turbo-fps strictement positif\n");
+        return 1;
+    }
+
+    fprintf(diag(), "PROUT !\n");
+
+    if (is_ir_binary(argv[1])) {
+        if (load_ir_binary(argv[1]) != 0) {
+            return 1;
+        }
+    } else {
+        load_ir_text(argv[1]);
+    }
+
+    if (load_rom(argv[2]) != 0) {
+        return 1;
+    }
+
+#ifdef STATIC_STEP
+    if (check_step("netlist_step (lie au simulateur)", netlist_signal_count, netlist_gate_count) != 0) {
+        return 1;
+    }
+    compiled_step = netlist_step;
+#endif
+    if (step_path && load_step(step_path) != 0) {
+        return 1;
+    }
+    if (event_mode && compiled_step) {
+        fprintf(stderr, "--event et la fonction de cycle compilee sont incompatibles\n");
+        return 1;
+    }
+    if (profile_path && compiled_step) {
+        fprintf(stderr, "--profile compte les portes de l'IR : incompatible avec la fonction de cycle compilee\n");
+        return 1;
+    }
+    if (profile_path && init_profile() != 0) {
+        fprintf(stderr, "Erreur d'allocation des compteurs de profilage\n");
+        return 1;
+    }
+    if (pc_histogram_path && init_pc_histogram() != 0) {
+        return 1;
+    }
+
+    if (event_mode) {
+        if (!fanout_start) {
+            fprintf(stderr, "Le mode evenementiel necessite une IR binaire (.irb) avec sa table de fanout\n");
+            return 1;
+        }
+        init_event_mode();
+    }
+
+    SDL_Window* window = NULL;
+    SDL_Renderer* renderer = NULL;
+    SDL_Texture* texture = NULL;
+    framebuffer = calloc(SCREEN_WIDTH * SCREEN_HEIGHT, sizeof(Uint32));
+    fb_pitch = SCREEN_WIDTH * 4;
+    init_video();
+    if (!headless) {
+        if (SDL_Init(SDL_INIT_VIDEO) != 0) {
+            printf("Erreur SDL_Init : %s\n", SDL_GetError());
+            return 1;
+        }
+
+        window = SDL_CreateWindow(
+            WINDOW_TITLE,
+            SDL_WINDOWPOS_CENTERED,
+            SDL_WINDOWPOS_CENTERED,
+            SCREEN_WIDTH, SCREEN_HEIGHT,
+            SDL_WINDOW_RESIZABLE
+        );
+
+        if (!window) {
+            printf("Erreur SDL_CreateWindow : %s\n", SDL_GetError());
+            SDL_Quit();
+            return 1;
+        }
+
+        renderer = SDL_CreateRenderer(window, -1, 0);
+        texture = SDL_CreateTexture(
+            renderer,
+            SDL_PIXELFORMAT_ARGB8888,
+            SDL_TEXTUREACCESS_STREAMING,
+            SCREEN_WIDTH, SCREEN_HEIGHT
+        );
+        SDL_UpdateTexture(texture, NULL, framebuffer, fb_pitch);
+    }
+    
+
+    build_jump_table();
+
+    fprintf(diag(), "Instructions lues : %d\n", instruction_count);
+
+    Uint32 start_time = headless ? 0 : SDL_GetTicks();
+    double run_start = wall_seconds();
+    int frames = 0;
+    int shown_frames = 0;
+    Uint32 poll_time = start_time, title_time = start_time;
+    long long title_cycles = 0;
+    int title_frames = 0, title_shown = 0;
 
     if (signal_count > 0) {
         int* signals = calloc(signal_count, sizeof(int));
@@ -298,193 +1132,136 @@ int main(int argc, char** argv) {
             fprintf(stderr, "Erreur d'allocation mémoire pour %d signaux.\n", signal_count);
             return 1;
         }
-        printf("Memoire pour %d signaux allouee avec succes.\n", signal_count);
+        fprintf(diag(), "Memoire pour %d signaux allouee avec succes.\n", signal_count);
         afficher_signaux("Entrees", inputs, input_count);
         afficher_signaux("Sorties", outputs, output_count);
 
         ram[0] = 1;
-        int j = 0;
+        long long j = 0;
 
-        while (ram[0] && j != STEP_LIMIT){
+        while (ram[0] && j != max_cycles){
 
-            for (int i = 0; i < input_count; i++) {
+            for (int i = 0; i < input_count && !headless; i++) {
                 printf("Entrez la valeur entiere de signal[%d] : ", inputs[i]);
+                int previous = signals[inputs[i]];
                 scanf("%d", &signals[inputs[i]]);
+                if (event_mode && signals[inputs[i]] != previous) {
+                    mark_fanout(inputs[i]);
+                }
             }
 
 
             
 
-            for (int i = 0; i < instruction_count;) {
-                Instruction* inst = &instructions[i];
-
-                if(inst->enabled_if>=0 && signals[inst->enabled_if]==0){
-                    i = jump_table[i];
-                    continue;
-                }
-
-                int mask = (1 << inst->size) - 1;
-
-                int a = signals[inst->input1];
-                int b = signals[inst->input2];
-                int c = signals[inst->input3];
-
-                switch (inst->type) {
-                    case GATE_AND:
-                        signals[inst->output] = (a & b) & mask;
-                        break;
-                    case GATE_OR:
-                        signals[inst->output] = (a | b) & mask;
-                        break;
-                    case GATE_XOR:
-                        signals[inst->output] = (a ^ b) & mask;
-                        break;
-                    case GATE_NAND:
-                        signals[inst->output] = ~(a & b) & mask;
-                        break;
-                    case GATE_NOR:
-                        signals[inst->output] = ~(a | b) & mask;
-                        break;
-                    case GATE_NXOR:
-                        signals[inst->output] = ~(a ^ b) & mask;
-                        break;
-                    case GATE_NOT:
-                        signals[inst->output] = ~a & mask;
-                        break;
-                    case GATE_CONST:
-                        signals[inst->output] = inst->const_value & mask;
-                        break;
-                    case GATE_MUX:
-                        signals[inst->output] = (a ? c : b) & mask;
-                        break;
-                    case GATE_CONCAT: {
-                        int size_b = inst->const_value;
-                        signals[inst->output] = (a << size_b) | b;
-                        break;
-                    }
-                    case GATE_INDEX: {
-                        int bit_index = inst->const_value;
-                        signals[inst->output] = (a >> bit_index) & 1;
-                        break;
-                    }
-                    case GATE_SUB: {
-                        int start = inst->const_value;
-                        int len = inst->size;
-                        signals[inst->output] = (a >> start) & ((1 << len) - 1);
-                        break;
-                    }
-                    case GATE_BUF:
-                        signals[inst->output] = a & mask;
-                        break;
-                    case GATE_STORE:
-                        ram[a] = b & mask;
-                        if(DEBUG || a==42)printf("\nRam[%d] got value %d", a, ram[a]);
-                        if(a>=VIDEO_RAM_START && a<VIDEO_RAM_START+VIDEO_RAM_SIZE){
-                            for(int t=0;t<16;t++){
-                                int bit = (b >> t) & 1;
-                                int color = 0xFFFFFF*bit;
-                                int pos = (a-VIDEO_RAM_START+1)*16-t-1;
-                                set_pixel(pos/(SCREEN_HEIGHT*8)*8+pos%8,pos%(SCREEN_HEIGHT*8)/8,color);
-                            }
-                        }
-                        break;
-                    case GATE_LOAD:
-                        signals[inst->output] = ram[a] & mask;
-                        if(DEBUG || a==42){printf("\nRead Ram[%d] and got value %d", a, ram[a]);}
-                        break;
-                    case GATE_ROM:
-                        signals[inst->output] = rom[a];
-                        break;
-                    default:
-                        // handle unknown gate type
-                        break;
+            int pc = pc_counts && pc_before_cycle ? signals[pc_signal] : 0;
+            if (profile_path) {
+                if (event_mode) {
+                    run_cycle_event_profiled(signals);
+                } else {
+                    run_cycle_scan_profiled(signals);
                 }
-                i++;
-            }    
+            } else if (event_mode) {
+                run_cycle_event(signals);
+            } else if (compiled_step) {
+                compiled_step(signals, ram, rom, store_ram);
+            } else {
+                run_cycle_scan(signals);
+            }
             
             j++;
+            if (pc_counts) {
+                pc_counts[(pc_before_cycle ? pc : signals[pc_signal]) & (ROM_SIZE - 1)]++;
+            }
             
 
-            if(output_count){printf("\nResultats des sorties :\n");}
-            for (int i = 0; i < output_count; i++) {
-                printf("signal[%d] = %d\n", outputs[i], signals[outputs[i]]);
+            if(output_count && !headless){
+                printf("\nResultats des sorties :\n");
+                for (int i = 0; i < output_count; i++) {
+                    printf("signal[%d] = %d\n", outputs[i], signals[outputs[i]]);
+                }
             }
 
-            if(ram[1]){
-                SDL_UnlockTexture(texture);
-                SDL_RenderClear(renderer);
-                SDL_RenderCopy(renderer, texture, NULL, NULL);
-                SDL_RenderPresent(renderer);
-                Uint32 end_time = SDL_GetTicks();
-                int elapsed = end_time - start_time;
-
-                if (elapsed < FRAME_TIME) {
-                    SDL_Delay(FRAME_TIME - elapsed);
+            if(ram[1] && headless){
+                frames++;
+                if (dump_dir) {
+                    refresh_framebuffer();
+                    if (dump_frame(frames) != 0) {
+                        return 1;
+                    }
                 }
-                start_time = SDL_GetTicks();
-                SDL_LockTexture(texture, NULL, &pixels, &fb_pitch);
                 ram[1] = 0;
-                while (SDL_PollEvent(&event)) {
-                    if (event.type == SDL_QUIT) {
-                        ram[0] = 0;
-                    }
-                    if (event.type == SDL_KEYDOWN) {
-                        switch (event.key.keysym.sym) {
-                            case SDLK_UP:
-                                ram[10] = 1;
-                                break;
-                            case SDLK_DOWN:
-                                ram[11] = 1;
-                                break;
-                            case SDLK_LEFT:
-                                ram[12] = 1;
-                                break;
-                            case SDLK_RIGHT:
-                                ram[13] = 1;
-                                break;
-                            case SDLK_SPACE:
-                                ram[14] = 1;
-                                break;
-                        }
+            } else if(ram[1]){
+                frames++;
+                ram[1] = 0;
+                bool shown = frame_shown(frames, start_time);
+                if (shown || dump_dir) {
+                    refresh_framebuffer();
+                }
+                if (dump_dir && dump_frame(frames) != 0) {
+                    dump_dir = NULL;  // on continue à jouer, sans captures
+                }
+                if (shown) {
+                    present_frame(renderer, texture);
+                    shown_frames++;
+                    int elapsed = SDL_GetTicks() - start_time;
+                    if (!turbo && elapsed < FRAME_TIME) {
+                        SDL_Delay(FRAME_TIME - elapsed);
                     }
-                    if (event.type == SDL_KEYUP) {
-                        switch (event.key.keysym.sym) {
-                            case SDLK_UP:
-                                ram[10] = 0;
-                                break;
-                            case SDLK_DOWN:
-                                ram[11] = 0;
-                                break;
-                            case SDLK_LEFT:
-                                ram[12] = 0;
-                                break;
-                            case SDLK_RIGHT:
-                                ram[13] = 0;
-                                break;
-                            case SDLK_SPACE:
-                                ram[14] = 0;
-                                break;
-                        }
+                    start_time = SDL_GetTicks();
+                    if (!turbo) {
+                        poll_events();
+                        poll_time = start_time;
                     }
                 }
             }
 
+            if (!headless && j % CLOCK_CHECK_CYCLES == 0) {
+                Uint32 now = SDL_GetTicks();
+                if (now - poll_time >= POLL_TIME) {
+                    poll_events();
+                    poll_time = now;
+                }
+                if (now - title_time >= TITLE_TIME) {
+                    update_title(window, j - title_cycles, frames - title_frames, shown_frames - title_shown,
+                                 (now - title_time) / 1000.0);
+                    title_time = now;
+                    title_cycles = j;
+                    title_frames = frames;
+                    title_shown = shown_frames;
+                }
+            }
+
         }
 
+        double run_time = wall_seconds() - run_start;
+        const char* mode = compiled_step ? "compile" : event_mode ? "evenementiel" : "balayage";
+        fprintf(diag(), "\nCycles : %lld, portes evaluees : %lld (%.1f par cycle), duree : %.0f ms (mode %s)\n",
+               j, gate_evals, j ? (double)gate_evals / j : 0.0, run_time * 1000, mode);
+
         free(signals);
-        SDL_UnlockTexture(texture);
-        SDL_RenderClear(renderer);
-        SDL_RenderCopy(renderer, texture, NULL, NULL);
-        SDL_RenderPresent(renderer);
+        if (profile_path && write_profile(j, mode) != 0) {
+            return 1;
+        }
+        if (pc_histogram_path && write_pc_histogram(j) != 0) {
+            return 1;
+        }
+        if (headless) {
+            free(framebuffer);
+            return write_summary(j, frames, run_time, mode);
+        }
+        refresh_framebuffer();
+        present_frame(renderer, texture);
 
         SDL_Delay(250);
 
         SDL_DestroyWindow(window);
         SDL_Quit();
+        free(framebuffer);
 
     } else {
-        printf("Aucune information sur les signaux trouvee.\n");
+        fprintf(diag(), "Aucune information sur les signaux trouvee.\n");
     }
 
     return 0;
 }
+#endif
@@ -0,0 +1,115 @@
+"""Lance le simulateur C depuis Python : avec fenêtre comme l'interface, ou
+sans fenêtre (--headless) pour les exécutions automatiques, dont on relit le
+résumé JSON (cycles, durée, cycles/s, somme de contrôle de la RAM, images).
+
+    python simulator_runner.py netlists/cpu.irb roms/snake.bin --max-cycles 1000000 [--dump-frames images/]
+"""
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# Exécutable compilé depuis simulator.c ; ORDI_SIMULATOR pour en choisir un autre
+DEFAULT_EXECUTABLE = os.environ.get("ORDI_SIMULATOR", "./simulateur.exe")
+RAM_SIZE = 65536
+
+
+@dataclass
+class SimulationSummary:
+    cycles: int
+    frames: int
+    halted: bool  # ram[0] remis à 0 par le programme (sinon limite de cycles atteinte)
+    wall_time: float  # secondes
+    cycles_per_second: float
+    gate_evals: int
+    ram_checksum: int
+    mode: str  # "balayage", "evenementiel" ou "compile"
+    frame_files: List[str] = field(default_factory=list)
+
+
+def ram_checksum(ram) -> int:
+    """FNV-1a 32 bits sur les mots de la RAM en little-endian, comme ram_checksum() de simulator.c."""
+    words = [int(value) & 0xFFFFFFFF for value in ram[:RAM_SIZE]]
+    words += [0] * (RAM_SIZE - len(words))
+    h = 2166136261
+    for byte in struct.pack(f"<{RAM_SIZE}I", *words):
+        h = ((h ^ byte) * 16777619) & 0xFFFFFFFF
+    return h
+
+
+def simulator_command(ir_path: str, rom_path: str, executable: str = DEFAULT_EXECUTABLE,
+                      step: Optional[str] = None, event: bool = False) -> List[str]:
+    command = [executable, ir_path, rom_path]
+    if step:
+        command += ["--step", step]
+    if event:
+        command.append("--event")
+    return command
+
+
+def run_simulator(ir_path: str, rom_path: str, executable: str = DEFAULT_EXECUTABLE,
+                  step: Optional[str] = None, event: bool = False, turbo: bool = False,
+                  frame_skip: Optional[int] = None) -> None:
+    # Avec fenêtre, jusqu'à ce qu'on la ferme ; turbo : sans limite d'images/s
+    # (Tab bascule pendant l'exécution), frame_skip : afficher une image sur n
+    command = simulator_command(ir_path, rom_path, executable, step, event)
+    if turbo:
+        command.append("--turbo")
+    if frame_skip:
+        command += ["--frame-skip", str(frame_skip)]
+    subprocess.run(command, check=True)
+
+
+def run_headless(ir_path: str, rom_path: str, max_cycles: Optional[int] = None,
+                 dump_frames: Optional[str] = None, executable: str = DEFAULT_EXECUTABLE,
+                 step: Optional[str] = None, event: bool = False,
+                 timeout: Optional[float] = None, profile: Optional[str] = None,
+                 pc_histogram: Optional[str] = None) -> SimulationSummary:
+    # profile : fichier où écrire les compteurs par porte (voir profiler.py) ;
+    # pc_histogram : exécutions de chaque adresse de la ROM (program_profiler.py)
+    command = simulator_command(ir_path, rom_path, executable, step, event) + ["--headless"]
+    if max_cycles is not None:
+        command += ["--max-cycles", str(max_cycles)]
+    if dump_frames:
+        os.makedirs(dump_frames, exist_ok=True)
+        command += ["--dump-frames", dump_frames]
+    if profile:
+        command += ["--profile", profile]
+    if pc_histogram:
+        command += ["--pc-histogram", pc_histogram]
+    # Sans --summary, la sortie standard ne contient que le résumé JSON
+    result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"Échec du simulateur (code {result.returncode}) : "
+                           f"{(result.stderr or result.stdout).strip()[-500:]}")
+    summary = SimulationSummary(**json.loads(result.stdout))
+    if dump_frames:
+        summary.frame_files = [os.path.join(dump_frames, f"frame_{i:05d}.pbm") for i in range(1, summary.frames + 1)]
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Simulateur sans fenêtre")
+    parser.add_argument("ir", help="netlist compilée (.ir ou .irb)")
+    parser.add_argument("rom", help="programme (.bin ou .rom)")
+    parser.add_argument("--max-cycles", type=int, help="arrêter après ce nombre de cycles")
+    parser.add_argument("--dump-frames", metavar="DOSSIER", help="écrire chaque image en PBM")
+    parser.add_argument("--step", metavar="SO", help="fonction de cycle compilée (--step du simulateur)")
+    parser.add_argument("--event", action="store_true", help="mode événementiel")
+    parser.add_argument("--executable", default=DEFAULT_EXECUTABLE)
+    args = parser.parse_args()
+
+    summary = run_headless(args.ir, args.rom, args.max_cycles, args.dump_frames, args.executable,
+                           args.step, args.event)
+    status = "arrêté (ram[0] = 0)" if summary.halted else "limite atteinte"
+    print(f"{summary.cycles} cycles, {summary.frames} images, {status}, {summary.wall_time:.3f} s "
+          f"({summary.cycles_per_second:.0f} cycles/s, mode {summary.mode}), RAM {summary.ram_checksum:08x}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())